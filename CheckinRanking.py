@@ -1,8 +1,8 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
 import os
-import japanize_matplotlib
+import booking_cache
+import render_farm
 
 # --- 設定項目 ---
 # ----------------------------------------------------------------------
@@ -22,10 +22,10 @@ END_DATE = '2026-01-31'
 # ----------------------------------------------------------------------
 
 
-def create_checkin_ranking_graph():
+def create_checkin_ranking_graph(plot=True):
     """
     Excelデータから指定期間内のチェックイン回数ランキングを算出し、
-    棒グラフとして保存する。
+    棒グラフとして保存する。(plot=False の場合はランキングの表示だけを行う)
     """
     # --- 1. ファイルパスの準備 ---
     excel_file_path = os.path.join(EXCEL_DATA_FOLDER, EXCEL_FILE_NAME)
@@ -37,7 +37,8 @@ def create_checkin_ranking_graph():
     # --- 2. Excelデータの読み込み ---
     try:
         print(f"STEP 1: '{excel_file_path}' を読み込みます...")
-        df = pd.read_excel(excel_file_path)
+        # 読み込んだ結果は booking_cache に保存され、Excelファイルが変わらない限り2回目以降はExcelを開かない
+        df = booking_cache.read_workbook(excel_file_path)
     except FileNotFoundError:
         print(f"エラー: ファイル '{excel_file_path}' が見つかりません。")
         return
@@ -46,8 +47,7 @@ def create_checkin_ranking_graph():
         return
 
     # --- 3. データの前処理とフィルタリング ---
-    # CheckInTime列をdatetime型に変換（エラーは無視）
-    df['CheckInTime'] = pd.to_datetime(df['CheckInTime'], errors='coerce')
+    # CheckInTime列は booking_cache でdatetime型に変換済み（変換できない値は NaT）
     # 日付変換でエラーになった行（NaT）を削除
     df.dropna(subset=['CheckInTime'], inplace=True)
 
@@ -74,9 +74,12 @@ def create_checkin_ranking_graph():
 
     print("チェックイン回数ランキング:")
     print(checkin_counts)
+    if not plot:
+        return
 
     # --- 5. グラフの描画 ---
     print(f"STEP 3: グラフを描画して '{output_image_path}' に保存します...")
+    plt, sns = render_farm.load_plotting()
     plt.style.use('seaborn-v0_8-talk')  # グラフのスタイルを指定
     fig, ax = plt.subplots(figsize=(12, 8))
 
@@ -104,4 +107,7 @@ def create_checkin_ranking_graph():
 
 
 if __name__ == '__main__':
-    create_checkin_ranking_graph()
+    parser = argparse.ArgumentParser(description='NFC のチェックイン回数ランキングの集計とグラフ作成')
+    parser.add_argument('--no-plot', action='store_true',
+                        help='グラフを作成せず、ランキングの表示だけを行う')
+    create_checkin_ranking_graph(plot=not parser.parse_args().no_plot)
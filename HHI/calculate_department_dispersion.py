@@ -1,10 +1,13 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import japanize_matplotlib
+import argparse
 import os
+import sys
 import logging
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dimensions
+import render_farm
+import run_report
+
 # --- 設定項目 (変更可能) ---
 # ----------------------------------------------------------------------
 # (HHIフォルダと同じ階層にある入力ファイル)
@@ -46,9 +49,9 @@ def calculate_dispersion_index(df, freq='D'):
 
     # 1. 期間ごと・部門ごと・場所ごとの「のべ滞在回数」をカウント
     # (★ tag_name を groupby から除外するのがキモ)
-    stay_counts = df.groupby(
-        ['date_group', 'department', 'place_name']
-    ).size()
+    stay_counts = dimensions.group_size(
+        df, ['date_group', 'department', 'place_name']
+    )
     stay_counts.name = 'stay_counts'
 
     # 2. 期間ごと・部門ごとの「総滞在回数」を計算
@@ -86,6 +89,7 @@ def plot_line_graph(df, output_path):
     部門分散指数の時系列折れ線グラフを保存する
     (2部門を1つのグラフで比較)
     """
+    plt, sns = render_farm.load_plotting()
     logging.info(f"折れ線グラフを作成中... -> {output_path}")
     plt.figure(figsize=(16, 6))  # 1段なので縦は短め
 
@@ -115,6 +119,7 @@ def plot_heatmap(df, output_path):
     """
     部門分散指数のヒートマップを保存する
     """
+    plt, sns = render_farm.load_plotting()
     logging.info(f"ヒートマップを作成中... -> {output_path}")
 
     # データをヒートマップ用にピボット (行が部門、列が日付)
@@ -153,17 +158,21 @@ def plot_heatmap(df, output_path):
     logging.info("ヒートマップを保存しました。")
 
 
-def main():
+def main(plot=True):
     # --- 1. 入力CSVの読み込み ---
+    run_report.step('1. 入力CSVの読み込み')
     try:
         logging.info(f"入力ファイルを読み込みます: {input_file_path}")
-        df = pd.read_csv(input_file_path, parse_dates=['datetime'])
+        # 部門・人・場所は登録簿のコードを持つカテゴリ型で読み込む (グループ化を整数で行うため)
+        df = dimensions.read_enriched_csv(input_file_path, parse_dates=['datetime'])
     except FileNotFoundError:
         logging.error(f"エラー: 入力ファイル '{input_file_path}' が見つかりません。")
-        return
+        return False
     except Exception as e:
         logging.error(f"ファイル読み込み中にエラーが発生しました: {e}")
-        return
+        return False
+
+    run_report.set_rows(rows_out=len(df))
 
     if df.empty:
         logging.warning("入力ファイルが空です。処理を終了します。")
@@ -179,22 +188,38 @@ def main():
     logging.info(f"絞り込み後のデータ件数: {len(df_filtered)} 件")
 
     # --- 2. 部門分散指数の計算 ---
+    run_report.step('2. 部門分散指数の計算', rows_in=len(df_filtered))
     df_index = calculate_dispersion_index(df_filtered, freq=TIME_FREQ)
+    run_report.set_rows(rows_out=len(df_index))
 
     if df_index.empty:
         logging.warning("指数計算後のデータが空です。処理を終了します。")
         return
 
     # --- 3. データ出力 ---
+    run_report.step('3. データ出力', rows_in=len(df_index))
     df_index.to_csv(output_data_path, index=False, encoding='utf-8-sig')
     logging.info(f"計算結果を '{output_data_path}' に保存しました。")
+    if not plot:
+        logging.info("グラフは作成せずに終了します。(--no-plot)")
+        return
 
     # --- 4. グラフ可視化 ---
-    plot_line_graph(df_index, output_graph_path)
-    plot_heatmap(df_index, output_heatmap_path)
+    # (描画は render_farm で並列に行い、表と設定が前回と同じグラフは描画しない)
+    run_report.step('4. グラフ可視化', rows_in=len(df_index))
+    render_farm.render_all([
+        render_farm.render_job(output_graph_path, plot_line_graph, df_index, output_graph_path),
+        render_farm.render_job(output_heatmap_path, plot_heatmap, df_index, output_heatmap_path),
+    ])
 
     logging.info("すべての処理が完了しました。")
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='部門分散指数の算出とグラフ作成')
+    parser.add_argument('--no-plot', action='store_true',
+                        help=f"グラフを作成せず、計算結果 ({OUTPUT_DATA_FILE}) だけを出力する")
+    args = parser.parse_args()
+    with run_report.run('hhi_department_dispersion'):
+        if main(plot=not args.no_plot) is False:
+            sys.exit(1)
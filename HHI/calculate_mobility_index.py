@@ -1,10 +1,14 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import japanize_matplotlib
+import argparse
 import os
+import sys
 import logging
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dimensions
+import render_farm
+import run_report
+
 # --- 設定項目 (変更可能) ---
 # ----------------------------------------------------------------------
 # (HHIフォルダと同じ階層にある入力ファイル)
@@ -46,9 +50,9 @@ def calculate_mobility_index(df, freq='D'):
     df['date_group'] = df['datetime'].dt.to_period(freq)
 
     # 1. 期間ごと・人ごと・場所ごとの滞在回数をカウント (★ department を追加)
-    stay_counts = df.groupby(
-        ['date_group', 'department', 'tag_name', 'place_name']
-    ).size()
+    stay_counts = dimensions.group_size(
+        df, ['date_group', 'department', 'tag_name', 'place_name']
+    )
     stay_counts.name = 'stay_counts'
 
     # 2. 期間ごと・人ごとの総滞在回数を計算 (★ department を追加)
@@ -83,6 +87,7 @@ def plot_line_graph(df, output_path):
     """
     【★変更】移動指数の時系列折れ線グラフを部門別(上下2段)で保存する
     """
+    plt, sns = render_farm.load_plotting()
     logging.info(f"折れ線グラフ（部門別）を作成中... -> {output_path}")
 
     # 上下2段のグラフ領域を作成 (X軸を共有)
@@ -135,6 +140,7 @@ def plot_heatmap(df, output_path):
     """
     【★変更】移動指数のヒートマップを部門別(上下2段)で保存する
     """
+    plt, sns = render_farm.load_plotting()
     logging.info(f"ヒートマップ（部門別）を作成中... -> {output_path}")
 
     # データをピボット (日付を列に、部門と名前を行にする)
@@ -224,17 +230,21 @@ def plot_heatmap(df, output_path):
     logging.info("ヒートマップ（部門別）を保存しました。")
 
 
-def main():
+def main(plot=True):
     # --- 1. 入力CSVの読み込み ---
+    run_report.step('1. 入力CSVの読み込み')
     try:
         logging.info(f"入力ファイルを読み込みます: {input_file_path}")
-        df = pd.read_csv(input_file_path, parse_dates=['datetime'])
+        # 部門・人・場所は登録簿のコードを持つカテゴリ型で読み込む (グループ化を整数で行うため)
+        df = dimensions.read_enriched_csv(input_file_path, parse_dates=['datetime'])
     except FileNotFoundError:
         logging.error(f"エラー: 入力ファイル '{input_file_path}' が見つかりません。")
-        return
+        return False
     except Exception as e:
         logging.error(f"ファイル読み込み中にエラーが発生しました: {e}")
-        return
+        return False
+
+    run_report.set_rows(rows_out=len(df))
 
     if df.empty:
         logging.warning("入力ファイルが空です。処理を終了します。")
@@ -251,7 +261,9 @@ def main():
 
     # --- 2. HHIと移動指数の計算 ---
     # (★ department 列が引き継がれるように calculate_mobility_index を修正済)
+    run_report.step('2. HHIと移動指数の計算', rows_in=len(df_filtered))
     df_index = calculate_mobility_index(df_filtered, freq=TIME_FREQ)
+    run_report.set_rows(rows_out=len(df_index))
 
     if df_index.empty:
         logging.warning("指数計算後のデータが空です。処理を終了します。")
@@ -263,22 +275,36 @@ def main():
     else:
         df_plot = df_index.copy()
 
-    if df_plot.empty:
+    if plot and df_plot.empty:
         logging.warning("グラフ化対象のデータが見つかりませんでした。")
         return
 
     # --- 4. データ出力 ---
     # (★ department 列がCSVに含まれます)
+    run_report.step('4. データ出力', rows_in=len(df_index))
     df_index.to_csv(output_data_path, index=False, encoding='utf-8-sig')
     logging.info(f"計算結果を '{output_data_path}' に保存しました。")
+    if not plot:
+        logging.info("グラフは作成せずに終了します。(--no-plot)")
+        return
 
     # --- 5. グラフ可視化 ---
     # (★ グラフ関数は部門別描画に対応済)
-    plot_line_graph(df_plot, output_graph_path)
-    plot_heatmap(df_plot, output_heatmap_path)
+    # (描画は render_farm で並列に行い、表と設定が前回と同じグラフは描画しない)
+    run_report.step('5. グラフ可視化', rows_in=len(df_plot))
+    render_farm.render_all([
+        render_farm.render_job(output_graph_path, plot_line_graph, df_plot, output_graph_path),
+        render_farm.render_job(output_heatmap_path, plot_heatmap, df_plot, output_heatmap_path),
+    ])
 
     logging.info("すべての処理が完了しました。")
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='移動指数 (部門別) の算出とグラフ作成')
+    parser.add_argument('--no-plot', action='store_true',
+                        help=f"グラフを作成せず、計算結果 ({OUTPUT_DATA_FILE}) だけを出力する")
+    args = parser.parse_args()
+    with run_report.run('hhi_mobility_index'):
+        if main(plot=not args.no_plot) is False:
+            sys.exit(1)
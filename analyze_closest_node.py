@@ -1,17 +1,30 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
 import logging
-import japanize_matplotlib
+import closest_node
+import raw_store
+import render_farm
+import tag_schema
 
 # (設定項目は変更可能)
 # ----------------------------------------------------------------------
+# 生データの読み込み元 ('store': raw_store の指定期間, 'csv': INPUT_CSV_FILE)
+INPUT_SOURCE = 'store'
+# INPUT_SOURCE = 'store' の場合に読み込む期間 (YYYY-MM-DD。None の場合は保存済みの全期間)
+ANALYSIS_START_DATE = None
+ANALYSIS_END_DATE = None
+
 INPUT_CSV_FILE = 'processed_tag_data.csv'
 ANALYZED_CSV_FILE = 'closest_node_per_interval.csv'
 OUTPUT_IMAGE_FILE = 'tag_movement_graph.png'
 TIME_INTERVAL_MINUTES = 5
 AGGREGATION_METHOD = 'max'  # mean, max, sum から選択
 
+# 最寄りノードの計算に使うプロセス数 (1: 並列化しない, None: CPU のコア数)
+MAX_WORKERS = 1
+# 並列化する場合の生データの分け方 ('tag': tag_id ごと, 'time': 時間の範囲ごと)
+PARTITION_BY = 'tag'
+
 TAGS_TO_PLOT = None
 TAGS_TO_PLOT = [
     '0081f9860a22',
@@ -38,48 +51,45 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def main():
-    # ... (STEP 1のデータ読み込みと集計部分は変更なし) ...
-    try:
-        logging.info(f"STEP 1: '{INPUT_CSV_FILE}' を読み込んで解析を開始します...")
-        df = pd.read_csv(INPUT_CSV_FILE, parse_dates=['datetime'])
-    except FileNotFoundError:
-        logging.error(f"エラー: 入力ファイル '{INPUT_CSV_FILE}' が見つかりません。")
+def main(plot=True):
+    if INPUT_SOURCE == 'store' and raw_store.has_data():
+        logging.info("STEP 1: raw_store から生データを読み込んで解析を開始します...")
+        df = raw_store.read_raw_data(ANALYSIS_START_DATE, ANALYSIS_END_DATE, compact=True)
+    else:
+        try:
+            logging.info(f"STEP 1: '{INPUT_CSV_FILE}' を読み込んで解析を開始します...")
+            df = tag_schema.read_raw_csv(INPUT_CSV_FILE)
+        except FileNotFoundError:
+            logging.error(f"エラー: 入力ファイル '{INPUT_CSV_FILE}' が見つかりません。")
+            return
+    if df.empty:
+        logging.error("エラー: 解析する生データがありませんでした。(読み込む期間・ファイルを確認してください)")
         return
-
-    grouper = pd.Grouper(key='datetime', freq=f'{TIME_INTERVAL_MINUTES}T')
+    # 生データは compact 型のまま集計し、集計結果だけを元の表記に戻す
 
     if AGGREGATION_METHOD == 'max':
         logging.info("各時間間隔において、RSSI最大値を記録したnodeを抽出します。")
-        max_rssi_indices = df.groupby([grouper, 'tag_id'])['tag_rssi'].idxmax()
-        analyzed_df = df.loc[max_rssi_indices].sort_values(
-            by=['datetime', 'tag_id']).reset_index(drop=True)
     elif AGGREGATION_METHOD == 'mean':
         logging.info("各時間間隔において、平均RSSIが最も高いnodeを抽出します。")
-        mean_rssi_df = df.groupby(
-            [grouper, 'tag_id', 'node_id'])['tag_rssi'].mean().reset_index()
-        max_mean_indices = mean_rssi_df.groupby(
-            ['datetime', 'tag_id'])['tag_rssi'].idxmax()
-        analyzed_df = mean_rssi_df.loc[max_mean_indices].sort_values(
-            by=['datetime', 'tag_id']).reset_index(drop=True)
     elif AGGREGATION_METHOD == 'sum':
         logging.info("各時間間隔において、合計RSSIが最も高いnodeを抽出します。")
-        sum_rssi_df = df.groupby(
-            [grouper, 'tag_id', 'node_id'])['tag_rssi'].sum().reset_index()
-        max_sum_indices = sum_rssi_df.groupby(
-            ['datetime', 'tag_id'])['tag_rssi'].idxmax()
-        analyzed_df = sum_rssi_df.loc[max_sum_indices].sort_values(
-            by=['datetime', 'tag_id']).reset_index(drop=True)
-    else:
-        logging.error(
-            f"エラー: 不明な集計方法 '{AGGREGATION_METHOD}' です。'max', 'mean', 'sum'のいずれかを指定してください。")
+    try:
+        analyzed_df = closest_node.closest_node_per_interval_parallel(
+            df, TIME_INTERVAL_MINUTES, AGGREGATION_METHOD,
+            max_workers=MAX_WORKERS, partition_by=PARTITION_BY)
+    except ValueError as e:
+        logging.error(f"エラー: {e}")
         return
+    analyzed_df = tag_schema.from_compact(analyzed_df)
 
     analyzed_df.to_csv(ANALYZED_CSV_FILE, index=False, encoding='utf-8-sig')
     logging.info(f"解析結果を '{ANALYZED_CSV_FILE}' に保存しました。({len(analyzed_df)} 件)")
     if analyzed_df.empty:
         logging.warning("解析後のデータが0件でした。グラフ作成はスキップします。")
         return
+    if not plot:
+        logging.info("グラフは作成せずに終了します。(--no-plot)")
+        return
 
     logging.info(f"STEP 2: 解析結果をもとにグラフ作成を開始します...")
 
@@ -160,6 +170,8 @@ def main():
     logging.info(f"グラフ描画対象タグ: {df_plot['tag_name'].unique().tolist()}")
     # ▲▲▲ 変更ここまで ▲▲▲
 
+    # グラフのライブラリはここで初めて読み込む (集計だけの実行では読み込まない)
+    plt, sns = render_farm.load_plotting()
     plt.figure(figsize=(16, 8))
     # ▼▼▼ 変更箇所 ▼▼▼
     # hue (色分け) と style (線種) を 'tag_id' から 'tag_name' に変更
@@ -209,4 +221,7 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='5分ごとの最寄りノードの算出と移動履歴グラフの作成')
+    parser.add_argument('--no-plot', action='store_true',
+                        help=f"グラフを作成せず、解析結果 ({ANALYZED_CSV_FILE}) だけを出力する")
+    main(plot=not parser.parse_args().no_plot)
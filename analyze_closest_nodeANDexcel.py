@@ -1,14 +1,33 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
 import logging
-import japanize_matplotlib
+import glob
 import os
-import matplotlib.dates as mdates
+import sys
+import numpy as np
+import booking_cache
+import closest_node
+import dimensions
+import raw_store
+import render_farm
+import run_report
+import tag_schema
 
 # ----------------------------------------------------------------------
 # --- 基本設定 ---
 # ----------------------------------------------------------------------
+# 生データの読み込み元
+#   'store': get_dynamo_data.py が保存した raw_store (日付ごとの Parquet) から、指定期間だけを読み込む
+#   'csv'  : INPUT_DATA_FOLDER 内の INPUT_FILES_TO_CONCAT を読み込む (従来の方法)
+INPUT_SOURCE = 'store'
+# INPUT_SOURCE = 'store' の場合に読み込む期間 (YYYY-MM-DD。None の場合は保存済みの全期間)
+ANALYSIS_START_DATE = '2025-09-01'
+ANALYSIS_END_DATE = None
+# True の場合、生データを時刻順のチャンク (raw_store は1日ずつ、CSV は CSV_CHUNK_ROWS 行ずつ) で読み込み、
+# チャンクの境界の区間だけを持ち越しながら集計します (全期間を一度にメモリに読み込みません。結果は同じです)
+STREAMING_MODE = True
+CSV_CHUNK_ROWS = 1000000
+
 INPUT_DATA_FOLDER = 'input'
 INPUT_FILES_TO_CONCAT = [
     # 'processed_tag_data_Aug.csv',
@@ -23,6 +42,27 @@ OUTPUT_IMAGE_FILE = 'tag_movement_comparison_graph.png'
 TIME_INTERVAL_MINUTES = 5
 AGGREGATION_METHOD = 'max'  # mean, max, sum から選択
 
+# 最寄りノードの計算に使うプロセス数 (1: 並列化しない, None: CPU のコア数)
+MAX_WORKERS = 1
+# 並列化する場合の生データの分け方 ('tag': tag_id ごと, 'time': 時間の範囲ごと)
+# (STREAMING_MODE = True の場合は、常に読み込んだチャンク (時間の範囲) ごとに並列化します)
+PARTITION_BY = 'tag'
+
+# True の場合、生データから (1分, タグ, ノード) ごとのロールアップを作って ROLLUP_FILE に保存し、
+# TIME_INTERVAL_MINUTES の結果はロールアップから求めます (結果は同じです)。
+# 入力 (raw_store の part ファイルや CSV) が変わっていなければ生データを読み直さないため、
+# TIME_INTERVAL_MINUTES や AGGREGATION_METHOD を変えて再実行する場合に速くなります。
+# (TIME_INTERVAL_MINUTES は1分の倍数である必要があります。totalling.py の TIME_INTERVAL_MINUTES も合わせてください)
+USE_ROLLUP = True
+ROLLUP_FILE = 'closest_node_rollup.parquet'
+
+# True の場合、ANALYZED_CSV_FILE に保存済みの最後の区間以降 (最後の区間も含む) だけを生データから計算し、
+# 最後の区間の行を置き換えて追記します。毎日の更新でも、新しいデータの分だけの計算で済みます。
+# (USE_ROLLUP / STREAMING_MODE の設定にかかわらずチャンクごとに読み込みます。グラフは追記した期間だけを描画します。
+#  TIME_INTERVAL_MINUTES が1日を割り切れない場合や、ANALYZED_CSV_FILE がない場合は全期間を計算します。
+#  TIME_INTERVAL_MINUTES や AGGREGATION_METHOD、名前の CSV を変えた場合は False にして作り直してください)
+INCREMENTAL_MODE = False
+
 # --- グラフ化対象タグ ---
 TAGS_TO_PLOT = [
     # '0081f986054d',
@@ -53,6 +93,11 @@ TAG_NAME_CSV_FILE = 'tag_names.csv'
 EXCEL_DATA_FOLDER = 'data'
 EXCEL_FILE_NAME = '辻アプリ_20260203.xlsx'
 EXCEL_FILE_PATH = os.path.join(EXCEL_DATA_FOLDER, EXCEL_FILE_NAME)
+# EXCEL_DATA_FOLDER 内でこのパターンに一致するExcelファイルをすべて読み込み、1つの予約データにまとめます (重複した予約は1件にします)
+# None の場合は EXCEL_FILE_PATH だけを読み込みます (例: '辻アプリ_*.xlsx')
+EXCEL_FILE_PATTERN = None
+# True の場合、予約を TIME_INTERVAL_MINUTES ごとの行に展開せず、予約1件を1本の線 (チェックイン〜チェックアウト) として描画します
+EXCEL_AS_INTERVALS = False
 
 # --- 下のグラフ(Excel)のY軸設定 ---
 # EXCEL_Y_AXIS = 'SeatNumber'
@@ -74,71 +119,125 @@ def clean_id_column(df, col_name):
     if col_name not in df.columns:
         return df
 
-    # 1. 文字列に変換
-    df[col_name] = df[col_name].astype(str)
-    # 2. "697.0" のような浮動小数点表記を "697" に戻す
-    df[col_name] = df[col_name].apply(
-        lambda x: x.split('.')[0] if '.' in x else x)
-    # 3. 前後の空白削除
-    df[col_name] = df[col_name].str.strip()
+    # 文字列に変換し、"697.0" のような浮動小数点表記を "697" に戻して前後の空白を削除する
+    # (ユニークな値だけを変換して全体に展開する)
+    df[col_name] = dimensions.normalize_id_column(df[col_name].to_numpy())
     return df
 
 
-def process_excel_data(file_path, interval_minutes):
-    """Excelの滞在時間データを読み込み、グラフ描画用に変換する"""
+EXCEL_TEXT_COLUMNS = booking_cache.TEXT_COLUMNS
+
+
+def excel_file_paths():
+    """比較用Excelファイルのパスのリストを返す (EXCEL_FILE_PATTERN を指定した場合はファイル名の順)"""
+    if EXCEL_FILE_PATTERN:
+        return sorted(glob.glob(os.path.join(EXCEL_DATA_FOLDER, EXCEL_FILE_PATTERN)))
+    return [EXCEL_FILE_PATH]
+
+
+def load_excel_intervals(file_paths):
+    """
+    Excelの滞在時間データを読み込み、予約1件を1行 (CheckInTime 〜 CheckOutTime の区間) として返す。
+    User / SeatNumber / Area は文字列にする。読み込めない場合は None を返す。
+    (読み込んだ結果は booking_cache に保存され、Excelファイルが変わらない限り2回目以降はExcelを開かない)
+    """
+    if not file_paths:
+        logging.error(f"エラー: '{EXCEL_DATA_FOLDER}' に '{EXCEL_FILE_PATTERN}' に一致する比較用Excelファイルがありません。")
+        return None
     try:
-        logging.info(f"STEP 3: 比較用Excelファイル '{file_path}' を読み込みます...")
-        df_excel_raw = pd.read_excel(file_path)
-    except FileNotFoundError:
-        logging.error(f"エラー: 比較用Excelファイル '{file_path}' が見つかりません。")
+        logging.info(f"STEP 3: 比較用Excelファイル {', '.join(repr(p) for p in file_paths)} を読み込みます...")
+        df_excel_raw = booking_cache.read_bookings(file_paths)
+    except FileNotFoundError as e:
+        logging.error(f"エラー: 比較用Excelファイル '{e.filename}' が見つかりません。")
+        return None
+    except ValueError as e:
+        # 必要な列がない場合など
+        logging.warning(f"Excelファイルを比較に使えません: {e}")
         return None
     except Exception as e:
         logging.error(f"Excelファイルの読み込み中にエラーが発生しました: {e}")
         return None
 
-    df_excel_raw['CheckInTime'] = pd.to_datetime(
-        df_excel_raw['CheckInTime'], errors='coerce')
-    df_excel_raw['CheckOutTime'] = pd.to_datetime(
-        df_excel_raw['CheckOutTime'], errors='coerce')
     df_excel_raw = df_excel_raw.dropna(subset=['CheckInTime', 'CheckOutTime'])
 
-    resampled_data = []
-    freq_str = f'{interval_minutes}min'
+    intervals = df_excel_raw[['CheckInTime', 'CheckOutTime']].reset_index(drop=True)
+    for col in EXCEL_TEXT_COLUMNS:
+        intervals[col] = [str(v) for v in df_excel_raw[col]]
+    return intervals
 
-    for _, row in df_excel_raw.iterrows():
-        try:
-            time_range = pd.date_range(
-                start=row['CheckInTime'],
-                end=row['CheckOutTime'],
-                freq=freq_str
-            )
-            if not time_range.empty:
-                temp_df = pd.DataFrame(time_range, columns=['datetime'])
-                temp_df['User'] = str(row['User'])
-                temp_df['SeatNumber'] = str(row['SeatNumber'])
-                temp_df['Area'] = str(row['Area'])
-                resampled_data.append(temp_df)
-        except Exception as e:
-            continue
 
-    if not resampled_data:
+def expand_excel_intervals(intervals, interval_minutes):
+    """
+    予約の区間を、CheckInTime から interval_minutes ごとの時刻 (CheckOutTime 以下) の行に展開する。
+    (予約ごとの pd.date_range と同じ時刻を、予約ごとの件数の repeat とオフセットの計算でまとめて求める)
+    """
+    check_in = intervals['CheckInTime'].to_numpy()
+    check_out = intervals['CheckOutTime'].to_numpy()
+    step = np.timedelta64(interval_minutes, 'm').astype(check_in.dtype.str.replace('M8', 'm8'))
+    # 予約ごとの時刻の数 (CheckOutTime が CheckInTime より前の予約は0件)
+    counts = np.where(check_out >= check_in, (check_out - check_in) // step + 1, 0)
+
+    rows = np.repeat(np.arange(len(intervals)), counts)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    df_excel_plot = pd.DataFrame({'datetime': check_in[rows] + offsets * step})
+    for col in EXCEL_TEXT_COLUMNS:
+        df_excel_plot[col] = intervals[col].to_numpy()[rows]
+    return df_excel_plot
+
+
+def process_excel_data(file_paths, interval_minutes):
+    """
+    Excelの滞在時間データを読み込み、グラフ描画用に変換する
+    EXCEL_AS_INTERVALS = True の場合は展開せず、予約1件を1行 (CheckInTime 〜 CheckOutTime) のまま返す
+    """
+    intervals = load_excel_intervals(file_paths)
+    if intervals is None:
+        return None
+
+    if EXCEL_AS_INTERVALS:
+        if intervals.empty:
+            logging.warning("Excelファイルから描画対象となるデータが抽出できませんでした。")
+            return None
+        logging.info(f"Excelデータを予約の区間のまま読み込みました。({len(intervals)} 件)")
+        return intervals
+
+    df_excel_plot = expand_excel_intervals(intervals, interval_minutes)
+    if df_excel_plot.empty:
         logging.warning("Excelファイルから描画対象となるデータが抽出できませんでした。")
         return None
 
-    df_excel_plot = pd.concat(resampled_data, ignore_index=True)
     logging.info(f"Excelデータをグラフ描画用に変換しました。({len(df_excel_plot)} 件)")
     return df_excel_plot
 
 
-def main():
-    # --- STEP 1: CSVファイルの読み込みと解析 ---
+def load_raw_data():
+    """
+    INPUT_SOURCE の設定に従って生データを読み込みます。
+    'store' で保存済みのデータがない場合は、INPUT_FILES_TO_CONCAT のCSVを読み込みます。
+    どちらの場合も tag_schema の compact 型で返します。
+    """
+    if INPUT_SOURCE == 'store':
+        if raw_store.has_data():
+            logging.info(
+                f"STEP 1: raw_store から {ANALYSIS_START_DATE or '最初'} 〜 {ANALYSIS_END_DATE or '最後'} のデータを読み込んで解析を開始します...")
+            df = raw_store.read_raw_data(ANALYSIS_START_DATE, ANALYSIS_END_DATE, compact=True)
+            if df.empty:
+                logging.error("エラー: 指定期間のデータが raw_store にありませんでした。")
+                return None
+            logging.info(f"   ... {len(df)} 件を読み込みました。")
+            run_report.set_rows(rows_in=len(df))
+            return df
+        logging.warning(
+            "raw_store にデータがないため、INPUT_FILES_TO_CONCAT のCSVを読み込みます。"
+            "(python raw_store.py import <CSV> で取り込めます)")
+
     logging.info(f"STEP 1: '{INPUT_DATA_FOLDER}' フォルダから複数CSVを読み込んで解析を開始します...")
 
     df_list = []
     for file_name in INPUT_FILES_TO_CONCAT:
         file_path = os.path.join(INPUT_DATA_FOLDER, file_name)
         try:
-            df_temp = pd.read_csv(file_path, parse_dates=['datetime'])
+            df_temp = tag_schema.read_raw_csv(file_path)
             df_list.append(df_temp)
             logging.info(f"   ... '{file_path}' を読み込みました。")
         except FileNotFoundError:
@@ -148,39 +247,94 @@ def main():
 
     if not df_list:
         logging.error("エラー: 読み込み可能なCSVデータがありませんでした。")
-        return
+        return None
 
     df = pd.concat(df_list, ignore_index=True)
+    run_report.set_rows(rows_in=len(df))
+    return df
+
+
+def iter_raw_chunks(start=None):
+    """
+    load_raw_data と同じ生データを、時刻順のチャンク (compact 型) に分けて順に返すジェネレータです。
+    raw_store からは1日ずつ、CSV からは CSV_CHUNK_ROWS 行ずつ読み込みます。
+    start (Timestamp) を指定すると、その時刻以降のデータだけを返します。
+    """
+    if INPUT_SOURCE == 'store':
+        if raw_store.has_data():
+            if start is not None and (ANALYSIS_START_DATE is None or start > pd.Timestamp(ANALYSIS_START_DATE)):
+                read_start = start
+            else:
+                read_start = ANALYSIS_START_DATE
+            logging.info(
+                f"STEP 1: raw_store から {read_start or '最初'} 〜 {ANALYSIS_END_DATE or '最後'} のデータを1日ずつ読み込んで解析を開始します...")
+            for chunk in raw_store.iter_raw_partitions(read_start, ANALYSIS_END_DATE, compact=True):
+                run_report.set_rows(rows_in=len(chunk))
+                yield chunk
+            return
+        logging.warning(
+            "raw_store にデータがないため、INPUT_FILES_TO_CONCAT のCSVを読み込みます。"
+            "(python raw_store.py import <CSV> で取り込めます)")
+
+    logging.info(f"STEP 1: '{INPUT_DATA_FOLDER}' フォルダから複数CSVを順に読み込んで解析を開始します...")
+    if start is not None:
+        start_ms = tag_schema.datetime_to_epoch_ms(pd.Series([start]))[0]
+
+    for file_name in INPUT_FILES_TO_CONCAT:
+        file_path = os.path.join(INPUT_DATA_FOLDER, file_name)
+        try:
+            for chunk in tag_schema.iter_raw_csv(file_path, chunk_rows=CSV_CHUNK_ROWS):
+                if start is not None:
+                    chunk = chunk[chunk['datetime'] >= start_ms]
+                    if chunk.empty:
+                        continue
+                    chunk = chunk.reset_index(drop=True)
+                run_report.set_rows(rows_in=len(chunk))
+                yield chunk
+            logging.info(f"   ... '{file_path}' を読み込みました。")
+        except FileNotFoundError:
+            logging.warning(f"警告: ファイル '{file_path}' が見つかりません。スキップします。")
+        except Exception as e:
+            logging.warning(f"ファイル '{file_path}' の読み込み中にエラーが発生しました: {e}")
+
 
-    grouper = pd.Grouper(key='datetime', freq=f'{TIME_INTERVAL_MINUTES}min')
-    df['tag_rssi'] = pd.to_numeric(df['tag_rssi'], errors='coerce')
-
-    if AGGREGATION_METHOD == 'max':
-        max_rssi_indices = df.groupby([grouper, 'tag_id'])['tag_rssi'].idxmax()
-        analyzed_df = df.loc[max_rssi_indices]
-    elif AGGREGATION_METHOD == 'mean':
-        mean_rssi_df = df.groupby([grouper, 'tag_id', 'node_id'])[
-            'tag_rssi'].mean().reset_index()
-        max_mean_indices = mean_rssi_df.groupby(['datetime', 'tag_id'])[
-            'tag_rssi'].idxmax()
-        analyzed_df = mean_rssi_df.loc[max_mean_indices]
+def rollup_signature():
+    """ロールアップの作成に使う入力 (読み込み元・期間と、各ファイルのサイズ・更新時刻) を返します。"""
+    if INPUT_SOURCE == 'store' and raw_store.has_data():
+        paths = raw_store.list_partition_files(ANALYSIS_START_DATE, ANALYSIS_END_DATE)
+        source = ['store', ANALYSIS_START_DATE, ANALYSIS_END_DATE]
     else:
-        sum_rssi_df = df.groupby([grouper, 'tag_id', 'node_id'])[
-            'tag_rssi'].sum().reset_index()
-        max_sum_indices = sum_rssi_df.groupby(['datetime', 'tag_id'])[
-            'tag_rssi'].idxmax()
-        analyzed_df = sum_rssi_df.loc[max_sum_indices]
+        paths = [os.path.join(INPUT_DATA_FOLDER, name) for name in INPUT_FILES_TO_CONCAT]
+        source = ['csv']
+    return [source] + closest_node.input_signature(paths)
 
-    analyzed_df = analyzed_df.sort_values(
-        by=['datetime', 'tag_id']).reset_index(drop=True)
 
-    # --- STEP 2: 解析結果に名前情報とフロア情報を追加 ---
-    logging.info("STEP 2: 解析結果に名前情報(Floor等含む)を追加します...")
+def load_or_build_rollup():
+    """
+    保存済みのロールアップ (ROLLUP_FILE) を読み込みます。
+    ない場合や入力が変わっている場合は、生データをチャンクごとに読み込んで作り直して保存します。
+    """
+    signature = rollup_signature()
+    rollup = closest_node.load_rollup(ROLLUP_FILE, signature)
+    if rollup is not None:
+        logging.info(f"STEP 1: 保存済みのロールアップ '{ROLLUP_FILE}' を使います。({len(rollup)} 件)")
+        return rollup
+
+    rollup = closest_node.build_rollup(iter_raw_chunks())
+    if not rollup.empty:
+        closest_node.save_rollup(rollup, ROLLUP_FILE, signature)
+        logging.info(f"   ... 1分ごとのロールアップを '{ROLLUP_FILE}' に保存しました。({len(rollup)} 件)")
+    return rollup
+
 
-    analyzed_df = clean_id_column(analyzed_df, 'node_id')
-    analyzed_df = clean_id_column(analyzed_df, 'tag_id')
+def add_name_info(analyzed_df):
+    """
+    解析結果に名前情報 (node_names.csv の場所名・フロア等、tag_names.csv のタグ名・所属) を追加し、
+    所属なしのデータを削除します。戻り値は (追加後の DataFrame, node_names の DataFrame (読み込めなかった場合は None)) です。
+    """
+    logging.info("STEP 2: 解析結果に名前情報(Floor等含む)を追加します...")
 
-    # 1. Node Names のマージ
+    # 1. Node Names の付与 (node_id の正規化と、表の行番号による属性の付与を dimensions で行う)
     node_names_df = None
     try:
         node_names_df = pd.read_csv(NODE_NAME_CSV_FILE, index_col=False)
@@ -196,22 +350,21 @@ def main():
             node_names_df['west_to_east'] = pd.to_numeric(
                 node_names_df['west_to_east'], errors='coerce')
 
-        analyzed_df = pd.merge(analyzed_df, node_names_df,
-                               on='node_id', how='left')
+        analyzed_df = dimensions.attach_attributes(analyzed_df, 'node_id', node_names_df)
         analyzed_df['place_name'] = analyzed_df['place_name'].fillna(
             analyzed_df['node_id'])
 
     except FileNotFoundError:
         logging.warning(f"'{NODE_NAME_CSV_FILE}' が見つかりません。")
+        analyzed_df = clean_id_column(analyzed_df, 'node_id')
         analyzed_df['place_name'] = analyzed_df['node_id']
 
-    # 2. Tag Names のマージ
+    # 2. Tag Names の付与
     try:
         tag_names_df = pd.read_csv(TAG_NAME_CSV_FILE)
         tag_names_df = clean_id_column(tag_names_df, 'tag_id')
 
-        analyzed_df = pd.merge(analyzed_df, tag_names_df,
-                               on='tag_id', how='left')
+        analyzed_df = dimensions.attach_attributes(analyzed_df, 'tag_id', tag_names_df)
 
         # 名前だけ埋めておく（グラフの凡例用）
         analyzed_df['tag_name'] = analyzed_df['tag_name'].fillna(
@@ -229,18 +382,187 @@ def main():
     except FileNotFoundError:
         logging.warning(
             f"'{TAG_NAME_CSV_FILE}' が見つかりません。所属情報がないため全データをスキップします。")
+        analyzed_df = clean_id_column(analyzed_df, 'tag_id')
         analyzed_df = analyzed_df.iloc[0:0]  # 空にする
 
+    return analyzed_df, node_names_df
+
+
+def _iter_lines_backward(path, block_size=1024 * 1024):
+    """ファイルの各行を (行の先頭のバイト位置, 行の内容) として末尾から順に返すジェネレータです。"""
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        rest = b''
+        while pos > 0:
+            size = min(block_size, pos)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + rest).split(b'\n')
+            # 先頭の行は前のブロックに続いている可能性があるため、次のブロックと合わせて処理する
+            rest = lines[0]
+            offset = pos + len(rest) + 1 + sum(len(line) + 1 for line in lines[1:])
+            for line in reversed(lines[1:]):
+                offset -= len(line) + 1
+                yield offset, line
+        yield 0, rest
+
+
+def _line_datetime(line):
+    """解析結果の CSV の1行から、先頭の datetime 列を読み取ります。(読み取れない場合は None)"""
+    try:
+        value = pd.Timestamp(line.split(b',', 1)[0].decode('utf-8-sig').strip())
+    except ValueError:
+        return None
+    return None if pd.isna(value) else value
+
+
+def incremental_boundary():
+    """
+    INCREMENTAL_MODE で再計算を始める区間 (保存済みの最後の区間) の開始時刻を返します。
+    保存済みの解析結果がない場合や、追記できない設定の場合は None (全期間を計算する) を返します。
+    """
+    if not os.path.exists(ANALYZED_CSV_FILE):
+        logging.info(f"'{ANALYZED_CSV_FILE}' がないため、全期間を解析します。")
+        return None
+    if (24 * 60) % TIME_INTERVAL_MINUTES != 0:
+        logging.warning(
+            f"TIME_INTERVAL_MINUTES ({TIME_INTERVAL_MINUTES} 分) が1日を割り切れないため、追記できません。全期間を解析します。")
+        return None
+
+    for offset, line in _iter_lines_backward(ANALYZED_CSV_FILE):
+        if offset == 0:
+            break
+        last_datetime = _line_datetime(line)
+        if last_datetime is not None:
+            # 区間は日付の 0:00 を起点とするため、1日を割り切る間隔なら floor で区間の開始時刻が求まる
+            boundary = last_datetime.floor(f'{TIME_INTERVAL_MINUTES}min')
+            logging.info(f"'{ANALYZED_CSV_FILE}' の最後の区間 ({boundary}) 以降だけを解析して追記します。")
+            return boundary
+    logging.info(f"'{ANALYZED_CSV_FILE}' にデータがないため、全期間を解析します。")
+    return None
+
+
+def append_analyzed_csv(analyzed_df, boundary):
+    """
+    ANALYZED_CSV_FILE のうち boundary 以降の行 (再計算した境界の区間) を削除し、analyzed_df を追記します。
+    列の構成が保存済みのファイルと異なる場合は追記せずに False を返します。
+    """
+    with open(ANALYZED_CSV_FILE, 'r', encoding='utf-8-sig', newline='') as f:
+        header = f.readline().rstrip('\r\n')
+        first_row = f.readline()
+    if header != ','.join(analyzed_df.columns):
+        logging.error(
+            f"解析結果の列が '{ANALYZED_CSV_FILE}' と異なるため追記できません。"
+            "INCREMENTAL_MODE = False で作り直してください。")
+        return False
+
+    # 保存済みの datetime がミリ秒まで書かれている場合は、追記する行も同じ書式にする
+    analyzed_df = analyzed_df.copy()
+    if '.' in first_row.split(',', 1)[0]:
+        analyzed_df['datetime'] = analyzed_df['datetime'].dt.strftime('%Y-%m-%d %H:%M:%S.%f').str[:-3]
+
+    # 解析結果は datetime の昇順のため、末尾から boundary より前の行を探してその次の行から切り詰める
+    truncate_at = None
+    for offset, line in _iter_lines_backward(ANALYZED_CSV_FILE):
+        if offset == 0:
+            break
+        line_datetime = _line_datetime(line)
+        if line_datetime is not None and line_datetime < boundary:
+            break
+        truncate_at = offset
+    if truncate_at is not None:
+        with open(ANALYZED_CSV_FILE, 'r+b') as f:
+            f.truncate(truncate_at)
+
+    analyzed_df.to_csv(ANALYZED_CSV_FILE, mode='a', header=False, index=False, encoding='utf-8')
+    logging.info(f"解析結果を '{ANALYZED_CSV_FILE}' に追記しました。({len(analyzed_df)} 件)")
+    return True
+
+
+def main(plot=True):
+    # --- STEP 1: 生データの読み込みと解析 ---
+    run_report.step('STEP 1: 生データの読み込みと解析')
+    # 生データは compact 型のまま集計し、集計結果だけを元の表記に戻す
+    # 区間ごと・タグごとに最も RSSI が強いノードを求める (結果は datetime, tag_id の昇順)
+    boundary = incremental_boundary() if INCREMENTAL_MODE else None
+    if boundary is not None:
+        try:
+            analyzed_df = closest_node.closest_node_per_interval_chunked(
+                iter_raw_chunks(boundary), TIME_INTERVAL_MINUTES, AGGREGATION_METHOD,
+                max_workers=MAX_WORKERS)
+        except ValueError as e:
+            logging.error(f"エラー: {e}")
+            return False
+        if analyzed_df.empty:
+            logging.info("追記する新しいデータはありませんでした。")
+            return
+    elif USE_ROLLUP:
+        try:
+            analyzed_df = closest_node.closest_node_from_rollup(
+                load_or_build_rollup(), TIME_INTERVAL_MINUTES, AGGREGATION_METHOD)
+        except ValueError as e:
+            logging.error(f"エラー: {e}")
+            return False
+        if analyzed_df.empty:
+            logging.error("エラー: 読み込み可能な生データがありませんでした。")
+            return False
+    elif STREAMING_MODE:
+        try:
+            analyzed_df = closest_node.closest_node_per_interval_chunked(
+                iter_raw_chunks(), TIME_INTERVAL_MINUTES, AGGREGATION_METHOD,
+                max_workers=MAX_WORKERS)
+        except ValueError as e:
+            logging.error(f"エラー: {e}")
+            return False
+        if analyzed_df.empty:
+            logging.error("エラー: 読み込み可能な生データがありませんでした。")
+            return False
+    else:
+        df = load_raw_data()
+        if df is None:
+            return False
+        if df.empty:
+            logging.error("エラー: 読み込み可能な生データがありませんでした。")
+            return False
+        try:
+            analyzed_df = closest_node.closest_node_per_interval_parallel(
+                df, TIME_INTERVAL_MINUTES, AGGREGATION_METHOD,
+                max_workers=MAX_WORKERS, partition_by=PARTITION_BY)
+        except ValueError as e:
+            logging.error(f"エラー: {e}")
+            return False
+        del df
+    analyzed_df = tag_schema.from_compact(analyzed_df)
+    run_report.set_rows(rows_out=len(analyzed_df))
+
+    # --- STEP 2: 解析結果に名前情報とフロア情報を追加 ---
+    run_report.step('STEP 2: 名前情報の追加', rows_in=len(analyzed_df))
+    analyzed_df, node_names_df = add_name_info(analyzed_df)
+    # 新しい場所・タグ・部門に共通のコードを割り当てる (集計スクリプトはこのコードでグループ化する)
+    dimensions.update_registry(analyzed_df)
+    run_report.set_rows(rows_out=len(analyzed_df))
+
     # CSV保存
-    analyzed_df.to_csv(ANALYZED_CSV_FILE, index=False, encoding='utf-8-sig')
-    logging.info(f"解析結果を '{ANALYZED_CSV_FILE}' に保存しました。")
+    run_report.step('STEP 2: 解析結果の保存', rows_in=len(analyzed_df))
+    if boundary is not None:
+        if not append_analyzed_csv(analyzed_df, boundary):
+            return False
+    else:
+        analyzed_df.to_csv(ANALYZED_CSV_FILE, index=False, encoding='utf-8-sig')
+        logging.info(f"解析結果を '{ANALYZED_CSV_FILE}' に保存しました。")
 
     if analyzed_df.empty:
         logging.warning("出力対象のデータが0件のため終了します。")
         return
+    if not plot:
+        logging.info("グラフは作成せずに終了します。(--no-plot)")
+        return
 
     # --- STEP 3: 比較用Excelデータの処理 ---
-    df_excel_plot = process_excel_data(EXCEL_FILE_PATH, TIME_INTERVAL_MINUTES)
+    run_report.step('STEP 3: 比較用Excelデータの処理')
+    df_excel_plot = process_excel_data(excel_file_paths(), TIME_INTERVAL_MINUTES)
+    if df_excel_plot is not None:
+        run_report.set_rows(rows_out=len(df_excel_plot))
 
     # --- グラフ描画対象データの絞り込み ---
     if TAGS_TO_PLOT:
@@ -280,6 +602,10 @@ def main():
 
     # --- STEP 4: グラフ描画 ---
     logging.info(f"STEP 4: グラフ描画を開始します...")
+    run_report.step('STEP 4: グラフ描画', rows_in=len(df_plot))
+    # グラフのライブラリはここで初めて読み込む (集計だけの実行では読み込まない)
+    plt, sns = render_farm.load_plotting()
+    import matplotlib.dates as mdates
     fig, axes = plt.subplots(2, 1, figsize=(18, 12), sharex=True)
 
     tag_names_to_plot = df_plot['tag_name'].unique()
@@ -341,11 +667,21 @@ def main():
             ordered=True
         )
 
-        sns.lineplot(
-            data=df_excel_plot_filtered, x='datetime', y=EXCEL_Y_AXIS, hue='User',
-            style='User', marker='o', markersize=8, sort=False,
-            ax=ax2, palette=palette, dashes=False
-        )
+        if EXCEL_AS_INTERVALS:
+            # 予約1件を1本の線 (チェックイン〜チェックアウト) として描画する
+            y_positions = df_excel_plot_filtered[EXCEL_Y_AXIS].cat.codes
+            for user, user_df in df_excel_plot_filtered.groupby('User', sort=True):
+                ax2.hlines(y_positions[user_df.index], user_df['CheckInTime'], user_df['CheckOutTime'],
+                           colors=[palette[user]], linewidth=6, label=user)
+            ax2.set_yticks(range(len(y_values_sorted)))
+            ax2.set_yticklabels(y_values_sorted)
+            ax2.set_ylim(-0.5, len(y_values_sorted) - 0.5)
+        else:
+            sns.lineplot(
+                data=df_excel_plot_filtered, x='datetime', y=EXCEL_Y_AXIS, hue='User',
+                style='User', marker='o', markersize=8, sort=False,
+                ax=ax2, palette=palette, dashes=False
+            )
 
         ax2.set_title('滞在履歴 (予約データ)', fontsize=16)
         ax2.set_ylabel(f'場所 ({EXCEL_Y_AXIS})', fontsize=12)
@@ -367,8 +703,17 @@ def main():
 
     plt.savefig(OUTPUT_IMAGE_FILE, dpi=300)
     logging.info(f"比較グラフを '{OUTPUT_IMAGE_FILE}' に保存しました。")
+    # グラフのウィンドウを閉じるまでの時間は記録しない
+    run_report.end_step()
     plt.show()
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='5分ごとの最寄りノードの算出と NFC データとの比較グラフの作成')
+    parser.add_argument('--no-plot', action='store_true',
+                        help=f"グラフを作成せず、解析結果 ({ANALYZED_CSV_FILE}) だけを出力する")
+    args = parser.parse_args()
+    with run_report.run('analyze_closest_nodeANDexcel'):
+        # エラーで終了した場合は終了コード 1 を返す (pipeline.py が失敗として扱う)
+        if main(plot=not args.no_plot) is False:
+            sys.exit(1)
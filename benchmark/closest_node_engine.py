@@ -0,0 +1,78 @@
+'''
+最寄りノードの算出処理の速度比較
+(closest_node.py の closest_node_per_interval と、従来の groupby + idxmax)
+
+ランダムに作った生データ (tag_schema の compact 型) を使います。
+    python benchmark/closest_node_engine.py             (既定: 1000万行)
+    python benchmark/closest_node_engine.py 30000000
+'''
+
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import closest_node
+import tag_schema
+
+# ----------------------------------------------------------------------
+# 設定項目
+# ----------------------------------------------------------------------
+# 行数 (コマンドライン引数で上書きできます)
+ROW_COUNT = 10000000
+
+# タグ数・ノード数・期間 (日)
+TAG_COUNT = 300
+NODE_COUNT = 150
+DAYS = 30
+
+TIME_INTERVAL_MINUTES = 5
+# ----------------------------------------------------------------------
+
+
+def make_raw_data(row_count, seed=0):
+    """datetime 順に並んだ compact 型の生データを作ります。"""
+    rng = np.random.default_rng(seed)
+    start_ms = int(pd.Timestamp('2026-02-10').value // 10 ** 6)
+    return pd.DataFrame({
+        'datetime': np.sort(rng.integers(0, DAYS * 24 * 60 * 60 * 1000, row_count)) + start_ms,
+        'node_id': rng.integers(600, 600 + NODE_COUNT, row_count).astype('int16'),
+        'tag_id': rng.integers(0x0081f9800000, 0x0081f9800000 + TAG_COUNT, row_count),
+        'tag_rssi': rng.integers(-100, -40, row_count).astype('int8'),
+        'tag_volt': rng.integers(2600, 3100, row_count).astype('uint16'),
+    })
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else ROW_COUNT
+    print(f"{row_count:,} 行の生データを作成しています...")
+    df = make_raw_data(row_count)
+    # 従来の処理は pd.Grouper を使うため、datetime を datetime64 にしたものを渡す
+    df_datetime = tag_schema.as_analysis_frame(df)
+
+    print(f"{TIME_INTERVAL_MINUTES}分間隔 / タグ {TAG_COUNT} / ノード {NODE_COUNT} / {DAYS} 日")
+    for method in closest_node.AGGREGATION_METHODS:
+        started = time.perf_counter()
+        expected = closest_node.closest_node_per_interval_groupby(df_datetime, TIME_INTERVAL_MINUTES, method)
+        groupby_sec = time.perf_counter() - started
+
+        started = time.perf_counter()
+        result = closest_node.closest_node_per_interval(df, TIME_INTERVAL_MINUTES, method)
+        engine_sec = time.perf_counter() - started
+
+        if not tag_schema.as_analysis_frame(result).equals(expected):
+            print(f"エラー: {method} の結果が従来の処理と一致しません。")
+            sys.exit(1)
+
+        print(f"[{method}] 結果 {len(result):,} 行")
+        print(f"  groupby + idxmax (従来)   : {groupby_sec:7.2f} 秒  {row_count / groupby_sec:14,.0f} 行/秒")
+        print(f"  closest_node_per_interval : {engine_sec:7.2f} 秒  {row_count / engine_sec:14,.0f} 行/秒")
+        print(f"  速度比: {groupby_sec / engine_sec:.2f} 倍")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+'''
+rowdata の解析処理の速度比較
+(get_dynamo_data.py の parse_items (従来の処理) と parse_items_columnar)
+
+DynamoDB には接続せず、ランダムに作ったアイテムを使います。
+    python benchmark/parse_rowdata.py            (既定: 20万アイテム)
+    python benchmark/parse_rowdata.py 1000000
+'''
+
+
+import json
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import get_dynamo_data
+
+# ----------------------------------------------------------------------
+# 設定項目
+# ----------------------------------------------------------------------
+# アイテム数 (コマンドライン引数で上書きできます)
+ITEM_COUNT = 200000
+
+# 1ページあたりのアイテム数 (DynamoDB の1ページ (1MB) に近い値)
+PAGE_SIZE = 2000
+
+# 計測の繰り返し回数 (最も速かった回の値を表示します)
+REPEAT = 3
+# ----------------------------------------------------------------------
+
+
+def make_pages(item_count, page_size, seed=0):
+    """本番の rowdata と同じ形のアイテムを作り、ページ (アイテムのリスト) に分けて返します。"""
+    rnd = random.Random(seed)
+    items = []
+    for i in range(item_count):
+        tags = [{'id': f"0081f98{rnd.randint(0, 0xfff):05x}",
+                 'rssi': -rnd.randint(40, 95),
+                 'volt': round(rnd.uniform(2.6, 3.1), 2)}
+                for _ in range(rnd.randint(0, 6))]
+        items.append({
+            'bukken': 'tama_b',
+            'datetime': f"2026/02/10 {i // 3600000 % 24:02d}:{i // 60000 % 60:02d}:{i // 1000 % 60:02d}.{i % 1000:03d}",
+            'rowdata': json.dumps({'node': {'id': 691 + rnd.randint(0, 60)}, 'tag': tags}),
+        })
+    return [items[i:i + page_size] for i in range(0, len(items), page_size)]
+
+
+def run_legacy(pages):
+    records = []
+    for items in pages:
+        records.extend(get_dynamo_data.parse_items(items))
+    return pd.DataFrame(records)
+
+
+def run_columnar(pages):
+    columns = None
+    for items in pages:
+        columns = get_dynamo_data.parse_items_columnar(items, columns)
+    return pd.DataFrame(columns)
+
+
+def measure(func, pages):
+    best = None
+    result = None
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        result = func(pages)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    item_count = int(sys.argv[1]) if len(sys.argv) > 1 else ITEM_COUNT
+    print(f"{item_count} アイテムを作成しています...")
+    pages = make_pages(item_count, PAGE_SIZE)
+
+    legacy_sec, legacy_df = measure(run_legacy, pages)
+    columnar_sec, columnar_df = measure(run_columnar, pages)
+
+    if not legacy_df.equals(columnar_df):
+        print("エラー: parse_items と parse_items_columnar の結果が一致しません。")
+        sys.exit(1)
+
+    rows = len(legacy_df)
+    print(f"タグの読み取り {rows} 件 (DataFrame 作成まで、{REPEAT} 回中の最速)")
+    for name, sec in [('parse_items (従来)', legacy_sec), ('parse_items_columnar', columnar_sec)]:
+        print(f"  {name:<22}: {sec:7.2f} 秒  {item_count / sec:12,.0f} アイテム/秒  {rows / sec:12,.0f} 件/秒")
+    print(f"  速度比: {legacy_sec / columnar_sec:.2f} 倍")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+'''
+パイプライン全体の速度・メモリの計測 (合成データを使用)
+
+benchmark/synthetic_data.py で作った合成データを使い、次の処理を行数ごとに計測します。
+    ingest        生データの CSV の読み込み (tag_schema.read_raw_csv)
+    closest_node  最寄りノードの算出 (closest_node.closest_node_per_interval)
+    enrich        名前情報の付与と CSV 出力 (analyze_closest_nodeANDexcel.py の STEP 2)
+    totalling     集計キューブの作成 (totalling.py --no-plot)
+    hhi           部門分散指数・移動指数 (HHI/*.py --no-plot)
+    hhi_reverse   有効拠点数の CSV (hhi_reverse/make_csv.py)
+    occupancy     時刻別の在席エリア人数 (stay_area/main.py --no-plot)
+
+各処理は別のプロセスで実行し、処理時間・CPU 時間・1秒あたりの行数・ピーク時のメモリ使用量 (RSS) を記録します。
+結果は表示するとともに、WORK_DIR に JSON で保存します。
+    python benchmark/pipeline_benchmark.py                        (既定: 100万・1000万・1億行)
+    python benchmark/pipeline_benchmark.py 1000000 10000000
+    python benchmark/pipeline_benchmark.py --stages ingest closest_node 1000000
+
+合成データは行数ごとに WORK_DIR に作成し、2回目以降は作成済みのものを使います。
+(1億行の場合、生データの CSV だけで 5GB 程度のディスクを使います)
+enrich 以降の処理の行数は「タグ数 × 区間数」になるため、生データの行数を増やしても大きくは増えません。
+これらの処理を大きな行数で計測する場合は、synthetic_data.py の TAG_COUNT を増やしてください。
+'''
+
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import run_report
+import synthetic_data
+
+# ----------------------------------------------------------------------
+# 設定項目
+# ----------------------------------------------------------------------
+# 計測する行数 (コマンドライン引数で上書きできます)
+ROW_COUNTS = [1000000, 10000000, 100000000]
+
+# 合成データ・途中のファイル・結果の保存先 (このファイルと同じ階層)
+WORK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'work')
+
+# 計測する処理 (実行順)
+STAGES = ['ingest', 'closest_node', 'enrich', 'totalling', 'hhi', 'hhi_reverse', 'occupancy']
+
+TIME_INTERVAL_MINUTES = 5
+# ----------------------------------------------------------------------
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_CSV_FILE = 'processed_tag_data.csv'
+RAW_PARQUET_FILE = 'raw.parquet'
+CLOSEST_NODE_FILE = 'closest_node.parquet'
+ENRICHED_CSV_FILE = 'closest_node_per_interval_with_names.csv'
+DATA_META_FILE = 'synthetic.json'
+
+
+def _load_script(relative_path):
+    """サブフォルダのスクリプトをモジュールとして読み込みます。(main は実行しません)"""
+    path = os.path.join(BASE_DIR, relative_path)
+    name = os.path.splitext(relative_path.replace('/', '_'))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _count_csv_rows(path):
+    with open(path, 'rb') as f:
+        return max(sum(buf.count(b'\n') for buf in iter(lambda: f.read(1 << 24), b'')) - 1, 0)
+
+
+# ----------------------------------------------------------------------
+# 各処理 (作業フォルダで実行され、計測する関数と入力の行数を返す)
+# ----------------------------------------------------------------------
+def stage_ingest():
+    import tag_schema
+
+    def run():
+        df = tag_schema.read_raw_csv(RAW_CSV_FILE)
+        return df, len(df)
+
+    def save(df):
+        df.to_parquet(RAW_PARQUET_FILE, index=False)
+    return run, save
+
+
+def stage_closest_node():
+    import closest_node
+    df = pd.read_parquet(RAW_PARQUET_FILE)
+
+    def run():
+        result = closest_node.closest_node_per_interval(df, TIME_INTERVAL_MINUTES, 'max')
+        return result, len(df)
+
+    def save(result):
+        result.to_parquet(CLOSEST_NODE_FILE, index=False)
+    return run, save
+
+
+def stage_enrich():
+    import analyze_closest_nodeANDexcel as analyzer
+    import dimensions
+    import tag_schema
+    analyzed_df = pd.read_parquet(CLOSEST_NODE_FILE)
+
+    def run():
+        df, _ = analyzer.add_name_info(tag_schema.from_compact(analyzed_df))
+        dimensions.update_registry(df)
+        df.to_csv(ENRICHED_CSV_FILE, index=False, encoding='utf-8-sig')
+        return df, len(analyzed_df)
+    return run, None
+
+
+def stage_totalling():
+    import totalling
+    rows = _count_csv_rows(ENRICHED_CSV_FILE)
+
+    def run():
+        totalling.main(plot=False)
+        return None, rows
+    return run, None
+
+
+def stage_hhi():
+    scripts = [_load_script('HHI/calculate_department_dispersion.py'),
+               _load_script('HHI/calculate_mobility_index.py')]
+    for script in scripts:
+        script.input_file_path = os.path.abspath(ENRICHED_CSV_FILE)
+        script.output_data_path = os.path.abspath(os.path.basename(script.output_data_path))
+    rows = _count_csv_rows(ENRICHED_CSV_FILE)
+
+    def run():
+        for script in scripts:
+            script.main(plot=False)
+        return None, rows
+    return run, None
+
+
+def stage_hhi_reverse():
+    make_csv = _load_script('hhi_reverse/make_csv.py')
+    rows = _count_csv_rows(ENRICHED_CSV_FILE)
+
+    def run():
+        make_csv.make_effective_location_tables(src_path=ENRICHED_CSV_FILE)
+        return None, rows
+    return run, None
+
+
+def stage_occupancy():
+    stay_area = _load_script('stay_area/main.py')
+    rows = _count_csv_rows(ENRICHED_CSV_FILE)
+
+    def run():
+        occupancy_df = stay_area.compute_area_occupancy(ENRICHED_CSV_FILE)
+        return occupancy_df, rows
+    return run, None
+
+
+STAGE_FUNCTIONS = {
+    'ingest': stage_ingest,
+    'closest_node': stage_closest_node,
+    'enrich': stage_enrich,
+    'totalling': stage_totalling,
+    'hhi': stage_hhi,
+    'hhi_reverse': stage_hhi_reverse,
+    'occupancy': stage_occupancy,
+}
+
+
+def run_stage(stage, result_path):
+    """(子プロセス) 作業フォルダで1つの処理を実行し、計測結果を result_path に JSON で保存します。"""
+    import dimensions
+    # 登録簿は作業フォルダのものを使う (リポジトリの登録簿に合成データの値を追加しないため)
+    dimensions.REGISTRY_FILE = os.path.abspath('dimension_registry.json')
+
+    run, save = STAGE_FUNCTIONS[stage]()
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    output, rows_in = run()
+    wall_sec, cpu_sec = time.perf_counter() - wall_started, time.process_time() - cpu_started
+    if save is not None:
+        save(output)
+
+    peak_mb = run_report.peak_rss_mb()
+    result = {
+        'stage': stage,
+        'rows_in': int(rows_in),
+        'rows_out': int(len(output)) if output is not None else None,
+        'wall_sec': round(wall_sec, 3),
+        'cpu_sec': round(cpu_sec, 3),
+        'rows_per_sec': round(rows_in / wall_sec) if wall_sec > 0 else None,
+        'peak_rss_mb': round(peak_mb, 1) if peak_mb is not None else None,
+    }
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+
+
+# ----------------------------------------------------------------------
+# 計測の実行 (親プロセス)
+# ----------------------------------------------------------------------
+def _data_settings(row_count):
+    return {
+        'row_count': row_count,
+        'tag_count': synthetic_data.TAG_COUNT,
+        'node_count': synthetic_data.NODE_COUNT,
+        'readings_per_second': synthetic_data.READINGS_PER_SECOND,
+        'seed': synthetic_data.SEED,
+    }
+
+
+def prepare_data(row_count):
+    """行数ごとの作業フォルダに合成データを作ります。(同じ設定で作成済みの場合はそのまま使います)"""
+    data_dir = os.path.join(WORK_DIR, f"rows_{row_count}")
+    meta_path = os.path.join(data_dir, DATA_META_FILE)
+    settings = _data_settings(row_count)
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == settings:
+                return data_dir
+
+    print(f"{row_count:,} 行の合成データを作成しています... ({data_dir})")
+    started = time.perf_counter()
+    synthetic_data.write_synthetic_data(data_dir, row_count)
+    print(f"  作成しました。({time.perf_counter() - started:.1f} 秒)")
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(settings, f)
+    return data_dir
+
+
+def run_benchmark(row_counts, stages):
+    results = []
+    for row_count in row_counts:
+        data_dir = prepare_data(row_count)
+        for stage in stages:
+            result_path = os.path.join(data_dir, f"result_{stage}.json")
+            if os.path.exists(result_path):
+                os.remove(result_path)
+            print(f"[{row_count:,} 行] {stage} を計測しています...")
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run-stage', stage, '--result', result_path],
+                cwd=data_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if completed.returncode != 0 or not os.path.exists(result_path):
+                print(f"エラー: {stage} が失敗しました。以降の処理はこの行数では計測しません。")
+                print(completed.stderr[-2000:])
+                results.append({'row_count': row_count, 'stage': stage, 'error': completed.stderr[-2000:]})
+                break
+            with open(result_path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            result['row_count'] = row_count
+            results.append(result)
+            print(f"  {result['wall_sec']:8.2f} 秒 (CPU {result['cpu_sec']:8.2f} 秒)"
+                  f"  {result['rows_in']:>12,} 行  {result['rows_per_sec'] or 0:>12,} 行/秒"
+                  f"  ピーク RSS {result['peak_rss_mb']} MB")
+    return results
+
+
+def save_report(results):
+    os.makedirs(WORK_DIR, exist_ok=True)
+    path = os.path.join(WORK_DIR, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+        },
+        'synthetic_data': {k: v for k, v in _data_settings(None).items() if k != 'row_count'},
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    return path
+
+
+def print_summary(results):
+    print()
+    print(f"{'行数':>12}  {'処理':<13} {'時間(秒)':>9} {'CPU(秒)':>9} {'入力行数':>12} {'行/秒':>12} {'RSS(MB)':>9}")
+    for r in results:
+        if 'error' in r:
+            print(f"{r['row_count']:>12,}  {r['stage']:<13} 失敗")
+            continue
+        print(f"{r['row_count']:>12,}  {r['stage']:<13} {r['wall_sec']:>9.2f} {r['cpu_sec']:>9.2f}"
+              f" {r['rows_in']:>12,} {r['rows_per_sec'] or 0:>12,} {r['peak_rss_mb'] or '-':>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合成データによるパイプライン全体の速度・メモリの計測')
+    parser.add_argument('row_counts', nargs='*', type=int, help='計測する行数 (省略時は ROW_COUNTS)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, help='計測する処理 (省略時はすべて)')
+    parser.add_argument('--run-stage', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        run_stage(args.run_stage, args.result)
+        return
+
+    stages = [s for s in STAGES if s in args.stages] if args.stages else STAGES
+    results = run_benchmark(args.row_counts or ROW_COUNTS, stages)
+    print_summary(results)
+    print(f"\n結果を保存しました: {save_report(results)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+'''
+本番と同じ形式の合成データ (生データの CSV と NFC の予約データの Excel) を作成する
+
+本番の processed_tag_data.csv は共有できないため、node_names.csv / tag_names.csv の
+ノード・タグ・部門をもとに、次のようなデータを作ります。
+    - 各タグは勤務時間中、ノード (場所) に指数分布の時間だけ滞在しては別のノードへ移動する
+    - 生データの各行は「あるノードがあるタグを読み取った」記録。
+      滞在中のノードからの読み取りは強い RSSI、それ以外のノードからの読み取りは弱い RSSI になる
+    - NFC の予約データは、一定時間以上の滞在の一部をチェックイン・チェックアウトとして記録したもの
+
+出力先フォルダには、そのまま各分析スクリプトの作業フォルダとして使えるよう次のファイルを作ります。
+    processed_tag_data.csv, node_names.csv, tag_names.csv, data/辻アプリ_synthetic_YYYYMM.xlsx
+
+    python benchmark/synthetic_data.py 1000000 synthetic      (100万行を synthetic フォルダに作成)
+'''
+
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nfc_agreement
+import tag_schema
+
+# ----------------------------------------------------------------------
+# 設定項目
+# ----------------------------------------------------------------------
+# 行数・出力先 (コマンドライン引数で上書きできます)
+ROW_COUNT = 1000000
+OUTPUT_DIR = 'synthetic'
+
+# 元にする定義ファイル (このリポジトリの node_names.csv / tag_names.csv)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NODE_NAME_CSV_FILE = os.path.join(BASE_DIR, 'node_names.csv')
+TAG_NAME_CSV_FILE = os.path.join(BASE_DIR, 'tag_names.csv')
+
+# タグ数・ノード数 (None の場合は定義ファイルの数。多い場合は部門・フロアを順に割り当てたダミーを追加)
+TAG_COUNT = None
+NODE_COUNT = None
+
+# 全ノード合計の1秒あたりの読み取り件数 (行数をこの値で割った時間が、データの期間になります)
+READINGS_PER_SECOND = 50
+
+# データの開始日と勤務時間 (この時間だけ読み取りがあります)
+START_DATE = '2026-02-02'
+WORK_START_HOUR = 8
+WORK_END_HOUR = 20
+WEEKDAYS_ONLY = True
+
+# 1か所の平均滞在時間 (分)
+MEAN_STAY_MINUTES = 45
+
+# RSSI の分布 (正規分布、dBm)。滞在中のノードからの読み取りは NEAR、それ以外は FAR
+RSSI_NEAR_MEAN = -62
+RSSI_NEAR_STD = 6
+RSSI_FAR_MEAN = -84
+RSSI_FAR_STD = 7
+RSSI_MIN = -100
+RSSI_MAX = -35
+# 読み取りのうち、滞在中のノードからの読み取りの割合
+NEAR_READING_SHARE = 0.6
+
+# 電池電圧 (V) の平均と、タグごとのばらつき
+VOLT_MEAN = 2.95
+VOLT_STD = 0.08
+
+# NFC の予約データ: この時間 (分) 以上の滞在のうち、NFC_BOOKING_SHARE の割合をチェックインとして記録
+NFC_MIN_STAY_MINUTES = 15
+NFC_BOOKING_SHARE = 0.5
+
+# 乱数のシード
+SEED = 0
+# ----------------------------------------------------------------------
+
+MS_PER_SECOND = 1000
+MS_PER_DAY = 24 * 60 * 60 * MS_PER_SECOND
+DUMMY_TAG_BASE = 0x0081f9900000
+
+# 予約データのワークブックの列 (本番のワークブックと同じ並び。アンケートの列は作りません)
+BOOKING_SHEET_COLUMNS = ['SeatNumber', 'Area', 'CheckInTime', 'CheckOutTime', 'User']
+
+
+def load_nodes(node_count=None):
+    """node_names.csv のノードを node_count 件にした表を返します。(多い場合はダミーのノードを追加)"""
+    nodes = pd.read_csv(NODE_NAME_CSV_FILE, index_col=False)
+    nodes = nodes[['node_id', 'place_name', 'floor', 'west_to_east']]
+    node_count = node_count or len(nodes)
+    if node_count <= len(nodes):
+        return nodes.head(node_count).reset_index(drop=True)
+    extra = np.arange(node_count - len(nodes))
+    floors = nodes['floor'].dropna().unique()
+    dummy = pd.DataFrame({
+        'node_id': int(nodes['node_id'].max()) + 1 + extra,
+        'place_name': [f"ダミー{i + 1}" for i in extra],
+        'floor': floors[extra % len(floors)],
+        'west_to_east': extra // len(floors) + 1,
+    })
+    return pd.concat([nodes, dummy], ignore_index=True)
+
+
+def load_tags(tag_count=None):
+    """tag_names.csv のタグを tag_count 件にした表を返します。(多い場合はダミーのタグを追加)"""
+    tags = pd.read_csv(TAG_NAME_CSV_FILE, dtype={'tag_id': str})
+    tag_count = tag_count or len(tags)
+    if tag_count <= len(tags):
+        return tags.head(tag_count).reset_index(drop=True)
+    extra = np.arange(tag_count - len(tags))
+    departments = tags['department'].dropna().unique()
+    dummy = pd.DataFrame({
+        'tag_id': [tag_schema.unpack_tag_id(DUMMY_TAG_BASE + i) for i in extra],
+        'tag_name': [f"{i + 1} ダミー" for i in extra],
+        'department': departments[extra % len(departments)],
+    })
+    return pd.concat([tags, dummy], ignore_index=True)
+
+
+def work_days(row_count, readings_per_second=None):
+    """データに含まれる日 (勤務日) の開始時刻 (エポックミリ秒) と、日ごとの行数を返します。"""
+    readings_per_second = readings_per_second or READINGS_PER_SECOND
+    rows_per_day = int(readings_per_second * (WORK_END_HOUR - WORK_START_HOUR) * 60 * 60)
+    day_count = -(-row_count // rows_per_day)
+    days = pd.bdate_range(START_DATE, periods=day_count) if WEEKDAYS_ONLY else \
+        pd.date_range(START_DATE, periods=day_count)
+    day_ms = days.to_numpy(dtype='datetime64[ms]').astype('int64')
+    rows = np.full(day_count, rows_per_day, dtype='int64')
+    rows[-1] = row_count - rows_per_day * (day_count - 1)
+    return day_ms, rows
+
+
+def make_stays(day_ms, tag_count, node_count, rng):
+    """
+    1日分の滞在の表 (tag, start, end, node) を作ります。各タグは勤務開始時刻から順に、
+    平均 MEAN_STAY_MINUTES 分の指数分布の時間ずつ、ランダムなノードに滞在します。
+    """
+    work_start = day_ms + WORK_START_HOUR * 60 * 60 * MS_PER_SECOND
+    work_ms = (WORK_END_HOUR - WORK_START_HOUR) * 60 * 60 * MS_PER_SECOND
+    mean_ms = MEAN_STAY_MINUTES * 60 * MS_PER_SECOND
+    # 勤務時間を確実に埋められるだけの滞在を作り、勤務時間を超えた分は捨てる
+    per_tag = int(work_ms / mean_ms * 2) + 10
+    durations = rng.exponential(mean_ms, (tag_count, per_tag))
+    starts = np.cumsum(durations, axis=1) - durations
+    ends = np.minimum(starts + durations, work_ms)
+    keep = starts < work_ms
+    tags = np.broadcast_to(np.arange(tag_count)[:, None], starts.shape)
+    return pd.DataFrame({
+        'tag': tags[keep].astype('int32'),
+        'start': work_start + starts[keep].astype('int64'),
+        'end': work_start + ends[keep].astype('int64'),
+        'node': rng.integers(0, node_count, keep.sum()).astype('int32'),
+    })
+
+
+def make_readings(stays, day_ms, row_count, node_ids, tag_ids, tag_volts, rng):
+    """1日分の生データ (compact 型、datetime の昇順) を作ります。"""
+    work_start = day_ms + WORK_START_HOUR * 60 * 60 * MS_PER_SECOND
+    work_ms = (WORK_END_HOUR - WORK_START_HOUR) * 60 * 60 * MS_PER_SECOND
+    times = work_start + np.sort(rng.integers(0, work_ms, row_count))
+    tags = rng.integers(0, len(tag_ids), row_count)
+
+    # 読み取り時点で各タグが滞在しているノード (滞在の表はタグ・開始時刻の順)
+    stay_keys = stays['tag'].to_numpy().astype('int64') * MS_PER_DAY + (stays['start'].to_numpy() - day_ms)
+    reading_keys = tags * MS_PER_DAY + (times - day_ms)
+    current = stays['node'].to_numpy()[np.searchsorted(stay_keys, reading_keys, side='right') - 1]
+
+    near = rng.random(row_count) < NEAR_READING_SHARE
+    nodes = np.where(near, current, rng.integers(0, len(node_ids), row_count))
+    rssi = np.where(near, rng.normal(RSSI_NEAR_MEAN, RSSI_NEAR_STD, row_count),
+                    rng.normal(RSSI_FAR_MEAN, RSSI_FAR_STD, row_count))
+    volts = tag_volts[tags] + rng.normal(0, 0.01, row_count)
+    return pd.DataFrame({
+        'datetime': times,
+        'node_id': node_ids[nodes].astype('int16'),
+        'tag_id': tag_ids[tags],
+        'tag_rssi': np.clip(np.round(rssi), RSSI_MIN, RSSI_MAX).astype('int8'),
+        'tag_volt': np.round(volts * 1000).astype('uint16'),
+    })
+
+
+def make_bookings(stays, nodes, tags, rng):
+    """滞在の表から NFC の予約データ (booking_cache.BOOKING_COLUMNS の列) を作ります。"""
+    long_stay = (stays['end'] - stays['start']) >= NFC_MIN_STAY_MINUTES * 60 * MS_PER_SECOND
+    booked = stays[long_stay & (rng.random(len(stays)) < NFC_BOOKING_SHARE)]
+    place_names = nodes['place_name'].astype(str).to_numpy()[booked['node'].to_numpy()]
+    # チェックイン・チェックアウトは滞在の開始・終了から数分ずれる
+    jitter = rng.integers(0, 3 * 60 * MS_PER_SECOND, (2, len(booked)))
+    return pd.DataFrame({
+        'SeatNumber': [f"{p}{i % 4 + 1}" if p not in nfc_agreement.NFC_SEAT_AREA_MAP else p
+                       for i, p in enumerate(place_names)],
+        'Area': place_names,
+        'CheckInTime': tag_schema.epoch_ms_to_datetime(booked['start'].to_numpy() + jitter[0]),
+        'CheckOutTime': tag_schema.epoch_ms_to_datetime(booked['end'].to_numpy() - jitter[1]),
+        'User': tags['tag_name'].to_numpy()[booked['tag'].to_numpy()],
+    })
+
+
+def iter_synthetic_data(row_count, tag_count=None, node_count=None, readings_per_second=None, seed=None):
+    """
+    合成データを1日ずつ作り、(生データ (compact 型), NFC の予約データ) を日付の昇順に返すジェネレータです。
+    1日分ずつ作るため、行数が多くてもメモリ使用量は1日分の量で収まります。
+    """
+    rng = np.random.default_rng(SEED if seed is None else seed)
+    nodes = load_nodes(node_count or NODE_COUNT)
+    tags = load_tags(tag_count or TAG_COUNT)
+    node_ids = nodes['node_id'].to_numpy().astype('int16')
+    tag_ids = tag_schema.pack_tag_ids(tags['tag_id'])
+    tag_volts = rng.normal(VOLT_MEAN, VOLT_STD, len(tags))
+
+    for day_ms, day_rows in zip(*work_days(row_count, readings_per_second)):
+        stays = make_stays(day_ms, len(tags), len(nodes), rng)
+        yield (make_readings(stays, day_ms, int(day_rows), node_ids, tag_ids, tag_volts, rng),
+               make_bookings(stays, nodes, tags, rng))
+
+
+def write_synthetic_data(output_dir, row_count, tag_count=None, node_count=None,
+                         readings_per_second=None, seed=None):
+    """
+    output_dir に合成データ (processed_tag_data.csv, node_names.csv, tag_names.csv, data/辻アプリ_synthetic_*.xlsx) を作ります。
+    戻り値は (生データの行数, 予約データの件数) です。
+    """
+    os.makedirs(os.path.join(output_dir, 'data'), exist_ok=True)
+    nodes = load_nodes(node_count or NODE_COUNT)
+    tags = load_tags(tag_count or TAG_COUNT)
+    nodes.to_csv(os.path.join(output_dir, 'node_names.csv'), index=False)
+    tags.to_csv(os.path.join(output_dir, 'tag_names.csv'), index=False)
+
+    raw_rows = 0
+    bookings = []
+    csv_path = os.path.join(output_dir, 'processed_tag_data.csv')
+    with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
+        for readings, day_bookings in iter_synthetic_data(row_count, tag_count, node_count,
+                                                          readings_per_second, seed):
+            # get_dynamo_data.py の出力と同じ表記 (datetime は DynamoDB の書式、tag_id は16進数、電圧は V)
+            tag_schema.from_compact(readings).to_csv(
+                f, index=False, header=raw_rows == 0, date_format=tag_schema.RAW_DATETIME_FORMAT)
+            raw_rows += len(readings)
+            bookings.append(day_bookings)
+
+    # 予約データは本番と同じく月ごとのワークブックにする
+    bookings = pd.concat(bookings, ignore_index=True)[BOOKING_SHEET_COLUMNS]
+    for month, month_bookings in bookings.groupby(bookings['CheckInTime'].dt.strftime('%Y%m')):
+        month_bookings.to_excel(os.path.join(output_dir, 'data', f"辻アプリ_synthetic_{month}.xlsx"), index=False)
+    return raw_rows, len(bookings)
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else ROW_COUNT
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else OUTPUT_DIR
+    print(f"{row_count:,} 行の合成データを '{output_dir}' に作成しています...")
+    raw_rows, booking_rows = write_synthetic_data(output_dir, row_count)
+    print(f"生データ {raw_rows:,} 行、予約データ {booking_rows:,} 件を作成しました。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+'''
+NFC の予約データ (data/辻アプリ_*.xlsx) を読み込み、整えた表を Parquet 形式でキャッシュするモジュール
+
+Excel (openpyxl) の読み込みは遅いため、ワークブックごとに
+CheckInTime / CheckOutTime / User / SeatNumber / Area の5列だけを整えた表を保存し、2回目以降は Excel を開きません。
+キャッシュはワークブックのパス・更新時刻・内容のハッシュに対応付けられ、更新時刻が変わっていても
+内容が同じならそのまま使い、内容が変わっていれば読み込み直します。
+
+保存先の構成:
+    booking_cache/<パスのハッシュ>.parquet       整えた予約の表
+    booking_cache/<パスのハッシュ>.json          元のワークブックのパス・更新時刻・サイズ・ハッシュ
+
+    python booking_cache.py          保存済みのワークブックを表示
+    python booking_cache.py clear    すべて削除
+'''
+
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# ----------------------------------------------------------------------
+# 設定項目
+# ----------------------------------------------------------------------
+# 保存先フォルダ (このファイルと同じ階層)
+CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'booking_cache')
+# ----------------------------------------------------------------------
+
+TIME_COLUMNS = ['CheckInTime', 'CheckOutTime']
+TEXT_COLUMNS = ['User', 'SeatNumber', 'Area']
+BOOKING_COLUMNS = TIME_COLUMNS + TEXT_COLUMNS
+
+
+def _cache_paths(path, cache_dir=None):
+    key = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+    base = os.path.join(cache_dir or CACHE_DIR, key)
+    return f"{base}.parquet", f"{base}.json"
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_workbook(path):
+    """
+    ワークブックを読み込み、予約の5列だけの表にします。
+    CheckInTime / CheckOutTime は日時 (変換できない値は NaT)、User / SeatNumber / Area は文字列 (空欄は欠損) にします。
+    """
+    df = pd.read_excel(path)
+    missing = [c for c in BOOKING_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"'{path}' に必要な列がありません: {missing}")
+
+    bookings = pd.DataFrame({c: pd.to_datetime(df[c], errors='coerce') for c in TIME_COLUMNS})
+    for col in TEXT_COLUMNS:
+        bookings[col] = pd.Series([str(v) if pd.notna(v) else None for v in df[col]], dtype=object)
+    return bookings
+
+
+def _with_missing_as_nan(bookings):
+    # 文字列の列の欠損値は、pd.read_excel で読み込んだ場合と同じく NaN にする
+    bookings = bookings.copy()
+    for col in TEXT_COLUMNS:
+        values = bookings[col].astype(object)
+        bookings[col] = values.where(values.notna(), np.nan)
+    return bookings
+
+
+def read_workbook(path, cache_dir=None):
+    """
+    ワークブックの予約の表を返します。キャッシュが使える場合は Excel を開かずに読み込みます。
+    (行の順番はワークブックと同じです。文字列の列の欠損値は NaN になります)
+    (存在しないファイルを指定した場合は FileNotFoundError になります)
+    """
+    stat = os.stat(path)
+    parquet_path, meta_path = _cache_paths(path, cache_dir)
+    meta = None
+    if os.path.exists(parquet_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+
+    file_hash = None
+    if meta is not None and meta.get('size') == stat.st_size:
+        if meta.get('mtime_ns') == stat.st_mtime_ns:
+            return _with_missing_as_nan(pd.read_parquet(parquet_path))
+        # 更新時刻だけが変わった場合 (コピーし直した場合など) は、内容が同じならそのまま使う
+        file_hash = _file_hash(path)
+        if meta.get('sha256') == file_hash:
+            meta['mtime_ns'] = stat.st_mtime_ns
+            _write_meta(meta_path, meta)
+            return _with_missing_as_nan(pd.read_parquet(parquet_path))
+
+    logging.info(f"'{path}' を読み込んでキャッシュします...")
+    bookings = parse_workbook(path)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    tmp_path = f"{parquet_path}.tmp"
+    bookings.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, parquet_path)
+    _write_meta(meta_path, {
+        'path': os.path.abspath(path),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': file_hash or _file_hash(path),
+    })
+    return _with_missing_as_nan(bookings)
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = f"{meta_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, meta_path)
+
+
+def read_bookings(paths, cache_dir=None):
+    """
+    複数のワークブックの予約を1つの表にまとめて返します。
+    ワークブックの期間が重なって同じ予約 (5列がすべて同じ行) が複数ある場合は1件にまとめます。
+    ワークブックが2つ以上の場合は CheckInTime の昇順 (同じ時刻はワークブックの順) に並べます。
+    """
+    paths = list(paths)
+    frames = [read_workbook(path, cache_dir) for path in paths]
+    if not frames:
+        return pd.DataFrame(columns=BOOKING_COLUMNS)
+    if len(frames) == 1:
+        return frames[0]
+    bookings = pd.concat(frames, ignore_index=True)
+    before = len(bookings)
+    bookings = bookings.drop_duplicates(subset=BOOKING_COLUMNS)
+    bookings = bookings.sort_values('CheckInTime', kind='stable', na_position='last').reset_index(drop=True)
+    logging.info(f"{len(paths)} 個のワークブックの予約をまとめました。({before} -> {len(bookings)} 件)")
+    return bookings
+
+
+def clear(cache_dir=None):
+    """キャッシュをすべて削除します。"""
+    files = glob.glob(os.path.join(cache_dir or CACHE_DIR, '*.parquet')) + \
+        glob.glob(os.path.join(cache_dir or CACHE_DIR, '*.json'))
+    for path in files:
+        os.remove(path)
+    logging.info(f"キャッシュを {len(files)} ファイル削除しました。")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if len(sys.argv) == 2 and sys.argv[1] == 'clear':
+        clear()
+    else:
+        metas = sorted(glob.glob(os.path.join(CACHE_DIR, '*.json')))
+        print(f"キャッシュ: {len(metas)} ワークブック")
+        for meta_path in metas:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            print(f"  {meta['path']} ({meta['size'] / 1024:.0f} KB)")
+        print("使い方: python booking_cache.py / python booking_cache.py clear")
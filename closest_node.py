@@ -0,0 +1,486 @@
+'''
+時間間隔ごとに、各タグにとって最も RSSI が強いノード (最寄りのノード) を求める処理
+
+analyze_closest_node.py / analyze_closest_nodeANDexcel.py の
+    df.groupby([pd.Grouper(key='datetime', freq='5min'), 'tag_id'])['tag_rssi'].idxmax()
+と同じ結果を、時刻を整数の区間番号にし、(区間, タグ) ごとの番号を振ってから NumPy の集計 (ufunc.at) で求めます。
+(groupby と全件の並べ替えを使わないため、数千万行でも高速です)
+
+集計方法 (AGGREGATION_METHOD):
+    'max'  : 区間内で RSSI が最大だった読み取り (生データの行) を選びます
+    'mean' : 区間内の平均 RSSI が最も高いノードを選びます
+    'sum'  : 区間内の合計 RSSI が最も高いノードを選びます
+同じ値が複数ある場合の選び方も従来と同じです ('max' は先に現れた行、'mean' / 'sum' は node_id が小さいノード)。
+'''
+
+
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+MS_PER_MINUTE = 60 * 1000
+MS_PER_DAY = 24 * 60 * MS_PER_MINUTE
+
+AGGREGATION_METHODS = ('max', 'mean', 'sum')
+
+# (区間の数 * タグ数) が行数のこの倍数以下なら、(区間, タグ) の番号をそのままグループ番号に使う
+DENSE_GROUP_FACTOR = 4
+
+# ロールアップ (build_rollup) の区間の長さ (分)
+ROLLUP_BASE_MINUTES = 1
+
+ROLLUP_COLUMNS = ['minute', 'tag_id', 'node_id', 'rssi_max', 'rssi_sum', 'count', 'max_datetime', 'max_volt']
+
+# 'max' の結果の列 (生データと同じ)
+RAW_RESULT_COLUMNS = ['datetime', 'node_id', 'tag_id', 'tag_rssi', 'tag_volt']
+
+# 並列計算で、1プロセスあたりに割り当てるシャード数 (多いほど処理時間のばらつきがならされます)
+SHARDS_PER_WORKER = 4
+
+
+def _epoch_ms(series):
+    """datetime 列 (エポックミリ秒の整数または datetime64) をエポックミリ秒の int64 配列にします。"""
+    if pd.api.types.is_integer_dtype(series):
+        return series.to_numpy(dtype='int64')
+    return series.to_numpy(dtype='datetime64[ms]').astype('int64')
+
+
+def assign_interval_bins(epoch_ms, interval_minutes, origin_ms=None):
+    """
+    エポックミリ秒の配列を interval_minutes 分ごとの区間番号 (int64) にします。
+    区間の起点は pd.Grouper の既定 (origin='start_day') と同じく、最初の時刻の日の 0:00 です。
+    戻り値は (区間番号の配列, 起点のエポックミリ秒) です。区間の開始時刻は 起点 + 区間番号 * 間隔 です。
+    """
+    epoch_ms = np.asarray(epoch_ms, dtype='int64')
+    if origin_ms is None:
+        origin_ms = int(epoch_ms.min()) // MS_PER_DAY * MS_PER_DAY if len(epoch_ms) else 0
+    return (epoch_ms - origin_ms) // (interval_minutes * MS_PER_MINUTE), origin_ms
+
+
+def _sorted_codes(values):
+    """
+    値を昇順の整数コードにします。戻り値は (コード, 昇順のユニークな値)。
+    ハッシュでユニークな値を求めてから、ユニークな値だけを並べ替えるため、全件を並べ替えるより高速です。
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = np.asarray(uniques)
+    order = np.argsort(uniques, kind='stable')
+    rank = np.empty(len(uniques), dtype='int64')
+    rank[order] = np.arange(len(uniques))
+    return rank[codes], uniques[order]
+
+
+def _group_ids(bins, tag_codes, tag_count):
+    """
+    (区間, タグ) ごとのグループ番号を返します。戻り値は (グループ番号, グループ数, 番号が昇順か)。
+    区間の数 * タグ数 が行数に比べて小さい場合は、(区間, タグ) の昇順の番号をそのまま使います
+    (並べ替えなしで結果が (区間, タグ) の昇順に並びます)。大きい場合は出現順に番号を振り直します。
+    """
+    bin_min = int(bins.min())
+    keys = (bins - bin_min) * tag_count + tag_codes
+    span = int(keys.max()) + 1
+    if span <= DENSE_GROUP_FACTOR * len(keys):
+        return keys, span, True
+    codes, _ = pd.factorize(keys)
+    return codes.astype('int64'), int(codes.max()) + 1, False
+
+
+def _argmax_per_group(values, group_ids, group_count, tiebreak):
+    """
+    グループごとに values が最大の要素を選び、その tiebreak の値と最大値を返します。
+    最大値の要素が複数ある場合は tiebreak が最小のものを選びます。要素のないグループの tiebreak は int64 の最大値です。
+    (並べ替えを使わず、グループごとの最大値 -> 最大値と等しい要素の tiebreak の最小値 の2回の集計で求めます)
+    """
+    values = values.astype('float64')
+    best = np.full(group_count, -np.inf)
+    np.fmax.at(best, group_ids, values)
+    candidates = np.flatnonzero(values == best[group_ids])
+    chosen = np.full(group_count, np.iinfo('int64').max)
+    np.minimum.at(chosen, group_ids[candidates], tiebreak[candidates])
+    return chosen, best
+
+
+def closest_node_per_interval(df, interval_minutes, method='max', origin_ms=None):
+    """
+    時間間隔 (interval_minutes 分) とタグごとに、最も RSSI が強いノードを求めます。
+    df には datetime, node_id, tag_id, tag_rssi 列が必要です (tag_schema の compact 型でもそのままでも構いません)。
+    origin_ms には区間の起点 (エポックミリ秒) を指定できます。省略した場合は df の最初の時刻の日の 0:00 です。
+
+    戻り値は従来の groupby による処理と同じ形の DataFrame で、datetime, tag_id の昇順に並びます。
+        'max'         : df から選ばれた行 (列は df と同じ。datetime は読み取り時刻のまま)
+        'mean' / 'sum': datetime (区間の開始時刻), tag_id, node_id, tag_rssi (平均 / 合計)
+    """
+    if method not in AGGREGATION_METHODS:
+        raise ValueError(
+            f"不明な集計方法 '{method}' です。'max', 'mean', 'sum'のいずれかを指定してください。")
+    if df.empty:
+        return _empty_result(df, method)
+
+    epoch_ms = _epoch_ms(df['datetime'])
+    bins, origin_ms = assign_interval_bins(epoch_ms, interval_minutes, origin_ms)
+    tag_codes, tag_uniques = _sorted_codes(df['tag_id'].to_numpy())
+    group_ids, group_count, is_ordered = _group_ids(bins, tag_codes, len(tag_uniques))
+    rssi = df['tag_rssi'].to_numpy()
+
+    if method == 'max':
+        # RSSI が最大の行のうち、先に現れた行 (位置が最小の行) を選ぶ
+        chosen, _ = _argmax_per_group(rssi, group_ids, group_count, np.arange(len(df)))
+        selected = chosen[chosen < len(df)]
+        if is_ordered:
+            # (区間, タグ) の昇順に並んでいるので、読み取り時刻で安定ソートすれば (datetime, tag_id) の昇順になる
+            selected = selected[np.argsort(epoch_ms[selected], kind='stable')]
+        else:
+            selected = selected[np.lexsort((tag_codes[selected], epoch_ms[selected]))]
+        return df.iloc[selected].reset_index(drop=True)
+
+    return _select_by_totals(
+        bins, origin_ms, interval_minutes, tag_codes, tag_uniques, group_ids, group_count, is_ordered,
+        df['node_id'].to_numpy(), rssi, None, method, np.issubdtype(rssi.dtype, np.integer))
+
+
+def _empty_result(df, method):
+    """
+    空の df に対する結果 (行が0件で、列と型は行がある場合と同じ DataFrame) を返します。
+    (datetime がエポックミリ秒の compact 型の場合、groupby による処理では集計できないため)
+    """
+    if method == 'max':
+        return df.iloc[:0].reset_index(drop=True)
+    rssi_dtype = df['tag_rssi'].dtype
+    if method == 'mean' or not np.issubdtype(rssi_dtype, np.integer):
+        rssi_dtype = np.dtype('float64')
+    else:
+        rssi_dtype = np.dtype('int64')
+    return pd.DataFrame({
+        'datetime': np.array([], dtype='datetime64[ms]'),
+        'tag_id': np.array([], dtype=df['tag_id'].dtype),
+        'node_id': np.array([], dtype=df['node_id'].dtype),
+        'tag_rssi': np.array([], dtype=rssi_dtype),
+    })
+
+
+def _select_by_totals(bins, origin_ms, interval_minutes, tag_codes, tag_uniques, group_ids, group_count,
+                      is_ordered, node_values, row_sums, row_counts, method, integer_sums):
+    """
+    'mean' / 'sum' の場合の処理です。行ごとの RSSI の合計 row_sums と件数 row_counts (None の場合は1件ずつ) から
+    (区間, タグ, ノード) ごとの平均または合計を求め、(区間, タグ) ごとに値が最大のノードを選びます。
+    """
+    row_count = len(bins)
+    # (区間, タグ, ノード) ごとに合計と件数を求める
+    node_codes, node_uniques = _sorted_codes(node_values)
+    cell_codes, cell_keys = pd.factorize(group_ids * len(node_uniques) + node_codes)
+    sums = np.bincount(cell_codes, weights=row_sums, minlength=len(cell_keys))
+    if method == 'mean':
+        counts = np.bincount(cell_codes, weights=row_counts, minlength=len(cell_keys))
+        values = sums / counts
+    elif integer_sums:
+        values = sums.round().astype('int64')
+    else:
+        values = sums
+
+    # (区間, タグ) ごとに値が最大のノードを選ぶ (同じ値なら node_id が小さいノード)
+    chosen_node, best = _argmax_per_group(
+        values, cell_keys // len(node_uniques), group_count, cell_keys % len(node_uniques))
+    present = np.flatnonzero(chosen_node < len(node_uniques))
+
+    # グループごとの区間とタグを、グループの最初の行から求めて (区間, タグ) の昇順に並べる
+    first_row = np.full(group_count, row_count, dtype='int64')
+    np.minimum.at(first_row, group_ids, np.arange(row_count))
+    present_rows = first_row[present]
+    if not is_ordered:
+        present = present[np.lexsort((tag_codes[present_rows], bins[present_rows]))]
+        present_rows = first_row[present]
+
+    result_values = best[present]
+    if values.dtype != np.dtype('float64'):
+        result_values = result_values.astype(values.dtype)
+    return pd.DataFrame({
+        'datetime': (origin_ms + bins[present_rows] * interval_minutes * MS_PER_MINUTE).astype('datetime64[ms]'),
+        'tag_id': tag_uniques[tag_codes[present_rows]],
+        'node_id': node_uniques[chosen_node[present]],
+        'tag_rssi': result_values,
+    })
+
+
+def _iter_finished_parts(chunks, interval_minutes):
+    """
+    時刻順のチャンクを順に受け取り、区間が確定した行のまとまりを (DataFrame, 区間の起点) で順に返します。
+    チャンクの最後の区間 (次のチャンクに続きがあるかもしれない区間) の行は次のチャンクに持ち越します。
+    """
+    origin_ms = None
+    carry = None
+    carry_bin = None
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        epoch_ms = _epoch_ms(chunk['datetime'])
+        bins, origin_ms = assign_interval_bins(epoch_ms, interval_minutes, origin_ms)
+        if carry_bin is not None and bins.min() < carry_bin:
+            raise ValueError("生データのチャンクが時刻順に並んでいません。")
+
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+            bins = np.concatenate([np.full(len(carry), carry_bin, dtype='int64'), bins])
+
+        # 最後の区間は次のチャンクに続きがあるかもしれないので持ち越す
+        carry_bin = int(bins.max())
+        is_done = bins < carry_bin
+        if is_done.any():
+            yield chunk[is_done], origin_ms
+        carry = chunk[~is_done]
+
+    if carry is not None:
+        yield carry, origin_ms
+
+
+def iter_closest_node_per_interval(chunks, interval_minutes, method='max', max_workers=1):
+    """
+    時刻順に並んだ生データのチャンク (DataFrame) を順に受け取り、確定した区間の結果を順に返すジェネレータです。
+    区間は重ならないため、チャンクの最後の区間 (次のチャンクに続きがあるかもしれない区間) の行だけを
+    次のチャンクに持ち越し、それより前の区間はそのチャンクだけで計算します。
+    返す結果をすべて連結すると、全チャンクを連結して closest_node_per_interval に渡した場合と同じになります。
+    メモリ使用量はチャンク1つ分と持ち越す区間の行数で決まり、期間の長さには依存しません。
+
+    max_workers が2以上 (None の場合は CPU のコア数) の場合は、チャンクごとの計算を max_workers 個のプロセスで
+    並列に行います (先読みするチャンクは max_workers * 2 個まで。結果はチャンクの順に返します)。
+
+    チャンク内の行は時刻順でなくても構いませんが、チャンクどうしは時刻順である必要があります
+    (前のチャンクの最後の区間より前の行があると ValueError になります)。
+    """
+    if method not in AGGREGATION_METHODS:
+        raise ValueError(
+            f"不明な集計方法 '{method}' です。'max', 'mean', 'sum'のいずれかを指定してください。")
+
+    parts = _iter_finished_parts(chunks, interval_minutes)
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers <= 1:
+        for part, origin_ms in parts:
+            yield closest_node_per_interval(part, interval_minutes, method, origin_ms)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for part, origin_ms in parts:
+            pending.append(executor.submit(
+                closest_node_per_interval, part, interval_minutes, method, origin_ms))
+            # 完了順ではなくチャンクの順に返す
+            while len(pending) >= max_workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def closest_node_per_interval_chunked(chunks, interval_minutes, method='max', max_workers=1):
+    """
+    iter_closest_node_per_interval の結果を連結して返します。チャンクが1つもない場合は空の DataFrame を返します。
+    """
+    results = list(iter_closest_node_per_interval(chunks, interval_minutes, method, max_workers))
+    if not results:
+        return pd.DataFrame()
+    return pd.concat(results, ignore_index=True)
+
+
+def _split_shards(df, interval_minutes, shard_count, partition_by, origin_ms):
+    """
+    df を shard_count 個のシャードに分け、行の位置の配列のリストを返します (各シャード内の行は元の順のまま)。
+        'tag' : tag_id ごとに振り分けます (同じタグは同じシャード)
+        'time': 区間の境界で、行数がほぼ等しくなるように時間で区切ります
+    """
+    if partition_by == 'tag':
+        tag_codes, _ = _sorted_codes(df['tag_id'].to_numpy())
+        shard_of_row = tag_codes % shard_count
+    elif partition_by == 'time':
+        bins, _ = assign_interval_bins(_epoch_ms(df['datetime']), interval_minutes, origin_ms)
+        # 行数の分位点を区間の境界に合わせて区切る (同じ区間は必ず同じシャード)
+        cut_bins = np.unique(np.quantile(bins, np.arange(1, shard_count) / shard_count, method='lower'))
+        shard_of_row = np.searchsorted(cut_bins, bins, side='right')
+    else:
+        raise ValueError(f"不明な分割方法 '{partition_by}' です。'tag' または 'time' を指定してください。")
+    order = np.argsort(shard_of_row, kind='stable')
+    boundaries = np.searchsorted(shard_of_row[order], np.arange(1, shard_count))
+    return [rows for rows in np.split(order, boundaries) if len(rows)]
+
+
+def closest_node_per_interval_parallel(df, interval_minutes, method='max', max_workers=None,
+                                       partition_by='tag'):
+    """
+    closest_node_per_interval を、df をシャードに分けて複数のプロセスで並列に計算します。
+    (区間, タグ) のグループはシャードをまたがないため、結果は closest_node_per_interval と同じです。
+    partition_by には 'tag' (tag_id ごと) または 'time' (時間の範囲ごと) を指定します。
+    max_workers を省略した場合は CPU のコア数です。結果はシャードの順ではなく datetime, tag_id の昇順に並べて返します。
+    """
+    if method not in AGGREGATION_METHODS:
+        raise ValueError(
+            f"不明な集計方法 '{method}' です。'max', 'mean', 'sum'のいずれかを指定してください。")
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers <= 1 or df.empty:
+        return closest_node_per_interval(df, interval_minutes, method)
+
+    # 区間の起点は全体で共通にする
+    _, origin_ms = assign_interval_bins(_epoch_ms(df['datetime']), interval_minutes)
+    shards = _split_shards(df, interval_minutes, max_workers * SHARDS_PER_WORKER, partition_by, origin_ms)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(
+            closest_node_per_interval, (df.iloc[rows] for rows in shards),
+            repeat(interval_minutes), repeat(method), repeat(origin_ms)))
+
+    result = pd.concat(results, ignore_index=True)
+    if partition_by == 'time':
+        # 時間で区切ったシャードは、シャードの順に連結すればそのまま datetime, tag_id の昇順になる
+        return result
+    result_order = np.lexsort((result['tag_id'].to_numpy(), _epoch_ms(result['datetime'])))
+    return result.iloc[result_order].reset_index(drop=True)
+
+
+def _rollup_part(df, origin_ms):
+    """時刻順の生データ (区間が確定した行) から、(1分, タグ, ノード) ごとのロールアップを作ります。"""
+    epoch_ms = _epoch_ms(df['datetime'])
+    bins, _ = assign_interval_bins(epoch_ms, ROLLUP_BASE_MINUTES, origin_ms)
+    tag_codes, tag_uniques = _sorted_codes(df['tag_id'].to_numpy())
+    node_codes, node_uniques = _sorted_codes(df['node_id'].to_numpy())
+    rssi = df['tag_rssi'].to_numpy()
+
+    cell_ids, cell_keys = pd.factorize(
+        (bins * len(tag_uniques) + tag_codes) * len(node_uniques) + node_codes)
+    # 最大値を記録した行は、同じ値なら先に現れた行 (従来の idxmax と同じ)
+    max_row, _ = _argmax_per_group(rssi, cell_ids, len(cell_keys), np.arange(len(df)))
+    sums = np.bincount(cell_ids, weights=rssi, minlength=len(cell_keys))
+    counts = np.bincount(cell_ids, minlength=len(cell_keys))
+
+    order = np.argsort(cell_keys, kind='stable')
+    cell_keys = cell_keys[order]
+    max_row = max_row[order]
+    group_keys = cell_keys // len(node_uniques)
+    if 'tag_volt' in df.columns:
+        max_volt = df['tag_volt'].to_numpy()[max_row]
+    else:
+        max_volt = np.zeros(len(order), dtype='uint16')
+    return pd.DataFrame({
+        'minute': origin_ms + (group_keys // len(tag_uniques)) * ROLLUP_BASE_MINUTES * MS_PER_MINUTE,
+        'tag_id': tag_uniques[group_keys % len(tag_uniques)],
+        'node_id': node_uniques[cell_keys % len(node_uniques)],
+        'rssi_max': rssi[max_row],
+        'rssi_sum': sums[order].round().astype('int64'),
+        'count': counts[order].astype('int64'),
+        'max_datetime': epoch_ms[max_row],
+        'max_volt': max_volt,
+    })
+
+
+def build_rollup(chunks):
+    """
+    時刻順の生データのチャンク (compact 型) から、(1分, タグ, ノード) ごとのロールアップを作ります。
+    列は minute (1分の区間の開始, エポックミリ秒), tag_id, node_id, rssi_max, rssi_sum, count,
+    max_datetime / max_volt (rssi_max を記録した読み取りの時刻と電圧) です。
+    ROLLUP_BASE_MINUTES の倍数の任意の間隔の結果を、closest_node_from_rollup で生データを読み直さずに求められます。
+    チャンクの境界の1分は次のチャンクに持ち越すため、どのように分けて渡しても結果は同じです。
+    """
+    parts = [_rollup_part(part, origin_ms)
+             for part, origin_ms in _iter_finished_parts(chunks, ROLLUP_BASE_MINUTES)]
+    if not parts:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    return pd.concat(parts, ignore_index=True)
+
+
+def closest_node_from_rollup(rollup, interval_minutes, method='max'):
+    """
+    build_rollup のロールアップから、closest_node_per_interval と同じ結果を求めます。
+    interval_minutes は ROLLUP_BASE_MINUTES の倍数である必要があります。
+    'max' の場合の列は datetime, node_id, tag_id, tag_rssi, tag_volt (compact 型) です。
+    (生データが時刻順に並んでいれば、同じ値が複数ある場合の選び方も従来と同じです)
+    """
+    if method not in AGGREGATION_METHODS:
+        raise ValueError(
+            f"不明な集計方法 '{method}' です。'max', 'mean', 'sum'のいずれかを指定してください。")
+    if interval_minutes % ROLLUP_BASE_MINUTES != 0:
+        raise ValueError(
+            f"ロールアップから計算できる間隔は {ROLLUP_BASE_MINUTES} 分の倍数だけです: {interval_minutes}")
+    if rollup.empty:
+        return pd.DataFrame(columns=(list(RAW_RESULT_COLUMNS) if method == 'max'
+                                     else ['datetime', 'tag_id', 'node_id', 'tag_rssi']))
+
+    # 起点 (最初の時刻の日の 0:00) は生データから求めた場合と同じになる
+    bins, origin_ms = assign_interval_bins(rollup['minute'].to_numpy(), interval_minutes)
+    tag_codes, tag_uniques = _sorted_codes(rollup['tag_id'].to_numpy())
+    group_ids, group_count, is_ordered = _group_ids(bins, tag_codes, len(tag_uniques))
+
+    if method == 'max':
+        # rssi_max が最大のセルのうち、その読み取りが最も早いセルを選ぶ
+        max_datetime = rollup['max_datetime'].to_numpy()
+        by_time = np.argsort(max_datetime, kind='stable')
+        time_rank = np.empty(len(by_time), dtype='int64')
+        time_rank[by_time] = np.arange(len(by_time))
+        chosen_rank, _ = _argmax_per_group(
+            rollup['rssi_max'].to_numpy(), group_ids, group_count, time_rank)
+        selected = by_time[chosen_rank[chosen_rank < len(by_time)]]
+        selected = selected[np.lexsort((tag_codes[selected], max_datetime[selected]))]
+        picked = rollup.iloc[selected]
+        return pd.DataFrame({
+            'datetime': picked['max_datetime'].to_numpy(),
+            'node_id': picked['node_id'].to_numpy(),
+            'tag_id': picked['tag_id'].to_numpy(),
+            'tag_rssi': picked['rssi_max'].to_numpy(),
+            'tag_volt': picked['max_volt'].to_numpy(),
+        })
+
+    return _select_by_totals(
+        bins, origin_ms, interval_minutes, tag_codes, tag_uniques, group_ids, group_count, is_ordered,
+        rollup['node_id'].to_numpy(), rollup['rssi_sum'].to_numpy(), rollup['count'].to_numpy(),
+        method, True)
+
+
+def input_signature(paths):
+    """入力ファイルの (パス, サイズ, 更新時刻) のリストを返します。ロールアップを作り直す必要があるかの判定に使います。"""
+    signature = []
+    for path in sorted(paths):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+    return signature
+
+
+def save_rollup(rollup, path, signature):
+    """ロールアップを Parquet で保存し、作成に使った入力の情報 (signature) を '<path>.json' に保存します。"""
+    rollup.to_parquet(path, index=False)
+    with open(f"{path}.json", 'w', encoding='utf-8') as f:
+        json.dump({'signature': signature,
+                   'created_at': datetime.now().isoformat(timespec='seconds')}, f, ensure_ascii=False, indent=2)
+
+
+def load_rollup(path, signature):
+    """保存済みのロールアップを読み込みます。ない場合や入力 (signature) が変わっている場合は None を返します。"""
+    if not (os.path.exists(path) and os.path.exists(f"{path}.json")):
+        return None
+    try:
+        with open(f"{path}.json", 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if saved.get('signature') != signature:
+        return None
+    return pd.read_parquet(path)
+
+
+def closest_node_per_interval_groupby(df, interval_minutes, method='max'):
+    """
+    従来の groupby + idxmax による処理です。(closest_node_per_interval の結果の確認と速度比較に使います)
+    df の datetime 列は datetime64 である必要があります。
+    """
+    grouper = pd.Grouper(key='datetime', freq=f'{interval_minutes}min')
+    if method == 'max':
+        max_rssi_indices = df.groupby([grouper, 'tag_id'])['tag_rssi'].idxmax()
+        analyzed_df = df.loc[max_rssi_indices]
+    elif method in ('mean', 'sum'):
+        rssi_df = df.groupby([grouper, 'tag_id', 'node_id'])['tag_rssi'].agg(method).reset_index()
+        max_indices = rssi_df.groupby(['datetime', 'tag_id'])['tag_rssi'].idxmax()
+        analyzed_df = rssi_df.loc[max_indices]
+    else:
+        raise ValueError(
+            f"不明な集計方法 '{method}' です。'max', 'mean', 'sum'のいずれかを指定してください。")
+    return analyzed_df.sort_values(by=['datetime', 'tag_id']).reset_index(drop=True)
@@ -0,0 +1,313 @@
+'''
+ID の正規化と、ID をキーにした属性 (場所名・タグ名など) の付与を行うモジュール
+
+node_names.csv / tag_names.csv のような「ID → 属性」の表 (ディメンション) を、
+pd.merge の代わりに表の行番号 (整数のコード) と np.take で結合します。
+ID の正規化や表の検索はユニークな値に対してだけ行い、行ごとの処理は配列の添字参照だけになるため、
+数千万行のデータでも速く、結合のために DataFrame 全体をコピーすることもありません。
+    df = dimensions.attach_attributes(df, 'node_id', node_names_df)
+
+また、ノード・場所・タグ・部門の値に全スクリプト共通の整数コードを割り当てる登録簿 (REGISTRY_FILE) を管理します。
+登録簿は追記のみで、一度割り当てたコードは変わりません。解析結果の CSV を読み込む各スクリプトは
+read_enriched_csv でこれらの列をカテゴリ型 (コード = 登録簿の位置) として読み込み、
+文字列ではなく小さな整数でグループ化します。(group_size / with_label_index で結果を元の文字列に戻します)
+登録簿に書き込むのは解析結果を作るスクリプト (update_registry) だけで、読み込む側 (categorize) は書き込みません。
+(pipeline.py で集計スクリプトを並列に実行しても、登録簿を同時に書き換えないため)
+'''
+
+
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# ----------------------------------------------------------------------
+# 設定項目
+# ----------------------------------------------------------------------
+# 登録簿の保存先 (このファイルと同じ階層)
+REGISTRY_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'dimension_registry.json')
+
+# 登録簿を更新する時のロックを待つ時間の上限 (秒)。これより古いロックは中断したプロセスのものとみなして削除します
+REGISTRY_LOCK_TIMEOUT_SECONDS = 60
+# ----------------------------------------------------------------------
+
+# 登録簿でコードを管理する列 (ノード・場所・タグ・部門)
+DIMENSION_COLUMNS = ['node_id', 'place_name', 'tag_id', 'tag_name', 'department']
+
+
+def normalize_id(value):
+    """
+    1つの ID をきれいな文字列にします。
+    ("697.0" のような浮動小数点表記は "697" に戻し、前後の空白は削除します)
+    """
+    text = str(value)
+    if '.' in text:
+        text = text.split('.')[0]
+    return text.strip()
+
+
+def normalize_ids(values):
+    """
+    ID の配列を正規化し、(行ごとのコード, コードに対応する正規化後の ID) を返します。
+    ID の種類は行数に比べて少ないため、ユニークな値だけを正規化します。
+    """
+    codes, uniques = pd.factorize(pd.Series(values, copy=False), use_na_sentinel=False)
+    labels = np.array([normalize_id(u) for u in uniques], dtype=object)
+    return codes, labels
+
+
+def normalize_id_column(values):
+    """
+    ID の列を正規化した文字列の配列を返します。(clean_id_column を行ごとに処理せずに行うもの)
+    文字列の型は astype(str) と同じです。
+    """
+    codes, labels = normalize_ids(values)
+    return _expand_labels(codes, labels)
+
+
+def _expand_labels(codes, labels):
+    return pd.Index(labels).take(codes).array
+
+
+def _label_positions(labels, table_keys):
+    """正規化した ID のそれぞれが、表のキー table_keys の何行目にあたるかを返します。(見つからない ID は -1)"""
+    table_labels = pd.Index(np.asarray(normalize_id_column(table_keys), dtype=object))
+    if not table_labels.is_unique:
+        duplicated = table_labels[table_labels.duplicated()].unique().tolist()
+        logging.warning(f"表に重複したキーがあります。最初の行を使います: {duplicated[:5]}")
+    first_rows = np.flatnonzero(~table_labels.duplicated())
+    positions = pd.Index(table_labels[first_rows]).get_indexer(labels)
+    return np.where(positions >= 0, first_rows[np.maximum(positions, 0)], -1)
+
+
+def lookup_positions(values, table_keys):
+    """
+    ID の配列の各行が、表のキー table_keys の何行目にあたるかを返します (見つからない行は -1)。
+    どちらの ID も正規化してから比較します。表に同じキーが複数ある場合は最初の行を使います。
+    """
+    codes, labels = normalize_ids(values)
+    return _label_positions(labels, table_keys)[codes]
+
+
+def take_column(column, positions):
+    """
+    表の列 column から positions の行 (-1 は欠損) の値を取り出します。
+    欠損がある場合の型は pd.merge (how='left') と同じです。(整数の列は float64 になります)
+    """
+    values = column.to_numpy() if isinstance(column.dtype, np.dtype) else column.array
+    return pd.Series(pd.api.extensions.take(values, positions, allow_fill=True), name=column.name)
+
+
+def attach_attributes(df, key_col, table, table_key_col=None):
+    """
+    df[key_col] の ID をキーにして、表 table のキー以外の列を df に追加します。
+    (pd.merge(df, table, on=key_col, how='left') と同じ列・値になります。df[key_col] は正規化した文字列にします)
+    df に同じ名前の列がある場合は表の値で上書きします。列を追加した df を返します。
+    """
+    table_key_col = table_key_col or key_col
+    codes, labels = normalize_ids(df[key_col].to_numpy())
+    positions = _label_positions(labels, table[table_key_col].to_numpy())[codes]
+    df[key_col] = _expand_labels(codes, labels)
+    for col in table.columns:
+        if col == table_key_col:
+            continue
+        taken = take_column(table[col], positions)
+        taken.index = df.index
+        df[col] = taken
+    return df
+
+
+def load_registry(path=None):
+    """登録簿を読み込み、{列名: [値, ...]} (リストの位置がコード) を返します。ない場合は空の登録簿を返します。"""
+    registry = {col: [] for col in DIMENSION_COLUMNS}
+    path = path or REGISTRY_FILE
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            registry.update(json.load(f))
+    return registry
+
+
+def save_registry(registry, path=None):
+    """
+    登録簿を保存します。書き込み途中のファイルが残らないよう、同じフォルダの一時ファイル
+    (プロセスごとに別の名前) に書いてから置き換えます。
+    """
+    path = path or REGISTRY_FILE
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(registry, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def registry_lock(path=None):
+    """
+    登録簿の読み込みから保存までを、他のプロセスと同時に行わないためのロックです。
+    (<登録簿>.lock ファイルを作れたプロセスだけが更新します)
+    """
+    lock_path = f"{path or REGISTRY_FILE}.lock"
+    started = time.monotonic()
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > REGISTRY_LOCK_TIMEOUT_SECONDS:
+                    logging.warning(f"古いロック '{lock_path}' を削除します。")
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() - started > REGISTRY_LOCK_TIMEOUT_SECONDS:
+                raise TimeoutError(f"登録簿のロック '{lock_path}' を取得できませんでした。")
+            time.sleep(0.05)
+    try:
+        os.close(fd)
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+
+def _register(registry, col, labels):
+    """登録簿にない値を (文字列の昇順で) 末尾に追加します。追加した場合は True を返します。"""
+    known = set(registry[col])
+    new_labels = sorted({str(label) for label in labels if pd.notna(label)} - known)
+    registry[col].extend(new_labels)
+    return bool(new_labels)
+
+
+def update_registry(df, path=None):
+    """
+    df の DIMENSION_COLUMNS の値のうち、登録簿にないものを追加して保存します。
+    (解析結果を作るスクリプトが呼び出します。ロックを取ってから最新の登録簿に追加するため、同時に呼び出しても値は失われません)
+    """
+    labels = {col: pd.unique(df[col].to_numpy()) for col in DIMENSION_COLUMNS if col in df.columns}
+    registry = load_registry(path)
+    if not any(_has_new_labels(registry, col, values) for col, values in labels.items()):
+        return registry
+    with registry_lock(path):
+        registry = load_registry(path)
+        changed = False
+        for col, values in labels.items():
+            changed |= _register(registry, col, values)
+        if changed:
+            save_registry(registry, path)
+    return registry
+
+
+def _has_new_labels(registry, col, labels):
+    known = set(registry[col])
+    return any(str(label) not in known for label in labels if pd.notna(label))
+
+
+def categorize(df, path=None):
+    """
+    df の DIMENSION_COLUMNS の列を、登録簿の値をカテゴリ (コード = 登録簿の位置) とするカテゴリ型にします。
+    登録簿は読み込むだけで保存しません。登録簿にない値は、このプロセスの中だけで登録簿の値の後ろにカテゴリとして追加します。
+    列を置き換えた df を返します。
+    """
+    columns = [col for col in DIMENSION_COLUMNS if col in df.columns]
+    if not columns:
+        return df
+    registry = load_registry(path)
+    for col in columns:
+        series = df[col]
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype('category')
+        if not pd.api.types.is_string_dtype(series.cat.categories):
+            series = series.cat.rename_categories([str(c) for c in series.cat.categories])
+        if _register(registry, col, series.cat.categories):
+            logging.info(f"{col} に登録簿にない値があります。(登録簿は解析結果の作成時に update_registry で更新されます)")
+        # カテゴリの並べ替えだけで済むため、行ごとの文字列の比較は行わない
+        df[col] = series.cat.set_categories(registry[col])
+    return df
+
+
+def read_enriched_csv(path, registry_path=None, **kwargs):
+    """
+    解析結果の CSV (closest_node_per_interval_with_names.csv) を読み込み、
+    DIMENSION_COLUMNS の列を登録簿のコードを持つカテゴリ型にして返します。kwargs は pd.read_csv に渡します。
+    """
+    dtype = {col: 'category' for col in DIMENSION_COLUMNS}
+    dtype.update(kwargs.pop('dtype', None) or {})
+    df = pd.read_csv(path, dtype=dtype, **kwargs)
+    return categorize(df, registry_path)
+
+
+def with_label_index(result):
+    """
+    カテゴリ型の列でグループ化した結果の index を元の値 (文字列) に戻し、昇順に並べ替えます。
+    (文字列の列でグループ化した場合と同じ順序になります)
+    """
+    index = result.index
+    if isinstance(index, pd.MultiIndex):
+        levels = [pd.Index(np.asarray(index.get_level_values(i)), name=name)
+                  for i, name in enumerate(index.names)]
+        result.index = pd.MultiIndex.from_arrays(levels)
+    else:
+        result.index = pd.Index(np.asarray(index), name=index.name)
+    return result.sort_index()
+
+
+def group_size(df, keys, dropna=True):
+    """
+    df.groupby(keys).size() と同じ結果 (キーは元の値、昇順) を返します。
+    各列を整数のコード (カテゴリ型はそのコード、それ以外は factorize) にして1つの整数キーにまとめ、
+    np.bincount で数えます。元の値に戻して並べ替えるのは集計後の小さな結果だけです。
+    dropna=False の場合は、欠損値も1つのキー (NaN、最後に並ぶ) として数えます。
+    """
+    keys = [keys] if isinstance(keys, str) else list(keys)
+    codes_list, uniques_list = [], []
+    for key in keys:
+        column = df[key]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            codes, uniques = column.cat.codes.to_numpy().astype('int64'), column.cat.categories
+        else:
+            codes, uniques = pd.factorize(column)
+        uniques = pd.Index(uniques)
+        if not dropna and (codes < 0).any():
+            # 欠損値に最後のコードを割り当てる
+            codes = np.where(codes < 0, len(uniques), codes)
+            uniques = pd.Index(list(uniques) + [np.nan])
+        codes_list.append(codes)
+        uniques_list.append(uniques)
+
+    sizes = [max(len(u), 1) for u in uniques_list]
+    if np.prod(sizes, dtype='float64') >= 2 ** 62:
+        # 組み合わせの数が整数に収まらない場合は groupby で数える
+        return with_label_index(df.groupby(keys, observed=True, sort=False, dropna=dropna).size())
+
+    # 欠損値 (コード -1) を含む行は groupby と同じく数えない
+    valid = np.logical_and.reduce([codes >= 0 for codes in codes_list])
+    combined = np.zeros(int(valid.sum()), dtype='int64')
+    for codes, size in zip(codes_list, sizes):
+        combined = combined * size + codes[valid]
+    group_ids, group_keys = pd.factorize(combined)
+    counts = np.bincount(group_ids, minlength=len(group_keys)).astype('int64')
+
+    levels = []
+    for uniques, size in zip(reversed(uniques_list), reversed(sizes)):
+        group_keys, level_codes = np.divmod(group_keys, size)
+        levels.append(uniques.take(level_codes))
+    levels.reverse()
+    if len(keys) == 1:
+        index = levels[0].rename(keys[0])
+    else:
+        index = pd.MultiIndex.from_arrays(levels, names=keys)
+    return with_label_index(pd.Series(counts, index=index))
@@ -1,4 +1,27 @@
+import sys
 import pandas as pd
+import raw_store
+import tag_schema
+
+
+def load_latest_raw_data(tag_ids):
+    """
+    raw_store を新しい日付から順に読み込み、tag_ids のすべてのタグが見つかった時点で読み込みを止めます。
+    (各タグの最新の1行を求めるだけなので、全期間を読み込む必要はありません)
+    """
+    remaining = set(tag_schema.pack_tag_ids(pd.Series(tag_ids)))
+    frames = []
+    for date in reversed(raw_store.list_partitions()):
+        # compact 型のまま読み込み、各タグの最新の1行だけを残す
+        df_day = raw_store.read_raw_data(
+            date, date, columns=['datetime', 'tag_id', 'tag_volt'], compact=True)
+        frames.append(df_day.sort_values('datetime').drop_duplicates('tag_id', keep='last'))
+        remaining -= set(df_day['tag_id'].unique())
+        if not remaining:
+            break
+    if not frames:
+        return pd.DataFrame(columns=['datetime', 'tag_id', 'tag_volt'])
+    return tag_schema.from_compact(pd.concat(frames, ignore_index=True))
 
 
 def merge_latest_tag_data():
@@ -9,8 +32,14 @@ def merge_latest_tag_data():
     try:
         # --- 1. CSVファイルの読み込み ---
         tag_names_df = pd.read_csv('tag_names.csv')
-        processed_tag_data_df = pd.read_csv('processed_tag_data.csv')
-        print("CSVファイルの読み込みが完了しました。")
+        if raw_store.has_data():
+            # raw_store があれば、最新の日付から必要な分だけ読み込む
+            processed_tag_data_df = load_latest_raw_data(
+                tag_names_df['tag_id'].astype(str))
+            print("raw_store からの読み込みが完了しました。")
+        else:
+            processed_tag_data_df = pd.read_csv('processed_tag_data.csv')
+            print("CSVファイルの読み込みが完了しました。")
 
         # --- 2. 最新のデータのみを抽出 ---
         # 'datetime'列をdatetime型に変換（エラーは無視）
@@ -42,9 +71,13 @@ def merge_latest_tag_data():
     except FileNotFoundError as e:
         print(f"エラー: ファイルが見つかりません。")
         print(f"'{e.filename}' が、このスクリプトと同じディレクトリに存在することを確認してください。")
+        return False
     except Exception as e:
         print(f"予期せぬエラーが発生しました: {e}")
+        return False
 
 
 if __name__ == '__main__':
-    merge_latest_tag_data()
+    # エラーで終了した場合は終了コード 1 を返す (pipeline.py が失敗として扱う)
+    if merge_latest_tag_data() is False:
+        sys.exit(1)
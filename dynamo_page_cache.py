@@ -0,0 +1,192 @@
+'''
+DynamoDB から取得したページ (アイテムのリスト) をそのままローカルに保存するキャッシュ
+
+保存先の構成:
+    dynamo_page_cache/table=mmms_rowdata/bukken=tama_b/<開始>_<終了>.jsonl.gz
+
+キーは (テーブル名, 物件, 期間) で、1つの期間のページを gzip 圧縮した JSON Lines (1行 = 1ページ) として保存します。
+get_dynamo_data.py の parallel モードがシャード (期間) ごとに書き込み・読み込みます。
+保存済みのページは get_dynamo_data.py の OFFLINE_FROM_CACHE = True で、DynamoDB に接続せずに再処理できます。
+(rowdata から新しい項目を取り出したくなった場合などに、DynamoDB から取り直す必要がありません)
+
+キャッシュの合計サイズが CACHE_MAX_BYTES を超えると、最後に使われた日時が古いものから削除します。
+    python dynamo_page_cache.py          保存済みの期間とサイズを表示
+    python dynamo_page_cache.py clear    すべて削除
+'''
+
+
+import glob
+import gzip
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from decimal import Decimal
+
+# ----------------------------------------------------------------------
+# 設定項目
+# ----------------------------------------------------------------------
+# 保存先フォルダ (このファイルと同じ階層)
+CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'dynamo_page_cache')
+
+# キャッシュの合計サイズの上限 (バイト)。超えた分は古いものから削除します
+CACHE_MAX_BYTES = 5 * 1024 ** 3
+
+# gzip の圧縮レベル (1: 速い 〜 9: 小さい)
+COMPRESS_LEVEL = 6
+# ----------------------------------------------------------------------
+
+CACHE_SUFFIX = '.jsonl.gz'
+
+
+def _window_dir(table_name, bukken, cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, f"table={table_name}", f"bukken={bukken}")
+
+
+def _window_name(start_datetime, end_datetime):
+    """期間をファイル名に使える文字列にします。('2026/02/10 09:18:18.000' -> '20260210T091818000')"""
+    def to_name(value):
+        return value.replace('/', '').replace(':', '').replace('.', '').replace(' ', 'T')
+    return f"{to_name(start_datetime)}_{to_name(end_datetime)}"
+
+
+def _window_from_name(name):
+    """ファイル名から期間 (開始, 終了) の文字列を復元します。"""
+    def from_name(value):
+        return datetime.strptime(value, '%Y%m%dT%H%M%S%f').strftime('%Y/%m/%d %H:%M:%S.%f')[:-3]
+    start, end = name[:-len(CACHE_SUFFIX)].split('_')
+    return from_name(start), from_name(end)
+
+
+def cache_path(table_name, bukken, start_datetime, end_datetime, cache_dir=None):
+    """期間に対応するキャッシュファイルのパスを返します。"""
+    return os.path.join(_window_dir(table_name, bukken, cache_dir),
+                        _window_name(start_datetime, end_datetime) + CACHE_SUFFIX)
+
+
+def _json_default(value):
+    # boto3 は数値を Decimal で返すため、JSON に保存できる型に変換する
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"JSONに変換できない型です: {type(value)}")
+
+
+def load_pages(table_name, bukken, start_datetime, end_datetime, cache_dir=None):
+    """
+    期間のページをキャッシュから読み込み、ページのリストを返します。
+    キャッシュがない場合や読み込めない場合は None を返します。
+    """
+    path = cache_path(table_name, bukken, start_datetime, end_datetime, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            pages = [json.loads(line) for line in f if line.strip()]
+    except (OSError, EOFError, ValueError) as e:
+        logging.warning(f"キャッシュ '{path}' を読み込めませんでした。DynamoDB から取得し直します: {e}")
+        return None
+    # 最後に使われた日時として更新時刻を更新する (削除の順番に使う)
+    os.utime(path, None)
+    return pages
+
+
+def save_pages(table_name, bukken, start_datetime, end_datetime, pages, cache_dir=None):
+    """
+    期間のページをキャッシュに保存し、合計サイズが上限を超えていれば古いものを削除します。
+    書き込み途中のファイルが残らないよう、一時ファイルに書いてから置き換えます。
+    """
+    path = cache_path(table_name, bukken, start_datetime, end_datetime, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=COMPRESS_LEVEL) as f:
+        for page in pages:
+            f.write(json.dumps(page, ensure_ascii=False, default=_json_default))
+            f.write('\n')
+    os.replace(tmp_path, path)
+    evict(cache_dir=cache_dir, keep=path)
+
+
+def _cache_files(cache_dir=None):
+    return glob.glob(os.path.join(cache_dir or CACHE_DIR, 'table=*', 'bukken=*', '*' + CACHE_SUFFIX))
+
+
+def evict(max_bytes=None, cache_dir=None, keep=None):
+    """
+    キャッシュの合計サイズが max_bytes (既定は CACHE_MAX_BYTES) 以下になるまで、
+    最後に使われた日時が古いファイルから削除します。keep に指定したファイルは削除しません。
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    files = [(os.path.getmtime(p), os.path.getsize(p), p) for p in _cache_files(cache_dir)]
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        os.remove(path)
+        total -= size
+        logging.info(f"キャッシュの上限を超えたため '{path}' を削除しました。")
+    return total
+
+
+def list_windows(table_name, bukken, cache_dir=None):
+    """保存済みの期間 (開始, 終了) を開始の昇順で返します。"""
+    base = _window_dir(table_name, bukken, cache_dir)
+    names = [os.path.basename(p) for p in glob.glob(os.path.join(base, '*' + CACHE_SUFFIX))]
+    return sorted(_window_from_name(name) for name in names)
+
+
+def iter_cached_pages(table_name, bukken, start_datetime, end_datetime, cache_dir=None):
+    """
+    start_datetime 〜 end_datetime に含まれるアイテムを、保存済みの期間から datetime 順にページ単位で返します。
+    期間が重なって保存されている場合も、同じアイテムを2回返すことはありません。
+    保存されていない期間があれば警告を出します (その期間のデータは含まれません)。
+    """
+    last_datetime = None
+    covered_until = start_datetime
+    for window_start, window_end in list_windows(table_name, bukken, cache_dir):
+        if window_end < start_datetime or window_start > end_datetime:
+            continue
+        if window_start > covered_until:
+            logging.warning(f"キャッシュにない期間があります: {covered_until} 〜 {window_start}")
+        covered_until = max(covered_until, window_end)
+
+        for page in load_pages(table_name, bukken, window_start, window_end, cache_dir) or []:
+            items = [item for item in page
+                     if start_datetime <= item.get('datetime', '') <= end_datetime
+                     and (last_datetime is None or item['datetime'] > last_datetime)]
+            if items:
+                last_datetime = items[-1]['datetime']
+                yield items
+
+    if covered_until < end_datetime:
+        logging.warning(f"キャッシュにない期間があります: {covered_until} 〜 {end_datetime}")
+
+
+def clear(cache_dir=None):
+    """キャッシュをすべて削除します。"""
+    files = _cache_files(cache_dir)
+    for path in files:
+        os.remove(path)
+    logging.info(f"キャッシュを {len(files)} ファイル削除しました。")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if len(sys.argv) == 2 and sys.argv[1] == 'clear':
+        clear()
+    else:
+        files = _cache_files()
+        total = sum(os.path.getsize(p) for p in files)
+        print(f"キャッシュ: {len(files)} ファイル / {total / 1024 ** 2:.1f} MB (上限 {CACHE_MAX_BYTES / 1024 ** 2:.0f} MB)")
+        for table_dir in sorted(glob.glob(os.path.join(CACHE_DIR, 'table=*', 'bukken=*'))):
+            table_name = os.path.basename(os.path.dirname(table_dir))[len('table='):]
+            bukken = os.path.basename(table_dir)[len('bukken='):]
+            windows = list_windows(table_name, bukken)
+            if windows:
+                print(f"  {table_name} / {bukken}: {windows[0][0]} 〜 {windows[-1][1]} ({len(windows)} 期間)")
+        print("使い方: python dynamo_page_cache.py / python dynamo_page_cache.py clear")
@@ -1,11 +1,25 @@
 import boto3
 import pandas as pd
 from boto3.dynamodb.conditions import Key
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
 from dotenv import load_dotenv
 import os
+import sys
 import logging
 import json  # JSONを扱うために追加
+import gc
 import time
+import random
+import threading
+import raw_store
+import dynamo_page_cache
+import run_report
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 # ----------------------------------------------------------------------
 # 設定項目 (データを取得したい条件に合わせてここを編集してください)
@@ -23,87 +37,576 @@ START_DATETIME = '2026/02/10 09:18:18.000'
 # 取得したい期間の終了日時 (YYYY/MM/DD HH:MM:SS.ms)
 END_DATETIME = '2029/01/01 00:00:00.000'
 
+# DynamoDB の datetime のタイムゾーン (END_DATETIME が未来の場合に、この時刻の「現在」までを取得します。
+# 実行するPCのタイムゾーンには依存しません)
+DATA_TIMEZONE = 'Asia/Tokyo'
+
 # 出力するCSVファイル名
 OUTPUT_CSV_FILE = 'processed_tag_data.csv'
 
+# True の場合、CSVとあわせて日付ごとの Parquet (raw_store フォルダ) にも保存します
+# (analyze_closest_nodeANDexcel.py などの分析スクリプトはこちらを読み込みます)
+WRITE_RAW_STORE = True
+
+# ページ間の待機時間 (秒) の初期値。以降は消費キャパシティとスロットリングに応じて自動調整します
 time_sleep_second = 0.5
+
+# 自動調整する待機時間の下限・上限 (秒)
+MIN_SLEEP_SECOND = 0.0
+MAX_SLEEP_SECOND = 20.0
+
+# 目標とする読み込みキャパシティ (RCU/秒)。None の場合はスロットリングが起きるまで少しずつ速くします
+TARGET_RCU_PER_SECOND = None
+
+# スロットリングや一時的なエラーで失敗したページを再試行する回数
+MAX_PAGE_RETRIES = 8
+
+# 取得スループット (RCU/秒, 件数/秒, バイト/秒) をログに出す間隔 (秒)
+METRICS_LOG_INTERVAL_SECOND = 30
+
+# 取得モード ('serial': 逐次取得, 'parallel': 期間を分割して並列取得)
+# (serial でも USE_PAGE_CACHE が True の場合は、キャッシュを使えるよう期間を分割して1本ずつ取得します)
+FETCH_MODE = 'serial'
+
+# 期間を分割する単位 (時間)
+# datetime はソートキーなので、分割した期間ごとに独立してクエリできます
+# 分割の境界は 2000/01/01 0時から SHARD_HOURS 時間ごとの固定の時刻にするため、取得の開始日時が変わっても
+# 同じ期間のシャードは同じ境界になり、キャッシュを使い回せます
+SHARD_HOURS = 24
+
+# parallel モードで同時に取得するシャード数 (ワーカー数)
+MAX_WORKERS = 4
+
+# DynamoDB Local などの代替エンドポイント (動作確認用。通常は None のまま)
+DYNAMODB_ENDPOINT_URL = None
+
+# CSVへ書き出す単位 (行数)。取得したページを整形しながら、この行数ごとに追記します
+CSV_CHUNK_ROWS = 100000
+
+# 取得済みの位置 (物件ごとの最大 datetime と LastEvaluatedKey) を記録するファイル
+CHECKPOINT_FILE = 'dynamo_checkpoint.json'
+
+# True の場合、チェックポイントより前のデータは再取得せず、続きから取得して OUTPUT_CSV_FILE に追記します
+# (中断した取得の再開にも使われます。期間を指定し直して取り直したい場合は False にします)
+# チェックポイントが別の出力ファイルのものの場合や、START_DATETIME より前で止まっている場合、
+# OUTPUT_CSV_FILE がない場合は追記せず、START_DATETIME から取得し直して OUTPUT_CSV_FILE を作り直します
+INCREMENTAL = True
+
+# True の場合、取得したシャードごとのページを dynamo_page_cache フォルダに圧縮して保存し、
+# 次回以降、同じ期間のシャードは DynamoDB ではなくキャッシュから読み込みます
+# (保存先・サイズの上限は dynamo_page_cache.py で設定します)
+USE_PAGE_CACHE = True
+
+# 終端がこの時間 (分) 以上前のシャードだけをキャッシュします (直近の期間はまだデータが増えるため)
+PAGE_CACHE_MIN_AGE_MINUTES = 60
+
+# True の場合、DynamoDB には接続せず、キャッシュ済みのページから OUTPUT_CSV_FILE を作り直します
+# (rowdata の解析処理を変更して再処理したい場合などに使います。チェックポイントと raw_store は更新しません)
+OFFLINE_FROM_CACHE = False
 # ----------------------------------------------------------------------
 
+# DynamoDB に保存されている datetime の書式
+DYNAMO_DATETIME_FORMAT = '%Y/%m/%d %H:%M:%S.%f'
+
+# シャードの境界の基準時刻 (この時刻から SHARD_HOURS 時間ごとに区切ります)
+SHARD_EPOCH = datetime(2000, 1, 1)
+
+# スロットリングとして扱うエラーコード (待機時間を延ばして再試行)
+THROTTLING_ERROR_CODES = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+}
+
+# 一時的なエラーとして扱うエラーコード (待機時間はそのままで再試行)
+TRANSIENT_ERROR_CODES = {
+    'InternalServerError',
+    'ServiceUnavailable',
+}
+
 # ログ設定
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def get_all_data_from_dynamo():
+def parse_dynamo_datetime(value):
+    """'YYYY/MM/DD HH:MM:SS.mmm' 形式の文字列を datetime に変換します。"""
+    return datetime.strptime(value, DYNAMO_DATETIME_FORMAT)
+
+
+def format_dynamo_datetime(value):
+    """datetime を DynamoDB の datetime と同じ 'YYYY/MM/DD HH:MM:SS.mmm' 形式にします。"""
+    return value.strftime(DYNAMO_DATETIME_FORMAT)[:-3]
+
+
+@lru_cache(maxsize=None)
+def _data_timezone():
+    try:
+        return ZoneInfo(DATA_TIMEZONE)
+    except ZoneInfoNotFoundError:
+        logging.warning(
+            f"タイムゾーン '{DATA_TIMEZONE}' の情報が見つかりません (Windows では pip install tzdata が必要です)。"
+            "END_DATETIME までの期間をそのまま取得し、ページのキャッシュは保存しません。")
+        return None
+
+
+def data_now():
     """
-    DynamoDBから指定された期間のデータを全て取得します。
+    DATA_TIMEZONE の現在時刻を (DynamoDB の datetime と比較できるよう) タイムゾーンなしの datetime で返します。
+    タイムゾーンの情報がない環境では None を返します。
     """
-    # .envファイルから環境変数を読み込む
-    load_dotenv()
+    tz = _data_timezone()
+    return datetime.now(tz).replace(tzinfo=None) if tz is not None else None
 
-    if not all([os.getenv('AWS_ACCESS_KEY_ID'), os.getenv('AWS_SECRET_ACCESS_KEY'), os.getenv('AWS_DEFAULT_REGION')]):
-        logging.error(
-            ".envファイルにAWSの認証情報（AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_DEFAULT_REGION）を設定してください。")
-        return None
 
-    try:
-        dynamodb = boto3.resource('dynamodb')
-        table = dynamodb.Table(TABLE_NAME)
-        logging.info(f"テーブル '{TABLE_NAME}' への接続を試みます。")
+def shard_window(value, shard_hours):
+    """value (datetime) を含む、SHARD_EPOCH から shard_hours 時間ごとに区切った期間 (開始, 終了) を返します。"""
+    step = timedelta(hours=shard_hours)
+    window_start = SHARD_EPOCH + (value - SHARD_EPOCH) // step * step
+    return window_start, window_start + step
 
-        all_items = []
-        exclusive_start_key = None
 
-        logging.info(f"データの取得を開始します。")
-        logging.info(f"PartitionKey (bukken): {PK_VALUE}")
-        logging.info(f"期間 (datetime): {START_DATETIME} から {END_DATETIME}")
+def split_time_shards(start_datetime, end_datetime, shard_hours):
+    """
+    取得期間を shard_hours 時間ごとのシャードに分割します。
+    各シャードは (開始, 終了) の文字列で、隣り合うシャードの境界は同じ値になります。
+    (境界ちょうどのデータは後ろのシャードに含めます。fetch_shard を参照)
+    境界は shard_window の固定の時刻にそろえるため、最初と最後のシャードは shard_hours より短くなることがあります。
+    """
+    start = parse_dynamo_datetime(start_datetime)
+    end = parse_dynamo_datetime(end_datetime)
 
-        while True:
-            query_params = {
-                'KeyConditionExpression': Key('bukken').eq(PK_VALUE) & Key('datetime').between(START_DATETIME, END_DATETIME)
-            }
-            if exclusive_start_key:
-                query_params['ExclusiveStartKey'] = exclusive_start_key
+    shards = []
+    shard_start = start
+    while shard_start < end:
+        shard_end = min(shard_window(shard_start, shard_hours)[1], end)
+        shards.append((format_dynamo_datetime(shard_start),
+                       format_dynamo_datetime(shard_end)))
+        shard_start = shard_end
+
+    if not shards:
+        shards.append((start_datetime, end_datetime))
+    return shards
+
+
+class AdaptivePacer:
+    """
+    ページ間の待機時間を調整するクラスです。
+    並列取得時は全スレッドで1つを共有し、テーブル全体としての読み込み速度を調整します。
+
+    - 成功時: 消費キャパシティが TARGET_RCU_PER_SECOND を超えていれば待機時間を延ばし、
+      そうでなければ少しずつ短くします。
+    - スロットリング時: 待機時間を倍にし、ジッター付きの指数バックオフで同じページを再試行します。
+    あわせて RCU/秒・件数/秒・バイト/秒 を集計し、定期的にログへ出力します。
+    """
 
+    def __init__(self, initial_delay=None, min_delay=None, max_delay=None, target_rcu_per_second=None):
+        self.delay = time_sleep_second if initial_delay is None else initial_delay
+        self.min_delay = MIN_SLEEP_SECOND if min_delay is None else min_delay
+        self.max_delay = MAX_SLEEP_SECOND if max_delay is None else max_delay
+        self.target_rcu_per_second = target_rcu_per_second
+        self._lock = threading.Lock()
+
+        self.started = time.perf_counter()
+        self.total_items = 0
+        self.total_bytes = 0
+        self.total_rcu = 0.0
+        self.throttle_count = 0
+        self._window_started = self.started
+        self._window_rcu = 0.0
+        self._last_log = self.started
+
+    def wait(self):
+        """次のページを取得する前に、現在の待機時間だけ待ちます。"""
+        with self._lock:
+            delay = self.delay
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_success(self, item_count, byte_count, consumed_rcu):
+        """ページの取得に成功したときに呼び出し、集計と待機時間の調整を行います。"""
+        with self._lock:
+            now = time.perf_counter()
+            self.total_items += item_count
+            self.total_bytes += byte_count
+            self.total_rcu += consumed_rcu
+            self._window_rcu += consumed_rcu
+
+            window = now - self._window_started
+            if self.target_rcu_per_second and window > 0 and self._window_rcu / window > self.target_rcu_per_second:
+                self.delay = min(self.max_delay, max(self.delay * 1.5, 0.05))
+            else:
+                self.delay = max(self.min_delay, self.delay * 0.8)
+                if self.delay < 0.01:
+                    self.delay = self.min_delay
+            # 直近の速度で判定するため、集計窓は数秒ごとにリセットする
+            if window > 5:
+                self._window_started = now
+                self._window_rcu = 0.0
+
+            should_log = now - self._last_log >= METRICS_LOG_INTERVAL_SECOND
+            if should_log:
+                self._last_log = now
+        if should_log:
+            self.log_metrics()
+
+    def on_throttle(self, attempt):
+        """
+        スロットリング時に呼び出し、待機時間を延ばした上で、
+        再試行までに待つ秒数 (フルジッター付きの指数バックオフ) を返します。
+        """
+        with self._lock:
+            self.throttle_count += 1
+            self.delay = min(self.max_delay, max(self.delay * 2, 0.1))
+            base = self.delay
+        return random.uniform(0, min(self.max_delay, base * (2 ** attempt)))
+
+    def on_transient_error(self, attempt):
+        """一時的なエラー時に、再試行までに待つ秒数を返します。"""
+        return random.uniform(0, min(self.max_delay, 0.5 * (2 ** attempt)))
+
+    def log_metrics(self, final=False):
+        """累計のスループットをログに出力します。"""
+        with self._lock:
+            elapsed = time.perf_counter() - self.started
+            items, bytes_, rcu = self.total_items, self.total_bytes, self.total_rcu
+            throttles, delay = self.throttle_count, self.delay
+        if elapsed <= 0:
+            return
+        label = "取得スループット (合計)" if final else "取得スループット"
+        logging.info(
+            f"{label}: {rcu / elapsed:.1f} RCU/秒, {items / elapsed:.0f} 件/秒, "
+            f"{bytes_ / elapsed / 1024:.1f} KB/秒 (累計 {items}件, {rcu:.0f} RCU, "
+            f"スロットリング {throttles}回, 現在の待機時間 {delay:.2f}秒)")
+
+
+def _response_bytes(response, items):
+    """レスポンスのサイズ (バイト) を返します。ヘッダーにない場合は rowdata の長さで概算します。"""
+    headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+    content_length = headers.get('content-length')
+    if content_length is not None:
+        return int(content_length)
+    return sum(len(item.get('rowdata') or '') for item in items)
+
+
+def query_page_with_retry(table, query_params, pacer):
+    """
+    1ページ分のクエリを実行します。スロットリングや一時的なエラーの場合は、
+    ExclusiveStartKey を変えずに同じページだけを再試行します。
+    """
+    attempt = 0
+    while True:
+        try:
             response = table.query(**query_params)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code', '')
+            if attempt >= MAX_PAGE_RETRIES or code not in THROTTLING_ERROR_CODES | TRANSIENT_ERROR_CODES:
+                raise
+            if code in THROTTLING_ERROR_CODES:
+                backoff = pacer.on_throttle(attempt)
+            else:
+                backoff = pacer.on_transient_error(attempt)
+            logging.warning(
+                f"{code} が発生しました。{backoff:.1f}秒後に同じページを再試行します。({attempt + 1}/{MAX_PAGE_RETRIES})")
+        except (BotoConnectionError, HTTPClientError) as e:
+            if attempt >= MAX_PAGE_RETRIES:
+                raise
+            backoff = pacer.on_transient_error(attempt)
+            logging.warning(
+                f"通信エラーが発生しました: {e}。{backoff:.1f}秒後に同じページを再試行します。({attempt + 1}/{MAX_PAGE_RETRIES})")
+        else:
             items = response.get('Items', [])
-            if items:
-                all_items.extend(items)
-                logging.info(
-                    f"{len(items)}件のデータを取得しました。(累計: {len(all_items)}件)")
+            consumed = response.get('ConsumedCapacity') or {}
+            pacer.on_success(len(items), _response_bytes(response, items),
+                             float(consumed.get('CapacityUnits', 0) or 0))
+            return response
+        time.sleep(backoff)
+        attempt += 1
 
-            # ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
-            # ここを修正しました (LastEvaluatedKey)
-            exclusive_start_key = response.get('LastEvaluatedKey', None)
-            # ▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲
 
-            if not exclusive_start_key:
-                break
-            else:
-                logging.info(f"次のページを取得します。{time_sleep_second}秒待機...")
-                time.sleep(time_sleep_second)
+_thread_local = threading.local()
 
-        logging.info(f"合計 {len(all_items)} 件の全データ取得が完了しました。")
-        return all_items
 
-    except Exception as e:
-        logging.error(f"DynamoDBからのデータ取得中にエラーが発生しました: {e}")
+def _get_table():
+    """
+    スレッドごとに DynamoDB の Table を作成して返します。
+    (boto3 の resource はスレッド間で共有できないため)
+    """
+    table = getattr(_thread_local, 'table', None)
+    if table is None:
+        endpoint_url = DYNAMODB_ENDPOINT_URL or os.getenv('DYNAMODB_ENDPOINT_URL')
+        session = boto3.session.Session()
+        # 再試行は query_page_with_retry で行うため、boto3 側の自動再試行は無効にする
+        config = Config(retries={'mode': 'standard', 'max_attempts': 1})
+        dynamodb = session.resource('dynamodb', endpoint_url=endpoint_url, config=config)
+        table = dynamodb.Table(TABLE_NAME)
+        _thread_local.table = table
+    return table
+
+
+def checkpoint_key():
+    """チェックポイントファイル内で、テーブルと物件の組を識別するキーを返します。"""
+    return f"{TABLE_NAME}/{PK_VALUE}"
+
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+    """
+    チェックポイントを読み込み、現在の TABLE_NAME / PK_VALUE の記録を返します。
+    記録がない場合は None を返します。
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            checkpoints = json.load(f)
+    except FileNotFoundError:
         return None
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"チェックポイント '{path}' を読み込めませんでした。最初から取得します: {e}")
+        return None
+    return checkpoints.get(checkpoint_key())
 
 
-def process_and_save_csv(data, filename):
+def save_checkpoint(high_watermark, path=CHECKPOINT_FILE):
     """
-    【NEW】取得したデータを解析・整形し、新しい形式でCSVファイルに保存します。
+    high_watermark (出力済みデータの最大 datetime) をチェックポイントに保存します。
+    記録済みの値より古い場合は更新しません。途中で中断しても壊れないよう、一時ファイル経由で置き換えます。
     """
-    if not data:
-        logging.warning("処理するデータがありません。CSVファイルは作成されませんでした。")
+    try:
+        with open(path, encoding='utf-8') as f:
+            checkpoints = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        checkpoints = {}
+
+    current = checkpoints.get(checkpoint_key())
+    if current and current.get('high_watermark', '') >= high_watermark:
         return
 
-    # 整形後のデータを格納するリスト
-    processed_records = []
-    logging.info("rowdataのJSON解析とデータ整形を開始します...")
+    checkpoints[checkpoint_key()] = {
+        'high_watermark': high_watermark,
+        # datetime はソートキーのため、最後に保存したアイテムのキーがそのまま次の ExclusiveStartKey になる
+        'last_evaluated_key': {'bukken': PK_VALUE, 'datetime': high_watermark},
+        'output_file': OUTPUT_CSV_FILE,
+        'updated_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    _write_checkpoints(checkpoints, path)
+
+
+def clear_checkpoint(path=CHECKPOINT_FILE):
+    """現在の TABLE_NAME / PK_VALUE のチェックポイントを削除します。(出力ファイルを作り直す場合に使います)"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            checkpoints = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return
+    if checkpoints.pop(checkpoint_key(), None) is not None:
+        _write_checkpoints(checkpoints, path)
+
+
+def _write_checkpoints(checkpoints, path):
+    """途中で中断しても壊れないよう、一時ファイル経由でチェックポイントのファイルを置き換えます。"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoints, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
 
-    for item in data:
+
+def iter_time_window_pages(table, start_datetime, end_datetime, exclusive_start_key=None, pacer=None):
+    """
+    1つの期間 (start_datetime 〜 end_datetime) をページングしながら取得し、
+    ページ (アイテムのリスト) を1つずつ返すジェネレータです。
+    exclusive_start_key を指定すると、そのキーの次のアイテムから取得します。
+    ページ間の待機時間は pacer (AdaptivePacer) が調整します。
+    """
+    if pacer is None:
+        pacer = AdaptivePacer(target_rcu_per_second=TARGET_RCU_PER_SECOND)
+
+    while True:
+        query_params = {
+            'KeyConditionExpression': Key('bukken').eq(PK_VALUE) & Key('datetime').between(start_datetime, end_datetime),
+            'ReturnConsumedCapacity': 'TOTAL',
+        }
+        if exclusive_start_key:
+            query_params['ExclusiveStartKey'] = exclusive_start_key
+
+        response = query_page_with_retry(table, query_params, pacer)
+        yield response.get('Items', [])
+
+        exclusive_start_key = response.get('LastEvaluatedKey', None)
+        if not exclusive_start_key:
+            break
+        pacer.wait()
+
+
+def fetch_shard(table_factory, shard_index, shard_count, shard_start, shard_end, is_last,
+                exclusive_start_key=None, pacer=None):
+    """
+    1シャード分のデータを取得し、シャードごとのスループットをログに出力します。
+    between は終端を含むため、最後以外のシャードでは終端ちょうどのデータを除外し、
+    次のシャードとの重複を防ぎます。
+    USE_PAGE_CACHE が True の場合、シャードを含む期間 (shard_window) がキャッシュ済みならキャッシュから読み込み、
+    十分に過去のシャードは取得したページをキャッシュに保存します。
+    (キャッシュのキーを実行ごとに変えないよう、保存するのは shard_window の期間全体を取得したシャードだけです)
+    """
+    started = time.perf_counter()
+    # 途中から再開するシャードはページの区切りが変わるため、キャッシュの読み書きはしない
+    use_cache = USE_PAGE_CACHE and not exclusive_start_key
+    window_start, window_end = (format_dynamo_datetime(value) for value in
+                                shard_window(parse_dynamo_datetime(shard_start), SHARD_HOURS))
+    cached_pages = None
+    if use_cache:
+        cached_pages = dynamo_page_cache.load_pages(TABLE_NAME, PK_VALUE, window_start, window_end)
+
+    if cached_pages is not None:
+        source = 'キャッシュ'
+        page_list = [[item for item in page if shard_start <= item.get('datetime', '') <= shard_end]
+                     for page in cached_pages]
+    else:
+        source = 'DynamoDB'
+        page_list = list(iter_time_window_pages(
+            table_factory(), shard_start, shard_end, exclusive_start_key, pacer))
+        is_full_window = (shard_start, shard_end) == (window_start, window_end)
+        now = data_now()
+        is_settled = now is not None and \
+            parse_dynamo_datetime(shard_end) <= now - timedelta(minutes=PAGE_CACHE_MIN_AGE_MINUTES)
+        if use_cache and is_full_window and is_settled:
+            dynamo_page_cache.save_pages(TABLE_NAME, PK_VALUE, shard_start, shard_end, page_list)
+
+    items = [item for page in page_list for item in page]
+    pages = len(page_list)
+    if not is_last:
+        items = [item for item in items if item.get('datetime') != shard_end]
+    elapsed = time.perf_counter() - started
+
+    rate = len(items) / elapsed if elapsed > 0 else 0.0
+    logging.info(
+        f"シャード {shard_index + 1}/{shard_count} [{shard_start} 〜 {shard_end}] 完了 ({source}): "
+        f"{len(items)}件 / {pages}ページ / {elapsed:.1f}秒 ({rate:.0f}件/秒)")
+    return items
+
+
+def iter_sharded_pages(table_factory=_get_table, max_workers=MAX_WORKERS,
+                       start_datetime=None, exclusive_start_key=None, pacer=None):
+    """
+    取得期間 (start_datetime 〜 END_DATETIME) を SHARD_HOURS ごとに分割し、最大 max_workers 本を並列に取得します。
+    END_DATETIME が未来の場合は DATA_TIMEZONE の現在時刻までを分割します。(データのない未来のシャードをクエリしないため)
+    結果はシャードの順 (= datetime 順) に1シャードずつ返します。
+    先読みするシャードは max_workers 本までなので、期間が長くてもメモリ使用量は増えません。
+    table_factory には query() を持つ任意のオブジェクトを返す関数を渡せるため、
+    ローカルの代替テーブルに対しても動作を確認できます。
+    """
+    now = data_now()
+    end_datetime = END_DATETIME if now is None else min(END_DATETIME, format_dynamo_datetime(now))
+    shards = split_time_shards(start_datetime or START_DATETIME, end_datetime, SHARD_HOURS)
+    logging.info(
+        f"期間を {len(shards)} シャード ({SHARD_HOURS}時間単位) に分割し、{max_workers} 並列で取得します。")
+
+    started = time.perf_counter()
+    total_items = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        remaining = iter(enumerate(shards))
+
+        def submit_next():
+            for i, (shard_start, shard_end) in remaining:
+                pending.append(executor.submit(
+                    fetch_shard, table_factory, i, len(shards),
+                    shard_start, shard_end, i == len(shards) - 1,
+                    exclusive_start_key if i == 0 else None, pacer))
+                return
+
+        for _ in range(max_workers):
+            submit_next()
+
+        # 完了順ではなくシャード順に返す
+        while pending:
+            items = pending.popleft().result()
+            submit_next()
+            total_items += len(items)
+            yield items
+
+    elapsed = time.perf_counter() - started
+    rate = total_items / elapsed if elapsed > 0 else 0.0
+    logging.info(
+        f"並列取得の合計: {total_items}件 / {elapsed:.1f}秒 ({rate:.0f}件/秒, ワーカー数 {max_workers})")
+
+
+def iter_pages_from_dynamo(table_factory=None, start_datetime=None, exclusive_start_key=None):
+    """
+    DynamoDBから指定された期間のデータを、ページ (アイテムのリスト) 単位で順に返すジェネレータです。
+    FETCH_MODE が 'parallel' の場合は期間を分割して並列に取得します。
+    'serial' でも USE_PAGE_CACHE が True の場合は、キャッシュを使えるよう期間を分割して1本ずつ取得します。
+    取得したページは呼び出し側で順次処理されるため、全件をメモリに保持しません。
+    チェックポイントから再開する場合は start_datetime と exclusive_start_key を指定します。
+    """
+    start_datetime = start_datetime or START_DATETIME
+    logging.info(f"テーブル '{TABLE_NAME}' への接続を試みます。")
+    logging.info(f"データの取得を開始します。")
+    logging.info(f"PartitionKey (bukken): {PK_VALUE}")
+    logging.info(f"期間 (datetime): {start_datetime} から {END_DATETIME}")
+
+    total_items = 0
+    pacer = AdaptivePacer(target_rcu_per_second=TARGET_RCU_PER_SECOND)
+    try:
+        if FETCH_MODE == 'parallel' or USE_PAGE_CACHE:
+            max_workers = MAX_WORKERS if FETCH_MODE == 'parallel' else 1
+            pages = iter_sharded_pages(table_factory or _get_table, max_workers,
+                                       start_datetime, exclusive_start_key, pacer)
+        else:
+            pages = iter_time_window_pages(
+                (table_factory or _get_table)(), start_datetime, END_DATETIME, exclusive_start_key, pacer)
+
+        for items in pages:
+            if items:
+                total_items += len(items)
+                logging.info(
+                    f"{len(items)}件のデータを取得しました。(累計: {total_items}件)")
+            yield items
+
+    except Exception as e:
+        logging.error(f"DynamoDBからのデータ取得中にエラーが発生しました: {e}")
+        raise
+    finally:
+        pacer.log_metrics(final=True)
+
+    logging.info(f"合計 {total_items} 件の全データ取得が完了しました。")
+
+
+def get_all_data_from_dynamo(table_factory=None):
+    """
+    DynamoDBから指定された期間のデータを全て取得します。
+    AWSの認証情報がない場合や取得中にエラーが発生した場合は None を返します。
+    (大量のデータを扱う場合は、全件を保持しない iter_pages_from_dynamo を使ってください)
+    """
+    if not check_credentials(table_factory):
+        return None
+
+    try:
+        all_items = []
+        for items in iter_pages_from_dynamo(table_factory):
+            all_items.extend(items)
+        return all_items
+    except Exception:
+        return None
+
+
+def check_credentials(table_factory=None):
+    """.envファイルからAWSの認証情報を読み込み、設定されているか確認します。"""
+    # .envファイルから環境変数を読み込む
+    load_dotenv()
+
+    if table_factory is None and not all([os.getenv('AWS_ACCESS_KEY_ID'), os.getenv('AWS_SECRET_ACCESS_KEY'), os.getenv('AWS_DEFAULT_REGION')]):
+        logging.error(
+            ".envファイルにAWSの認証情報（AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_DEFAULT_REGION）を設定してください。")
+        return False
+    return True
+
+
+def parse_items(items):
+    """
+    1ページ分のアイテムの rowdata をJSON解析し、タグごとのレコードのリストに整形します。
+    (従来の処理です。process_and_save_csv は同じ結果をより速く返す parse_items_columnar を使います)
+    """
+    records = []
+    for item in items:
         try:
             # 必須項目を取得
             record_datetime = item.get('datetime')
@@ -132,7 +635,7 @@ def process_and_save_csv(data, filename):
 
                 # tagのIDとRSSIが存在する場合のみレコードを追加
                 if tag_id is not None and tag_rssi is not None:
-                    processed_records.append({
+                    records.append({
                         'datetime': record_datetime,
                         'node_id': node_id,
                         'tag_id': tag_id,
@@ -144,28 +647,302 @@ def process_and_save_csv(data, filename):
             logging.error(f"JSONの解析に失敗しました。スキップします。データ: {item.get('rowdata')}")
         except Exception as e:
             logging.error(f"データ処理中に予期せぬエラーが発生しました: {e}。対象アイテム: {item}")
+    return records
+
+
+RAW_RECORD_COLUMNS = ['datetime', 'node_id', 'tag_id', 'tag_rssi', 'tag_volt']
+
+
+def _decode_rowdata_batch(rowdata_strs):
+    """
+    rowdata の文字列をまとめて1回の json.loads で解析します。
+    1件でも解析できないものがある場合は None を返します (呼び出し側で1件ずつ解析し直します)。
+    """
+    if not all(isinstance(s, str) for s in rowdata_strs):
+        return None
+    try:
+        decoded = json.loads('[' + ','.join(rowdata_strs) + ']')
+    except json.JSONDecodeError:
+        return None
+    # 1件の rowdata が複数の値に分かれてしまう場合 ('1, 2' など) も1件ずつ解析し直す
+    if len(decoded) != len(rowdata_strs):
+        return None
+    return decoded
+
+
+def _tags_before_error(rowdata_json):
+    """tag のリストを先頭から調べ、エラーになったタグより前の有効なタグだけを返します。"""
+    tags = []
+    try:
+        for tag in rowdata_json.get('tag', []):
+            if tag.get('id') is not None and tag.get('rssi') is not None:
+                tags.append(tag)
+    except Exception:
+        pass
+    return tags
 
-    if not processed_records:
+
+def parse_items_columnar(items, columns=None):
+    """
+    1ページ分のアイテムの rowdata を解析し、列ごとのリスト (datetime, node_id, tag_id, tag_rssi, tag_volt) に追記します。
+    parse_items と同じ結果になりますが、ページ内の rowdata をまとめて1回で解析し、
+    タグごとのレコード (dict) を作らずに列単位でまとめて追記するため、件数が多い場合に高速です。
+    不正なアイテムのスキップとログ出力は parse_items と同じです。
+    columns に前回の戻り値を渡すと、そこに追記します。
+    """
+    if columns is None:
+        columns = {col: [] for col in RAW_RECORD_COLUMNS}
+    # 解析結果は循環参照を持たない dict と list だけなので、解析中はガベージコレクションを止める
+    # (ページ全体を一度に解析すると、大量のオブジェクトの生成で GC が何度も走り遅くなるため)
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        _parse_items_into(items, columns)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return columns
+
+
+def _parse_items_into(items, columns):
+    """parse_items_columnar の本体です。items を解析して columns の各リストに追記します。"""
+    datetimes = columns['datetime']
+    node_ids = columns['node_id']
+    tag_ids = columns['tag_id']
+    tag_rssis = columns['tag_rssi']
+    tag_volts = columns['tag_volt']
+
+    # datetime と rowdata がそろっているアイテムの rowdata をまとめて解析しておく
+    decoded = _decode_rowdata_batch(
+        [item.get('rowdata') for item in items if item.get('datetime') and item.get('rowdata')])
+
+    valid_tags = []
+    i = -1
+    for item in items:
+        record_datetime = item.get('datetime')
+        rowdata_str = item.get('rowdata')
+        if not (record_datetime and rowdata_str):
+            logging.warning(
+                f"必要なデータ(datetime or rowdata)が欠損しているためスキップします: {item}")
+            continue
+        i += 1
+        node_id = None
+        try:
+            if decoded is not None:
+                rowdata_json = decoded[i]
+            else:
+                rowdata_json = json.loads(rowdata_str)
+
+            node_id = rowdata_json.get('node', {}).get('id')
+            if not node_id:
+                logging.warning(
+                    f"node IDが見つかりませんでした。スキップします: {record_datetime}")
+                continue
+
+            tags = [tag for tag in rowdata_json.get('tag', [])
+                    if tag.get('id') is not None and tag.get('rssi') is not None]
+
+        except json.JSONDecodeError:
+            logging.error(f"JSONの解析に失敗しました。スキップします。データ: {item.get('rowdata')}")
+            continue
+        except Exception as e:
+            logging.error(f"データ処理中に予期せぬエラーが発生しました: {e}。対象アイテム: {item}")
+            # parse_items と同じく、エラーになったタグより前のタグは残す
+            tags = _tags_before_error(rowdata_json) if node_id else []
+
+        if tags:
+            valid_tags.extend(tags)
+            datetimes.extend([record_datetime] * len(tags))
+            node_ids.extend([node_id] * len(tags))
+
+    # タグの値は最後にまとめて列へ追記する
+    tag_ids.extend([tag['id'] for tag in valid_tags])
+    tag_rssis.extend([tag['rssi'] for tag in valid_tags])
+    tag_volts.extend([tag.get('volt') for tag in valid_tags])
+
+
+def process_and_save_csv(pages, filename, chunk_rows=CSV_CHUNK_ROWS, append=False, on_flush=None,
+                         write_raw_store=None):
+    """
+    【NEW】取得したデータを解析・整形し、新しい形式でCSVファイルに保存します。
+    pages にはページ (アイテムのリスト) を順に返すイテラブルを渡します。
+    ページごとに整形し、chunk_rows 行たまるごとにCSVへ追記するため、
+    ピーク時のメモリ使用量は取得期間の長さに依存しません。
+    (従来どおりアイテムのリストをそのまま渡すこともできます)
+
+    append=True の場合は既存のCSVの末尾に追記します。
+    on_flush を指定すると、CSVへ書き出すたびに書き出し済みの最大 datetime を渡して呼び出します。
+    write_raw_store を省略した場合は WRITE_RAW_STORE の設定に従って raw_store にも保存します。
+    取得・解析が失敗・中断した場合は、読み終えたページ分を書き出して (チェックポイントも更新して) から、
+    例外をそのまま送出します。(呼び出し元・pipeline.py が失敗として扱えるように)
+    """
+    if write_raw_store is None:
+        write_raw_store = WRITE_RAW_STORE
+    if isinstance(pages, list) and pages and isinstance(pages[0], dict):
+        pages = [pages]
+
+    logging.info("rowdataのJSON解析とデータ整形を開始します...")
+    # 取得・解析・書き出しは交互に行うため、それぞれの時間は timed() で足し合わせて記録する
+    run_report.step('取得・整形・保存')
+
+    item_count = 0
+    record_count = 0
+    buffer = {col: [] for col in RAW_RECORD_COLUMNS}
+    csv_file = None
+    last_datetime = None
+
+    def flush():
+        nonlocal csv_file
+        if buffer['datetime']:
+            with run_report.timed('CSV・raw_store への書き出し', rows_in=len(buffer['datetime'])):
+                if csv_file is None:
+                    if append:
+                        csv_file = open(filename, 'a', encoding='utf-8-sig', newline='')
+                        header = csv_file.tell() == 0
+                    else:
+                        csv_file = open(filename, 'w', encoding='utf-8-sig', newline='')
+                        header = True
+                else:
+                    header = False
+                chunk_df = pd.DataFrame(buffer)
+                chunk_df.to_csv(csv_file, index=False, header=header)
+                csv_file.flush()
+                if write_raw_store:
+                    raw_store.write_raw_data(chunk_df, bukken=PK_VALUE)
+                for values in buffer.values():
+                    values.clear()
+        # ページ単位で書き出しているため、ここまでに読んだアイテムはすべて保存済み
+        if on_flush is not None and last_datetime is not None:
+            on_flush(last_datetime)
+
+    page_iter = iter(pages)
+    try:
+        while True:
+            # ページの取得 (DynamoDB の応答・スロットリングの待機を含む)
+            with run_report.timed('ページの取得') as fetch_record:
+                items = next(page_iter, None)
+            if items is None:
+                break
+            fetch_record.add_rows(rows_out=len(items))
+            item_count += len(items)
+            with run_report.timed('JSON解析・整形', rows_in=len(items)) as parse_record:
+                buffered = len(buffer['datetime'])
+                parse_items_columnar(items, buffer)
+                parse_record.add_rows(rows_out=len(buffer['datetime']) - buffered)
+            record_count += len(buffer['datetime']) - buffered
+            if items:
+                last_datetime = items[-1].get('datetime') or last_datetime
+            if len(buffer['datetime']) >= chunk_rows:
+                flush()
+        flush()
+    except (Exception, KeyboardInterrupt) as e:
+        # 読み終えたページ分は書き出しておき、次回はその続きから再開できるようにする
+        try:
+            flush()
+        except Exception as flush_error:
+            logging.error(f"CSVファイルへの保存中にエラーが発生しました: {flush_error}")
+        if csv_file is not None:
+            logging.error(
+                f"処理が中断されたため、'{filename}' には途中までのデータ ({record_count - len(buffer['datetime'])}件) のみ保存されています: {e}")
+        else:
+            logging.error(f"処理が中断されたため、CSVファイルは作成されませんでした: {e}")
+        raise
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+        run_report.set_rows(rows_in=item_count, rows_out=record_count)
+
+    if item_count == 0:
+        if append:
+            logging.info("前回の取得以降、新しいデータはありませんでした。")
+        else:
+            logging.warning("処理するデータがありません。CSVファイルは作成されませんでした。")
+        return
+    if record_count == 0:
         logging.warning("整形後のデータが1件もありませんでした。CSVファイルは作成されません。")
         return
 
-    logging.info(f"整形後のレコード {len(processed_records)}件 をCSVファイルに保存します。")
-    try:
-        # 整形後のデータリストをDataFrameに変換
-        df = pd.DataFrame(processed_records)
+    logging.info(f"整形後のレコード {record_count}件 をCSVファイル '{filename}' に保存しました。")
+
+
+def can_resume(checkpoint):
+    """チェックポイントの続きから取得して OUTPUT_CSV_FILE に追記できるかを返します。"""
+    if not checkpoint:
+        return False
+    output_file = checkpoint.get('output_file')
+    if output_file is None or os.path.normpath(output_file) != os.path.normpath(OUTPUT_CSV_FILE):
+        logging.warning(
+            f"チェックポイントは別の出力ファイル '{output_file}' のものです。"
+            f"'{OUTPUT_CSV_FILE}' は {START_DATETIME} から取得し直して作り直します。")
+        return False
+    if not os.path.exists(OUTPUT_CSV_FILE):
+        logging.warning(
+            f"'{OUTPUT_CSV_FILE}' が見つからないため、{START_DATETIME} から取得し直して作り直します。")
+        return False
+    if checkpoint.get('high_watermark', '') < START_DATETIME:
+        logging.info(
+            f"チェックポイント ({checkpoint.get('high_watermark')}) が START_DATETIME より前のため、"
+            f"'{OUTPUT_CSV_FILE}' は {START_DATETIME} から取得し直して作り直します。")
+        return False
+    return True
+
+
+def run_incremental_fetch(table_factory=None):
+    """
+    チェックポイントを参照し、未取得のデータだけを取得して OUTPUT_CSV_FILE に追記します。
+    書き出しのたびにチェックポイントを更新するため、中断しても次回は続きから再開します。
+    続きから取得できない場合 (can_resume を参照) は、START_DATETIME から取得して OUTPUT_CSV_FILE を作り直します。
+    (その場合、raw_store の START_DATETIME 〜 END_DATETIME のデータも削除してから書き込みます)
+    """
+    start_datetime = START_DATETIME
+    exclusive_start_key = None
+
+    checkpoint = load_checkpoint() if INCREMENTAL else None
+    resume = can_resume(checkpoint)
+    if resume:
+        start_datetime = checkpoint['high_watermark']
+        exclusive_start_key = checkpoint.get('last_evaluated_key')
+        logging.info(
+            f"チェックポイント '{CHECKPOINT_FILE}' より、{start_datetime} までは取得済みです。続きから取得します。")
+
+    if start_datetime >= END_DATETIME:
+        logging.info("新しく取得する期間がありません。")
+        return
 
-        # CSVファイルとして保存
-        df.to_csv(filename, index=False, encoding='utf-8-sig')
-        logging.info(f"データを '{filename}' に正常に保存しました。")
+    if not resume:
+        # 出力ファイルを作り直すため、以前の位置 (別のファイル・期間のもの) は使わない
+        clear_checkpoint()
+        if WRITE_RAW_STORE:
+            # raw_store は追記のため、取得し直す期間の保存済みのデータを先に削除する (同じ行が重複しないように)
+            raw_store.delete_range(parse_dynamo_datetime(start_datetime),
+                                   parse_dynamo_datetime(END_DATETIME), bukken=PK_VALUE)
 
-    except Exception as e:
-        logging.error(f"CSVファイルへの保存中にエラーが発生しました: {e}")
+    process_and_save_csv(
+        iter_pages_from_dynamo(table_factory, start_datetime, exclusive_start_key),
+        OUTPUT_CSV_FILE, append=resume, on_flush=save_checkpoint)
 
 
-if __name__ == '__main__':
-    # 1. DynamoDBからデータを取得
-    retrieved_data = get_all_data_from_dynamo()
+def run_offline_from_cache():
+    """
+    DynamoDB に接続せず、キャッシュ済みのページ (START_DATETIME 〜 END_DATETIME) から
+    OUTPUT_CSV_FILE を作り直します。チェックポイントと raw_store は更新しません。
+    """
+    logging.info(
+        f"キャッシュ '{dynamo_page_cache.CACHE_DIR}' から {START_DATETIME} 〜 {END_DATETIME} のページを再処理します。")
+    pages = dynamo_page_cache.iter_cached_pages(TABLE_NAME, PK_VALUE, START_DATETIME, END_DATETIME)
+    process_and_save_csv(pages, OUTPUT_CSV_FILE, write_raw_store=False)
+
 
-    # 2. 取得したデータを解析・整形してCSVに保存
-    if retrieved_data is not None:
-        process_and_save_csv(retrieved_data, OUTPUT_CSV_FILE)
+if __name__ == '__main__':
+    with run_report.run('get_dynamo_data'):
+        if OFFLINE_FROM_CACHE:
+            # キャッシュ済みのページだけを使って、CSVを作り直す
+            run_offline_from_cache()
+        else:
+            run_report.step('認証情報の確認')
+            if check_credentials():
+                # 1. DynamoDBからページ単位でデータを取得し、
+                # 2. 取得したそばから解析・整形してCSVに追記
+                run_incremental_fetch()
+            else:
+                sys.exit(1)
@@ -1,6 +1,13 @@
-import pandas as pd
+import os
+import sys
 from datetime import timedelta
 
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dimensions
+import run_report
+
 
 def _effective_count(series) -> float:
     """
@@ -24,6 +31,9 @@ def _mode_or_none(series):
     s = series.dropna()
     if s.empty:
         return None
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # 同数の場合に文字列の昇順で最初の値を返すよう、元の値に戻してから求める
+        s = s.astype(object)
     m = s.mode()
     return m.iloc[0] if not m.empty else None
 
@@ -48,7 +58,9 @@ def make_effective_location_tables(
     """
 
     print("元データを読み込みます:", src_path)
-    df = pd.read_csv(src_path)
+    run_report.step("元データの読み込み")
+    # 場所・タグ・部門は登録簿のコードを持つカテゴリ型で読み込む (グループ化を整数で行うため)
+    df = dimensions.read_enriched_csv(src_path)
 
     # 不要カラムを落とす（あっても無視されるが念のため）
     if "Unnamed: 4" in df.columns:
@@ -67,11 +79,13 @@ def make_effective_location_tables(
 
     # tag_name が欠損している行は除外
     df = df[df["tag_name"].notna()].copy()
+    run_report.set_rows(rows_out=len(df))
 
     # ============ 日次テーブル ============
     print("日次テーブルを集計中...")
+    run_report.step("日次テーブル", rows_in=len(df))
     daily_records = []
-    for (tag, date), sub in df.groupby(["tag_name", "date"]):
+    for (tag, date), sub in df.groupby(["tag_name", "date"], observed=True):
         rec = {
             "tag_name": tag,
             "date": date,
@@ -102,12 +116,14 @@ def make_effective_location_tables(
         ]
     ]
     df_daily.to_csv(daily_path, index=False)
+    run_report.set_rows(rows_out=len(df_daily))
     print("日次CSVを書き出しました:", daily_path)
 
     # ============ 週次テーブル ============
     print("週次テーブルを集計中...")
+    run_report.step("週次テーブル", rows_in=len(df))
     weekly_records = []
-    for (tag, week_start), sub in df.groupby(["tag_name", "week_start"]):
+    for (tag, week_start), sub in df.groupby(["tag_name", "week_start"], observed=True):
         rec = {
             "tag_name": tag,
             "week_start": week_start,
@@ -135,12 +151,14 @@ def make_effective_location_tables(
         ]
     ]
     df_weekly.to_csv(weekly_path, index=False)
+    run_report.set_rows(rows_out=len(df_weekly))
     print("週次CSVを書き出しました:", weekly_path)
 
     # ============ 月次テーブル ============
     print("月次テーブルを集計中...")
+    run_report.step("月次テーブル", rows_in=len(df))
     monthly_records = []
-    for (tag, month_start), sub in df.groupby(["tag_name", "month_start"]):
+    for (tag, month_start), sub in df.groupby(["tag_name", "month_start"], observed=True):
         rec = {
             "tag_name": tag,
             "month_start": month_start,
@@ -168,10 +186,12 @@ def make_effective_location_tables(
         ]
     ]
     df_monthly.to_csv(monthly_path, index=False)
+    run_report.set_rows(rows_out=len(df_monthly))
     print("月次CSVを書き出しました:", monthly_path)
 
     print("すべてのCSV生成が完了しました。")
 
 
 if __name__ == "__main__":
-    make_effective_location_tables()
+    with run_report.run("hhi_reverse_csv"):
+        make_effective_location_tables()
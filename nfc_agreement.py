@@ -0,0 +1,277 @@
+'''
+センサー (最寄りノード) と NFC の予約データの一致度を集計するスクリプト
+
+analyze_closest_nodeANDexcel.py が作成した closest_node_per_interval_with_names.csv の各区間
+(datetime 〜 datetime + TIME_INTERVAL_MINUTES) と、NFC の予約 (CheckInTime 〜 CheckOutTime) を
+人 (tag_name = User) ごとに時刻で突き合わせ、重なった時間を次の表にまとめます。
+    nfc_agreement_by_user.csv     人ごとの予約時間・検出時間・一致時間と一致率・適合率
+    nfc_agreement_by_month.csv    月ごとの同じ集計 (予約のチェックイン日時の月)
+    nfc_agreement_confusion.csv   予約のエリア (行) × センサーのエリア (列) ごとの重なった時間 (分)
+
+両者の場所の名前は AREA_MAP / NFC_SEAT_AREA_MAP で比較用のエリアにそろえます。
+区間と予約はどちらも時刻順に並べて二分探索で重なる範囲を求めるため、
+予約を5分ごとの行に展開することなく、全員・全期間をまとめて集計できます。
+    python nfc_agreement.py
+'''
+
+
+import glob
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import booking_cache
+import dimensions
+
+# ----------------------------------------------------------------------
+# 設定項目
+# ----------------------------------------------------------------------
+# analyze_closest_nodeANDexcel.py の出力 (TIME_INTERVAL_MINUTES も同じ値にしてください)
+INPUT_CSV_FILE = 'closest_node_per_interval_with_names.csv'
+TIME_INTERVAL_MINUTES = 5
+
+# NFC の予約データ (一致するExcelファイルをすべて読み込み、重複した予約は1件にします)
+EXCEL_DATA_FOLDER = 'data'
+EXCEL_FILE_PATTERN = '辻アプリ_*.xlsx'
+
+OUTPUT_FOLDER = 'output_files'
+
+# 場所の名前 (センサーの place_name / NFC の Area) -> 比較用のエリア。ここにない名前はそのまま使います
+AREA_MAP = {
+    'LIBRARY打合せ': 'LIBRARY', 'LIBRARY立ち': 'LIBRARY', 'LIBRARY畳': 'LIBRARY',
+    'アエラス': '会議室', 'エール': '会議室', 'Laputa': '会議室', 'さくら': '会議室',
+    'つばき': '会議室', 'ひまわり': '会議室', 'もみじ': '会議室', 'わかくさ': '会議室',
+    '搬入ヤード': 'その他', 'ドックストックルーム': 'その他', 'ドック・ストックルーム': 'その他',
+    'グランラボ': 'その他', 'クリーンルーム更衣室': 'その他', '小実験室': 'その他',
+}
+
+# NFC の SeatNumber -> 比較用のエリア (Area より優先します)
+# (会議室の予約は、ワークブックによって Area が「その他」になっているため)
+NFC_SEAT_AREA_MAP = {
+    seat: '会議室' for seat in ['アエラス', 'エール', 'Laputa', 'さくら', 'つばき', 'ひまわり', 'もみじ', 'わかくさ']
+}
+
+# 混同行列の行・列の並び (ここにないエリアは後ろに名前順で並べます)
+AREA_ORDER = ['ホール', '2-1業務', '2-1集中', '2-2業務', '2-2集中', 'CADブース',
+              'LIBRARY', 'LOUNGE', '会議室', '屋外', 'その他', '帰宅']
+
+# True の場合、人の名前を空白で区切った部分の順番を無視して突き合わせます
+# (tag_names.csv は「名 姓」、予約データは「姓 名」と「名 姓」が混在しているため)
+IGNORE_NAME_ORDER = True
+
+# 予約の時間にセンサーの区間がなかった時間の列名
+NOT_DETECTED_LABEL = '検出なし'
+# ----------------------------------------------------------------------
+
+MS_PER_MINUTE = 60 * 1000
+
+
+def _factorize_labels(values, to_label=str):
+    """
+    値の配列を (行ごとのコード, コードに対応するラベル) にします。欠損値のコードは -1 です。
+    (カテゴリ型の列もそのまま渡せます。ラベルへの変換はユニークな値に対してだけ行います)
+    """
+    codes, uniques = pd.factorize(pd.Series(values, copy=False))
+    return codes, [to_label(u) for u in uniques]
+
+
+def _positions(codes, labels, index):
+    """_factorize_labels の結果の各行が index の何番目にあたるかを返します。(ない値・欠損は -1)"""
+    return np.append(index.get_indexer(labels), -1)[codes]
+
+
+def user_key(name):
+    """人の名前を突き合わせに使う文字列にします。"""
+    name = str(name).strip()
+    return ' '.join(sorted(name.split())) if IGNORE_NAME_ORDER else name
+
+
+def sensor_area_labels(place_names):
+    """センサーの place_name を比較用のエリアにし、(行ごとのコード, エリア) を返します。"""
+    return _factorize_labels(place_names, lambda p: AREA_MAP.get(str(p), str(p)))
+
+
+def booking_areas(bookings):
+    """予約の SeatNumber / Area から比較用のエリアを求めます。"""
+    by_seat = bookings['SeatNumber'].map(NFC_SEAT_AREA_MAP)
+    by_area = bookings['Area'].map(lambda a: AREA_MAP.get(a, a))
+    return by_seat.where(by_seat.notna(), by_area).astype(object)
+
+
+def interval_join(sensor_users, sensor_starts, interval_ms, booking_users, booking_starts, booking_ends):
+    """
+    センサーの区間 (開始〜開始 + interval_ms) と予約の区間が重なる組み合わせを求めます。
+    users は人を表す整数コード (予約側の -1 はセンサーにいない人)、starts / ends はエポックミリ秒です。
+    同じ人の区間は重ならない (1人1区間1行) ことを前提に、(人, 開始) の順に並べた区間を二分探索し、
+    予約ごとに重なる区間の範囲を求めます。
+    戻り値は (予約の番号, センサーの行番号, 重なった時間 (ミリ秒)) の配列です。
+    """
+    sensor_users = np.asarray(sensor_users, dtype='int64')
+    sensor_starts = np.asarray(sensor_starts, dtype='int64')
+    booking_users = np.asarray(booking_users, dtype='int64')
+    booking_starts = np.asarray(booking_starts, dtype='int64')
+    booking_ends = np.asarray(booking_ends, dtype='int64')
+    empty = np.array([], dtype='int64')
+    if len(sensor_starts) == 0 or len(booking_starts) == 0:
+        return empty, empty, empty
+
+    # (人, 開始) を1つの整数にまとめて並べる (開始は最初の区間からの経過時間 + 1 にして、範囲外の検索値をどの区間よりも前の 0 / 後の width - 1 に丸める)
+    base = int(sensor_starts.min())
+    width = int(sensor_starts.max()) - base + 3
+    order = np.lexsort((sensor_starts, sensor_users))
+    keys = sensor_users[order] * width + (sensor_starts[order] - base + 1)
+
+    # 区間が予約と重なる条件: 区間の開始 > CheckInTime - interval_ms かつ 区間の開始 < CheckOutTime
+    lower = np.clip(booking_starts - interval_ms - base + 1, 0, width - 1)
+    upper = np.clip(booking_ends - base + 1, 0, width - 1)
+    lo = np.searchsorted(keys, booking_users * width + lower, side='right')
+    hi = np.searchsorted(keys, booking_users * width + upper, side='left')
+    counts = np.where((booking_users >= 0) & (booking_ends > booking_starts), np.maximum(hi - lo, 0), 0)
+
+    booking_rows = np.repeat(np.arange(len(booking_starts)), counts)
+    offsets = np.arange(len(booking_rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    sensor_rows = order[np.repeat(lo, counts) + offsets]
+
+    starts = sensor_starts[sensor_rows]
+    overlap = np.minimum(starts + interval_ms, booking_ends[booking_rows]) - \
+        np.maximum(starts, booking_starts[booking_rows])
+    return booking_rows, sensor_rows, overlap
+
+
+def _area_labels(*areas):
+    found = set()
+    for values in areas:
+        found.update(v for v in values if pd.notna(v))
+    return [a for a in AREA_ORDER if a in found] + sorted(found - set(AREA_ORDER))
+
+
+def _summary(booked, detected, matched):
+    """予約時間・検出時間・一致時間 (ミリ秒) から、分と各割合の表を作ります。"""
+    summary = pd.DataFrame({
+        'booked_minutes': booked / MS_PER_MINUTE,
+        'detected_minutes': detected / MS_PER_MINUTE,
+        'matched_minutes': matched / MS_PER_MINUTE,
+    })
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # 一致率: 予約の時間のうち、センサーのエリアが予約のエリアと一致した割合
+        summary['agreement'] = np.where(booked > 0, matched / booked, np.nan)
+        # 検出率: 予約の時間のうち、センサーの区間があった割合
+        summary['coverage'] = np.where(booked > 0, detected / booked, np.nan)
+        # 適合率: センサーが検出した時間のうち、予約のエリアと一致した割合
+        summary['precision'] = np.where(detected > 0, matched / detected, np.nan)
+    return summary
+
+
+def agreement_report(sensor_df, bookings, interval_minutes):
+    """
+    センサーの区間と予約を突き合わせ、(人ごと, 月ごと, 混同行列) の3つの表を返します。
+    sensor_df は datetime / tag_name / place_name 列を、bookings は booking_cache の予約の表を持つ DataFrame です。
+    """
+    interval_ms = interval_minutes * MS_PER_MINUTE
+    bookings = bookings.dropna(subset=['CheckInTime', 'CheckOutTime', 'User']).reset_index(drop=True)
+    sensor_df = sensor_df.dropna(subset=['datetime', 'tag_name'])
+
+    # 人は予約の User の並びでコードにする (センサーにしかいない人は集計しない)
+    user_codes, user_keys = _factorize_labels(bookings['User'], user_key)
+    users = pd.Index(pd.unique(np.array(user_keys, dtype=object)))
+    booking_users = _positions(user_codes, user_keys, users)
+    sensor_users = _positions(*_factorize_labels(sensor_df['tag_name'], user_key), users)
+    # 区間の開始 (出力の datetime は区間の開始だが、念のため区間の境界に切り捨てる)
+    sensor_starts = pd.to_datetime(sensor_df['datetime']).to_numpy(dtype='datetime64[ms]').astype('int64')
+    sensor_starts = sensor_starts // interval_ms * interval_ms
+
+    # 同じ人の同じ区間が複数ある場合 (1人が複数のタグを持つ場合など) は最初の行だけを使う
+    in_bookings = sensor_users >= 0
+    candidates = np.flatnonzero(in_bookings)
+    key = pd.MultiIndex.from_arrays([sensor_users[candidates], sensor_starts[candidates]])
+    in_bookings[candidates[key.duplicated()]] = False
+
+    booking_starts = bookings['CheckInTime'].to_numpy(dtype='datetime64[ms]').astype('int64')
+    booking_ends = bookings['CheckOutTime'].to_numpy(dtype='datetime64[ms]').astype('int64')
+    booking_rows, sensor_rows, overlap = interval_join(
+        sensor_users[in_bookings], sensor_starts[in_bookings], interval_ms,
+        booking_users, booking_starts, booking_ends)
+
+    # エリアは両方の名前をまとめたコードにする
+    booked_area = booking_areas(bookings)
+    place_codes, place_areas = sensor_area_labels(sensor_df['place_name'])
+    place_codes = place_codes[in_bookings]
+    used_areas = [place_areas[c] for c in np.unique(place_codes[place_codes >= 0])]
+    areas = pd.Index(_area_labels(booked_area, used_areas) + [NOT_DETECTED_LABEL])
+    booked_codes = areas.get_indexer(booked_area)
+    sensed_codes = _positions(place_codes, place_areas, areas)[sensor_rows]
+    is_match = (booked_codes[booking_rows] == sensed_codes) & (sensed_codes >= 0)
+
+    # 予約ごとの予約時間・検出時間・一致時間
+    booked = np.maximum(booking_ends - booking_starts, 0).astype('float64')
+    detected = np.bincount(booking_rows, weights=overlap, minlength=len(bookings))
+    matched = np.bincount(booking_rows[is_match], weights=overlap[is_match], minlength=len(bookings))
+
+    def by_key(codes, labels, name):
+        # 予約ごとの値を codes (予約の並び) ごとに合計する
+        count = len(labels)
+        summary = _summary(*(np.bincount(codes, weights=v, minlength=count) for v in (booked, detected, matched)))
+        summary.insert(0, name, labels)
+        return summary
+
+    # 人の表示名は、予約データで最初に出てくる名前にする
+    user_names = bookings['User'].astype(str).groupby(booking_users, sort=True).first()
+    by_user = by_key(booking_users, user_names.to_numpy(), 'User')
+    by_user = by_user.sort_values('booked_minutes', ascending=False, kind='stable').reset_index(drop=True)
+    month_codes, months = pd.factorize(bookings['CheckInTime'].dt.strftime('%Y-%m'), sort=True)
+    by_month = by_key(month_codes, months, 'month')
+    total = _summary(booked.sum(keepdims=True), detected.sum(keepdims=True), matched.sum(keepdims=True))
+    total.insert(0, 'month', ['合計'])
+    by_month = pd.concat([by_month, total], ignore_index=True)
+
+    # 混同行列: 予約のエリア × センサーのエリア (+ 検出なし) の重なった時間 (分)
+    area_count = len(areas)
+    valid = (booked_codes[booking_rows] >= 0) & (sensed_codes >= 0)
+    cells = booked_codes[booking_rows][valid] * area_count + sensed_codes[valid]
+    confusion = np.bincount(cells, weights=overlap[valid], minlength=area_count * area_count)
+    confusion = confusion.reshape(area_count, area_count)
+    has_area = booked_codes >= 0
+    confusion[:, -1] = np.bincount(booked_codes[has_area], weights=(booked - detected)[has_area],
+                                   minlength=area_count)
+    confusion = pd.DataFrame(confusion[:-1] / MS_PER_MINUTE, index=areas[:-1], columns=areas)
+    confusion.index.name = 'booked_area'
+    confusion = confusion.loc[confusion.sum(axis=1) > 0]
+    return by_user, by_month, confusion
+
+
+def main():
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        sensor_df = dimensions.read_enriched_csv(
+            INPUT_CSV_FILE, usecols=['datetime', 'tag_name', 'place_name'])
+    except FileNotFoundError:
+        logging.error(f"エラー: '{INPUT_CSV_FILE}' が見つかりません。先に analyze_closest_nodeANDexcel.py を実行してください。")
+        return False
+
+    excel_files = sorted(glob.glob(os.path.join(EXCEL_DATA_FOLDER, EXCEL_FILE_PATTERN)))
+    if not excel_files:
+        logging.error(f"エラー: '{EXCEL_DATA_FOLDER}' に '{EXCEL_FILE_PATTERN}' に一致するExcelファイルがありません。")
+        return False
+    bookings = booking_cache.read_bookings(excel_files)
+
+    by_user, by_month, confusion = agreement_report(sensor_df, bookings, TIME_INTERVAL_MINUTES)
+
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    by_user.to_csv(os.path.join(OUTPUT_FOLDER, 'nfc_agreement_by_user.csv'), index=False, encoding='utf-8-sig')
+    by_month.to_csv(os.path.join(OUTPUT_FOLDER, 'nfc_agreement_by_month.csv'), index=False, encoding='utf-8-sig')
+    confusion.to_csv(os.path.join(OUTPUT_FOLDER, 'nfc_agreement_confusion.csv'), encoding='utf-8-sig')
+
+    total = by_month.iloc[-1]
+    logging.info(f"予約 {total['booked_minutes']:.0f} 分のうち、センサーの検出 {total['detected_minutes']:.0f} 分、"
+                 f"エリアの一致 {total['matched_minutes']:.0f} 分 "
+                 f"(一致率 {total['agreement']:.1%} / 適合率 {total['precision']:.1%})")
+    logging.info(f"集計結果を '{OUTPUT_FOLDER}' に保存しました。")
+
+
+if __name__ == '__main__':
+    if main() is False:
+        sys.exit(1)
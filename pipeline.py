@@ -0,0 +1,393 @@
+'''
+README の処理の流れをまとめて実行するスクリプト
+
+データ取得 → 電圧確認 → 最寄りノード → 在席トレンド / HHI / 1/HHI / 在席エリア推移 / NFC 一致度
+の各スクリプトをステージ (STAGES) とし、依存関係の順に実行します。
+依存関係のないステージ (在席トレンド・HHI・在席エリア推移・電圧確認など) は並列に実行します。
+
+各ステージのキーは、スクリプトと使用するモジュールのソース (設定項目を含む)、入力ファイルの内容から求めたハッシュです。
+前回の実行からキーが変わっておらず出力ファイルがそろっているステージは実行しません。
+実行したステージの出力ファイルはキーごとに pipeline_cache に保存し、設定を元に戻した場合などは
+スクリプトを実行せずに保存済みの出力ファイルを戻します。
+
+    python pipeline.py                    データ取得以外のステージを実行
+    python pipeline.py --fetch            データ取得 (DynamoDB) から実行
+    python pipeline.py totalling          指定したステージ (と、その前のステージ) だけを実行
+    python pipeline.py --force totalling  入力が変わっていなくても指定したステージを実行 (前のステージはキーで判定)
+    python pipeline.py --force            入力が変わっていなくてもすべてのステージを実行
+    python pipeline.py --list             ステージと前回の実行結果を表示
+'''
+
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+# ----------------------------------------------------------------------
+# 設定項目
+# ----------------------------------------------------------------------
+# このファイルと同じ階層を基準にします
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 前回の実行結果 (ステージごとのキー) の保存先
+STATE_FILE = os.path.join(BASE_DIR, 'pipeline_state.json')
+
+# ステージの出力ファイルの保存先
+CACHE_DIR = os.path.join(BASE_DIR, 'pipeline_cache')
+
+# ステージごとに保存しておく出力ファイルの世代数 (古いものから削除します)
+CACHE_KEEP_PER_STAGE = 3
+
+# 同時に実行するステージの数
+MAX_WORKERS = 4
+
+# ステージ
+#   script   実行するスクリプト (BASE_DIR からの相対パス)
+#   cwd      スクリプトを実行するフォルダ
+#   args     スクリプトに渡す引数 (省略時はなし)
+#   deps     先に実行するステージ
+#   code     キーに含めるモジュール (スクリプトが import するリポジトリ内のモジュールすべて。間接的に import するものも含めます)
+#   inputs   入力ファイル・フォルダ (フォルダは中のファイルのサイズと更新時刻を使います)
+#   outputs  出力ファイル (glob のパターンも使えます)
+#   always   True の場合はキーによらず毎回実行し、出力ファイルを保存しません (DynamoDB からの取得など)
+STAGES = {
+    'fetch': {
+        'script': 'get_dynamo_data.py', 'cwd': '.', 'deps': [],
+        'code': ['raw_store.py', 'tag_schema.py', 'dynamo_page_cache.py', 'run_report.py'],
+        'inputs': [], 'outputs': [], 'always': True,
+    },
+    'volt': {
+        'script': 'discover_tag_volt.py', 'cwd': '.', 'deps': ['fetch'],
+        'code': ['raw_store.py', 'tag_schema.py'],
+        'inputs': ['tag_names.csv', 'raw_store', 'processed_tag_data.csv'],
+        'outputs': ['tag_voltages_latest.csv'],
+    },
+    'closest_node': {
+        # 比較グラフは plt.show() で確認するためのものなので、まとめて実行する場合は作成しない
+        'script': 'analyze_closest_nodeANDexcel.py', 'cwd': '.', 'args': ['--no-plot'], 'deps': ['fetch'],
+        'code': ['closest_node.py', 'dimensions.py', 'raw_store.py', 'tag_schema.py', 'booking_cache.py',
+                 'render_farm.py', 'run_report.py'],
+        'inputs': ['raw_store', 'input', 'node_names.csv', 'tag_names.csv', 'data'],
+        'outputs': ['closest_node_per_interval_with_names.csv', 'dimension_registry.json'],
+    },
+    'totalling': {
+        'script': 'totalling.py', 'cwd': '.', 'deps': ['closest_node'],
+        'code': ['dimensions.py', 'render_farm.py', 'run_report.py'],
+        'inputs': ['closest_node_per_interval_with_names.csv', 'node_names.csv'],
+        'outputs': ['output_files/totalling_cube.csv', 'output_files/overall_*.png', 'output_files/trends_*.png'],
+    },
+    'hhi_dispersion': {
+        'script': 'HHI/calculate_department_dispersion.py', 'cwd': 'HHI', 'deps': ['closest_node'],
+        'code': ['dimensions.py', 'render_farm.py', 'run_report.py'],
+        'inputs': ['closest_node_per_interval_with_names.csv'],
+        'outputs': ['HHI/department_dispersion_*'],
+    },
+    'hhi_mobility': {
+        'script': 'HHI/calculate_mobility_index.py', 'cwd': 'HHI', 'deps': ['closest_node'],
+        'code': ['dimensions.py', 'render_farm.py', 'run_report.py'],
+        'inputs': ['closest_node_per_interval_with_names.csv'],
+        'outputs': ['HHI/mobility_index_*'],
+    },
+    'hhi_reverse_csv': {
+        'script': 'hhi_reverse/make_csv.py', 'cwd': 'hhi_reverse', 'deps': ['closest_node'],
+        'code': ['dimensions.py', 'run_report.py'],
+        'inputs': ['closest_node_per_interval_with_names.csv'],
+        'outputs': ['hhi_reverse/effective_locations_*.csv'],
+    },
+    'hhi_reverse_graph': {
+        'script': 'hhi_reverse/make_graph.py', 'cwd': 'hhi_reverse', 'deps': ['hhi_reverse_csv'],
+        'code': ['render_farm.py', 'run_report.py'],
+        'inputs': ['hhi_reverse/effective_locations_daily.csv', 'hhi_reverse/effective_locations_weekly.csv',
+                   'hhi_reverse/effective_locations_monthly.csv'],
+        'outputs': ['hhi_reverse/graph*.png'],
+    },
+    'stay_area': {
+        'script': 'stay_area/main.py', 'cwd': '.', 'deps': ['closest_node'],
+        'code': ['dimensions.py', 'render_farm.py'],
+        'inputs': ['closest_node_per_interval_with_names.csv'],
+        'outputs': ['stay_area/area_occupancy_trend.png'],
+    },
+    'nfc_agreement': {
+        'script': 'nfc_agreement.py', 'cwd': '.', 'deps': ['closest_node'],
+        'code': ['dimensions.py', 'booking_cache.py'],
+        'inputs': ['closest_node_per_interval_with_names.csv', 'data'],
+        'outputs': ['output_files/nfc_agreement_*.csv'],
+    },
+}
+# ----------------------------------------------------------------------
+
+
+def _abs(path):
+    return os.path.join(BASE_DIR, path)
+
+
+def load_state():
+    """前回の実行結果を読み込みます。ない場合は空の状態を返します。"""
+    if os.path.exists(STATE_FILE):
+        try:
+            with open(STATE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"'{STATE_FILE}' を読み込めませんでした。すべてのステージを実行します: {e}")
+    return {'file_hashes': {}, 'stages': {}}
+
+
+def save_state(state):
+    tmp_path = f"{STATE_FILE}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def file_hash(path, state):
+    """
+    ファイルの内容のハッシュを返します。
+    サイズと更新時刻が前回と同じファイルは、前回のハッシュを使います (大きな CSV を毎回読まないため)。
+    """
+    stat = os.stat(path)
+    cached = state['file_hashes'].get(path)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    state['file_hashes'][path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return digest.hexdigest()
+
+
+def _directory_signature(path):
+    """フォルダ内のファイルの (相対パス, サイズ, 更新時刻) を返します。(raw_store など大きなフォルダの内容は読みません)"""
+    signature = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            stat = os.stat(file_path)
+            signature.append([os.path.relpath(file_path, path), stat.st_size, stat.st_mtime_ns])
+    return signature
+
+
+def stage_key(name, state):
+    """ステージのキー (スクリプト・モジュールのソースと入力ファイルの内容から求めたハッシュ) を返します。"""
+    stage = STAGES[name]
+    digest = hashlib.sha256(name.encode('utf-8'))
+    digest.update(f"args:{json.dumps(stage.get('args', []))}".encode('utf-8'))
+    for path in [stage['script']] + stage['code']:
+        digest.update(f"code:{path}:{file_hash(_abs(path), state)}".encode('utf-8'))
+    for path in stage['inputs']:
+        full_path = _abs(path)
+        if os.path.isdir(full_path):
+            value = json.dumps(_directory_signature(full_path))
+        elif os.path.exists(full_path):
+            value = file_hash(full_path, state)
+        else:
+            value = 'missing'
+        digest.update(f"input:{path}:{value}".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def output_files(name):
+    """ステージの出力ファイルのうち、存在するものを BASE_DIR からの相対パスで返します。"""
+    files = []
+    for pattern in STAGES[name]['outputs']:
+        files.extend(os.path.relpath(p, BASE_DIR) for p in glob.glob(_abs(pattern)) if os.path.isfile(p))
+    return sorted(set(files))
+
+
+def _outputs_exist(recorded):
+    """前回記録した出力ファイルがすべて残っているかを返します。"""
+    return bool(recorded) and all(os.path.isfile(_abs(p)) for p in recorded)
+
+
+def _cache_dir(name, key):
+    return os.path.join(CACHE_DIR, name, key)
+
+
+def save_outputs(name, key, files):
+    """ステージの出力ファイルを pipeline_cache/<ステージ>/<キー>/ に保存し、古い世代を削除します。"""
+    target = _cache_dir(name, key)
+    tmp_target = f"{target}.tmp"
+    shutil.rmtree(tmp_target, ignore_errors=True)
+    for path in files:
+        os.makedirs(os.path.dirname(os.path.join(tmp_target, path)), exist_ok=True)
+        shutil.copy2(_abs(path), os.path.join(tmp_target, path))
+    with open(os.path.join(tmp_target, 'files.json'), 'w', encoding='utf-8') as f:
+        json.dump(files, f, ensure_ascii=False)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp_target, target)
+
+    generations = sorted((os.path.getmtime(p), p) for p in glob.glob(os.path.join(CACHE_DIR, name, '*'))
+                         if not p.endswith('.tmp'))
+    for _, path in generations[:-CACHE_KEEP_PER_STAGE]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def restore_outputs(name, key):
+    """保存済みの出力ファイルがあれば元の場所に戻し、ファイルのリストを返します。ない場合は None を返します。"""
+    source = _cache_dir(name, key)
+    list_path = os.path.join(source, 'files.json')
+    if not os.path.exists(list_path):
+        return None
+    with open(list_path, 'r', encoding='utf-8') as f:
+        files = json.load(f)
+    for path in files:
+        os.makedirs(os.path.dirname(_abs(path)), exist_ok=True)
+        shutil.copy2(os.path.join(source, path), _abs(path))
+    # 最後に使われた世代として更新時刻を更新する (削除の順番に使う)
+    os.utime(source, None)
+    return files
+
+
+def run_script(name):
+    """ステージのスクリプトを別プロセスで実行し、(成功したか, 秒数) を返します。"""
+    stage = STAGES[name]
+    started = time.perf_counter()
+    logging.info(f"[{name}] {stage['script']} を実行します...")
+    # グラフは画面に表示せずファイルにだけ保存する (plt.show() で止まらないように。画面のない環境でも動くように)
+    env = dict(os.environ, MPLBACKEND='Agg')
+    result = subprocess.run([sys.executable, _abs(stage['script'])] + stage.get('args', []),
+                            cwd=_abs(stage['cwd']), env=env)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        logging.error(f"[{name}] {stage['script']} が終了コード {result.returncode} で失敗しました。")
+    return result.returncode == 0, elapsed
+
+
+def select_stages(targets, with_fetch):
+    """実行するステージ (targets とその前のステージ) を、STAGES の順で返します。"""
+    selected = set()
+
+    def add(name):
+        if name in selected:
+            return
+        selected.add(name)
+        for dep in STAGES[name]['deps']:
+            add(dep)
+
+    for name in targets or STAGES:
+        add(name)
+    if not with_fetch and 'fetch' not in (targets or []):
+        selected.discard('fetch')
+    return [name for name in STAGES if name in selected]
+
+
+def run_pipeline(targets=None, with_fetch=False, force=()):
+    """
+    ステージを依存関係の順に実行します。前のステージがすべて終わったステージから、MAX_WORKERS 個まで並列に実行します。
+    キーが前回と同じで出力ファイルがそろっているステージは実行しません。
+    戻り値は {ステージ: 結果 ('run' / 'skipped' / 'restored' / 'failed' / 'blocked')} です。
+    """
+    names = select_stages(targets, with_fetch)
+    state = load_state()
+    results = {}
+    pending = list(names)
+    running = {}
+
+    def ready(name):
+        return all(results.get(dep) in ('run', 'skipped', 'restored')
+                   for dep in STAGES[name]['deps'] if dep in names)
+
+    def blocked(name):
+        return any(results.get(dep) in ('failed', 'blocked') for dep in STAGES[name]['deps'] if dep in names)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        while pending or running:
+            for name in list(pending):
+                if blocked(name):
+                    logging.warning(f"[{name}] 前のステージが失敗したため実行しません。")
+                    results[name] = 'blocked'
+                    pending.remove(name)
+                    continue
+                if not ready(name):
+                    continue
+                pending.remove(name)
+
+                stage = STAGES[name]
+                key = None if stage.get('always') else stage_key(name, state)
+                recorded = state['stages'].get(name, {})
+                if key is not None and name not in force:
+                    if recorded.get('key') == key and _outputs_exist(recorded.get('outputs')):
+                        logging.info(f"[{name}] 入力が変わっていないため実行しません。")
+                        results[name] = 'skipped'
+                        continue
+                    files = restore_outputs(name, key)
+                    if files is not None:
+                        logging.info(f"[{name}] 保存済みの出力ファイル ({len(files)} ファイル) を戻しました。")
+                        state['stages'][name] = dict(recorded, key=key, outputs=files)
+                        results[name] = 'restored'
+                        continue
+                running[executor.submit(run_script, name)] = (name, key)
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, key = running.pop(future)
+                ok, elapsed = future.result()
+                results[name] = 'run' if ok else 'failed'
+                if not ok:
+                    continue
+                record = {'finished_at': datetime.now().isoformat(timespec='seconds'),
+                          'seconds': round(elapsed, 1)}
+                if key is not None:
+                    # 実行中にスクリプトや入力が変わっていないかを確かめるため、キーは実行前に求めた値を記録する
+                    files = output_files(name)
+                    save_outputs(name, key, files)
+                    record.update(key=key, outputs=files)
+                state['stages'][name] = record
+                logging.info(f"[{name}] 完了しました。({elapsed:.1f} 秒)")
+            save_state(state)
+
+    save_state(state)
+    return results
+
+
+def print_stages():
+    state = load_state()
+    for name, stage in STAGES.items():
+        recorded = state['stages'].get(name, {})
+        last = f"{recorded['finished_at']} ({recorded['seconds']} 秒)" if recorded.get('finished_at') else '未実行'
+        deps = ', '.join(stage['deps']) or '-'
+        print(f"  {name:<18} {stage['script']:<40} 前: {deps:<16} 前回: {last}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='README の処理の流れをまとめて実行します。')
+    parser.add_argument('stages', nargs='*', help='実行するステージ (省略時はすべて)。その前のステージも実行します')
+    parser.add_argument('--fetch', action='store_true', help='DynamoDB からのデータ取得 (fetch) も実行する')
+    parser.add_argument('--force', action='store_true',
+                        help='入力が変わっていなくても、指定したステージ (省略時はすべて) を実行する')
+    parser.add_argument('--list', action='store_true', help='ステージと前回の実行結果を表示する')
+    args = parser.parse_args()
+
+    if args.list:
+        print_stages()
+        return
+    unknown = [n for n in args.stages if n not in STAGES]
+    if unknown:
+        parser.error(f"不明なステージです: {unknown} (ステージ: {', '.join(STAGES)})")
+
+    # --force は指定したステージだけに効く (前のステージはキーが変わった場合だけ実行する)
+    force = set(args.stages or STAGES) if args.force else set()
+    results = run_pipeline(args.stages, args.fetch, force)
+    print("実行結果:")
+    for name, result in results.items():
+        print(f"  {name:<18} {result}")
+    if any(result in ('failed', 'blocked') for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+'''
+生データ (processed_tag_data) を日付ごとに分割した Parquet 形式で保存・読み込みするモジュール
+
+保存先の構成:
+    raw_store/bukken=tama_b/date=2025-09-01/part-xxxxxxxx.parquet
+
+get_dynamo_data.py が取得したデータを書き込み、各分析スクリプトは
+read_raw_data(開始日, 終了日, columns=[...]) で必要な期間・列だけを読み込みます。
+データは tag_schema.py の省メモリな型 (compact 型) で保存され、
+read_raw_data(..., compact=True) とするとその型のまま返します。
+
+既存の processed_tag_data_*.csv は次のコマンドで取り込めます。
+    python raw_store.py import input/processed_tag_data_Sep.csv input/processed_tag_data_Oct.csv
+'''
+
+
+import glob
+import logging
+import os
+import sys
+import uuid
+from datetime import date as date_type, datetime
+
+import numpy as np
+import pandas as pd
+
+import tag_schema
+
+# ----------------------------------------------------------------------
+# 設定項目
+# ----------------------------------------------------------------------
+# 保存先フォルダ (このファイルと同じ階層)
+RAW_STORE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'raw_store')
+
+# 物件 (get_dynamo_data.py の PK_VALUE と同じ値)
+DEFAULT_BUKKEN = 'tama_b'
+
+# CSV を取り込む際に一度に読み込む行数
+IMPORT_CHUNK_ROWS = 1000000
+# ----------------------------------------------------------------------
+
+RAW_COLUMNS = tag_schema.RAW_COLUMNS
+
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+
+def _bukken_dir(bukken=None, store_dir=None):
+    return os.path.join(store_dir or RAW_STORE_DIR, f"bukken={bukken or DEFAULT_BUKKEN}")
+
+
+def _partition_dir(date, bukken=None, store_dir=None):
+    return os.path.join(_bukken_dir(bukken, store_dir), f"date={date}")
+
+
+def list_partitions(bukken=None, store_dir=None):
+    """保存済みの日付 (YYYY-MM-DD の文字列) を昇順で返します。"""
+    base = _bukken_dir(bukken, store_dir)
+    if not os.path.isdir(base):
+        return []
+    dates = [name[len('date='):] for name in os.listdir(base)
+             if name.startswith('date=') and glob.glob(os.path.join(base, name, '*.parquet'))]
+    return sorted(dates)
+
+
+def has_data(bukken=None, store_dir=None):
+    """保存済みのデータがあるかどうかを返します。"""
+    return bool(list_partitions(bukken, store_dir))
+
+
+def write_raw_data(df, bukken=None, store_dir=None):
+    """
+    生データを日付ごとのパーティションに追記します。
+    1回の呼び出しで、日付ごとに新しい part ファイルを1つずつ作成します。
+    戻り値は書き込んだ行数です。
+    """
+    if df is None or df.empty:
+        return 0
+
+    df = tag_schema.to_compact(df)
+    if df.empty:
+        return 0
+
+    part_name = f"part-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+    days = df['datetime'].to_numpy() // MS_PER_DAY
+    for day in np.unique(days):
+        date = str(np.datetime64(int(day), 'D'))
+        partition_dir = _partition_dir(date, bukken, store_dir)
+        os.makedirs(partition_dir, exist_ok=True)
+        df[days == day].to_parquet(os.path.join(partition_dir, part_name), index=False)
+    return len(df)
+
+
+def _partition_files(date, bukken=None, store_dir=None):
+    return sorted(glob.glob(os.path.join(_partition_dir(date, bukken, store_dir), '*.parquet')))
+
+
+def _select_dates(start=None, end=None, bukken=None, store_dir=None):
+    """start 〜 end (日付部分で比較) に含まれるパーティションの日付を返します。"""
+    dates = list_partitions(bukken, store_dir)
+    if start is not None:
+        start_date = pd.Timestamp(start).strftime('%Y-%m-%d')
+        dates = [d for d in dates if d >= start_date]
+    if end is not None:
+        end_date = pd.Timestamp(end).strftime('%Y-%m-%d')
+        dates = [d for d in dates if d <= end_date]
+    return dates
+
+
+def list_partition_files(start=None, end=None, bukken=None, store_dir=None):
+    """start 〜 end (日付部分で比較) に含まれる part ファイルのパスを、日付の昇順で返します。"""
+    return [path for date in _select_dates(start, end, bukken, store_dir)
+            for path in _partition_files(date, bukken, store_dir)]
+
+
+def _end_timestamp(end):
+    """終了日時を Timestamp にします。日付だけが指定された場合は、その日の終わりまでを含めます。"""
+    if end is None:
+        return None
+    end_ts = pd.Timestamp(end)
+    is_date_only = (isinstance(end, str) and len(end.strip()) <= 10) or \
+        (isinstance(end, date_type) and not isinstance(end, datetime))
+    if is_date_only:
+        end_ts = end_ts + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+    return end_ts
+
+
+def _to_epoch_ms(ts):
+    return int(np.datetime64(ts.to_datetime64(), 'ms').astype('int64'))
+
+
+def _read_partition(date, read_columns, bukken=None, store_dir=None):
+    """1日分の part ファイルを読み込み、compact 型にして連結します。"""
+    frames = [tag_schema.to_compact(pd.read_parquet(path, columns=read_columns))
+              for path in _partition_files(date, bukken, store_dir)]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def iter_raw_partitions(start=None, end=None, columns=None, bukken=None, store_dir=None, compact=False):
+    """
+    start 〜 end のデータを日付パーティションごとに、日付の昇順で返すジェネレータです。
+    start / end には日付または日時を指定でき、日時の場合はその時刻で絞り込みます (end は含む)。
+    columns を指定すると、その列だけを読み込みます。
+    compact=True の場合は tag_schema の compact 型のまま返し、False の場合は元の表記に戻して返します。
+    """
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys(['datetime'] + list(columns)))
+
+    start_ts = pd.Timestamp(start) if start is not None else None
+    end_ts = _end_timestamp(end)
+
+    for date in _select_dates(start, end, bukken, store_dir):
+        df = _read_partition(date, read_columns, bukken, store_dir)
+        if df is None:
+            continue
+
+        if start_ts is not None and date == start_ts.strftime('%Y-%m-%d'):
+            df = df[df['datetime'] >= _to_epoch_ms(start_ts)]
+        if end_ts is not None and date == end_ts.strftime('%Y-%m-%d'):
+            df = df[df['datetime'] <= _to_epoch_ms(end_ts)]
+        if columns is not None:
+            df = df[list(columns)]
+        df = df.reset_index(drop=True)
+        yield df if compact else tag_schema.from_compact(df)
+
+
+def read_raw_data(start=None, end=None, columns=None, bukken=None, store_dir=None, compact=False):
+    """
+    start 〜 end の生データを読み込み、型の揃った DataFrame として返します。
+    読み込むのは該当する日付のパーティションと、columns で指定した列だけです。
+    compact=True の場合は tag_schema の compact 型のまま返します。
+    """
+    frames = list(iter_raw_partitions(start, end, columns, bukken, store_dir, compact=True))
+    if not frames:
+        df = tag_schema.empty_compact_frame(list(columns) if columns is not None else None)
+    else:
+        df = pd.concat(frames, ignore_index=True)
+    return df if compact else tag_schema.from_compact(df)
+
+
+def import_csv(path, bukken=None, store_dir=None, chunk_rows=IMPORT_CHUNK_ROWS):
+    """
+    processed_tag_data*.csv を読み込み、日付パーティションに追記します。
+    同じファイルを2回取り込むと重複するため、取り込み済みのファイルは再度指定しないでください。
+    (重複してしまった場合は compact で取り除けます)
+    """
+    total = 0
+    for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype={'tag_id': str}):
+        total += write_raw_data(chunk, bukken, store_dir)
+    logging.info(f"'{path}' から {total} 件を取り込みました。")
+    return total
+
+
+def _replace_partition(date, df, files, bukken=None, store_dir=None):
+    """パーティションの part ファイル (files) を、df だけを書いた1つの part ファイルに置き換えます。"""
+    if not df.empty:
+        part_name = f"part-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+        df.to_parquet(os.path.join(_partition_dir(date, bukken, store_dir), part_name), index=False)
+    for f in files:
+        os.remove(f)
+
+
+def delete_range(start, end, bukken=None, store_dir=None):
+    """
+    start 〜 end (end は含む) のデータを削除し、削除した行数を返します。
+    期間に丸ごと含まれる日付は part ファイルを削除し、期間の境界の日付は期間外の行だけを残して書き直します。
+    (同じ期間を取得し直す前に呼び出し、同じデータが重複して保存されないようにします)
+    """
+    start_ts = pd.Timestamp(start)
+    end_ts = _end_timestamp(end)
+    start_ms, end_ms = _to_epoch_ms(start_ts), _to_epoch_ms(end_ts)
+    deleted = 0
+    for date in _select_dates(start, end, bukken, store_dir):
+        files = _partition_files(date, bukken, store_dir)
+        df = _read_partition(date, None, bukken, store_dir)
+        if df is None:
+            continue
+        in_range = (df['datetime'] >= start_ms) & (df['datetime'] <= end_ms)
+        if not in_range.any():
+            continue
+        deleted += int(in_range.sum())
+        _replace_partition(date, df[~in_range].reset_index(drop=True), files, bukken, store_dir)
+    if deleted:
+        logging.info(f"raw_store から {start} 〜 {end} の {deleted} 件を削除しました。")
+    return deleted
+
+
+def compact_partitions(bukken=None, store_dir=None):
+    """
+    日付ごとに複数ある part ファイルを1つにまとめ、完全に重複した行を取り除きます。
+    (追記を繰り返すと part ファイルが増えて読み込みが遅くなるため、定期的に実行してください)
+    """
+    for date in list_partitions(bukken, store_dir):
+        files = _partition_files(date, bukken, store_dir)
+        if len(files) <= 1:
+            continue
+        df = _read_partition(date, None, bukken, store_dir)
+        if df is None:
+            continue
+        df = df.drop_duplicates().sort_values('datetime', kind='stable')
+        _replace_partition(date, df, files, bukken, store_dir)
+        logging.info(f"{date}: {len(files)} ファイルを1つにまとめました。({len(df)} 件)")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if len(sys.argv) >= 3 and sys.argv[1] == 'import':
+        for csv_path in sys.argv[2:]:
+            import_csv(csv_path)
+    elif len(sys.argv) == 2 and sys.argv[1] == 'compact':
+        compact_partitions()
+    else:
+        partitions = list_partitions()
+        if partitions:
+            print(f"保存済みの期間: {partitions[0]} 〜 {partitions[-1]} ({len(partitions)} 日分)")
+        else:
+            print("保存済みのデータはありません。")
+        print("使い方: python raw_store.py import <CSVファイル> ... / python raw_store.py compact")
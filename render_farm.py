@@ -0,0 +1,183 @@
+'''
+グラフの描画 (matplotlib のラスタライズ) を複数のプロセスで並列に行うモジュール
+
+集計が速くなると、dpi=300 の PNG の描画が処理時間の大半を占めるため、
+各スクリプトは描画用に整えた表と描画関数を「ジョブ」にまとめて render_all に渡します。
+    jobs = [render_farm.render_job(output_path, plot_line_graph, df_index, output_path), ...]
+    render_farm.render_all(jobs)
+
+ジョブはプロセスプールで並列に描画します。各プロセスは開始時に Agg バックエンドと日本語フォントを読み込みます。
+描画に使う表・引数と、描画関数のスクリプト (設定項目を含む) のハッシュが前回と同じで、
+出力ファイルが残っているジョブは描画しません。(前回のハッシュは render_cache フォルダに保存します)
+'''
+
+
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# ----------------------------------------------------------------------
+# 設定項目
+# ----------------------------------------------------------------------
+# 同時に描画するプロセスの数 (None の場合は CPU のコア数)
+RENDER_WORKERS = None
+
+# 描画済みのグラフのハッシュの保存先 (このファイルと同じ階層)
+CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'render_cache')
+# ----------------------------------------------------------------------
+
+
+def render_job(output_path, func, *args, **kwargs):
+    """
+    描画のジョブを作ります。func(*args, **kwargs) が output_path にグラフを保存する関数です。
+    (プロセスプールに渡すため、func はモジュールの最上位で定義した関数にしてください)
+    """
+    return {'output_path': os.path.abspath(output_path), 'func': func, 'args': args, 'kwargs': kwargs}
+
+
+def _update_hash(digest, value):
+    """表・引数の内容をハッシュに加えます。DataFrame / Series は値・インデックス・列名・型を使います。"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(type(value).__name__.encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        if isinstance(value, pd.DataFrame):
+            digest.update(repr(list(value.columns)).encode('utf-8'))
+            digest.update(repr(list(value.dtypes.astype(str))).encode('utf-8'))
+        else:
+            digest.update(repr((value.name, str(value.dtype))).encode('utf-8'))
+        digest.update(repr(list(value.index.names)).encode('utf-8'))
+    elif isinstance(value, pd.Index):
+        _update_hash(digest, value.to_series())
+    elif isinstance(value, np.ndarray):
+        digest.update(repr((value.dtype.str, value.shape)).encode('utf-8'))
+        digest.update(pickle.dumps(value, protocol=4))
+    elif isinstance(value, dict):
+        digest.update(b'{')
+        for key in sorted(value, key=repr):
+            digest.update(repr(key).encode('utf-8'))
+            _update_hash(digest, value[key])
+        digest.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        digest.update(b'[')
+        for item in value:
+            _update_hash(digest, item)
+        digest.update(b']')
+    else:
+        digest.update(repr(value).encode('utf-8'))
+
+
+def job_hash(job):
+    """ジョブのハッシュ (描画関数のスクリプト・表・引数から求めた値) を返します。"""
+    digest = hashlib.sha256()
+    source_file = inspect.getsourcefile(job['func'])
+    with open(source_file, 'rb') as f:
+        digest.update(f.read())
+    digest.update(job['func'].__qualname__.encode('utf-8'))
+    _update_hash(digest, job['args'])
+    _update_hash(digest, job['kwargs'])
+    return digest.hexdigest()
+
+
+def _record_path(output_path, cache_dir=None):
+    key = hashlib.sha256(output_path.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir or CACHE_DIR, f"{key}.json")
+
+
+def is_up_to_date(job, digest, cache_dir=None):
+    """出力ファイルが残っていて、前回描画した時のハッシュが digest と同じかを返します。"""
+    record_path = _record_path(job['output_path'], cache_dir)
+    if not (os.path.exists(job['output_path']) and os.path.exists(record_path)):
+        return False
+    try:
+        with open(record_path, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return record.get('hash') == digest and record.get('mtime_ns') == os.stat(job['output_path']).st_mtime_ns
+
+
+def _save_record(job, digest, cache_dir=None):
+    """描画したグラフのハッシュを保存します。(データがないなどで出力されなかった場合は保存しません)"""
+    if not os.path.exists(job['output_path']):
+        return
+    record_path = _record_path(job['output_path'], cache_dir)
+    os.makedirs(os.path.dirname(record_path), exist_ok=True)
+    tmp_path = f"{record_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'output': job['output_path'], 'hash': digest,
+                   'mtime_ns': os.stat(job['output_path']).st_mtime_ns}, f, ensure_ascii=False)
+    os.replace(tmp_path, record_path)
+
+
+def load_plotting():
+    """
+    matplotlib.pyplot・seaborn・日本語フォント (japanize_matplotlib) を読み込み、(plt, sns) を返します。
+    読み込みに数秒かかるため、集計だけの実行で読み込まないよう、グラフを作成する関数の中で呼び出してください。
+    (2回目以降は読み込み済みのモジュールを返すだけです)
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    import japanize_matplotlib  # noqa: F401
+    return plt, sns
+
+
+def _init_worker():
+    """描画プロセスの開始時に、Agg バックエンドと日本語フォントを読み込んでおきます。"""
+    import matplotlib
+    matplotlib.use('Agg')
+    load_plotting()
+    # フォントの検索結果をキャッシュしておく (最初の描画で時間がかからないように)
+    from matplotlib import font_manager
+    font_manager.findfont(matplotlib.rcParams['font.family'][0])
+
+
+def _run_job(job):
+    job['func'](*job['args'], **job['kwargs'])
+    return job['output_path']
+
+
+def render_all(jobs, workers=None, cache_dir=None):
+    """
+    ジョブを描画します。前回から変わっていないジョブは描画しません。
+    描画するジョブが2つ以上ある場合はプロセスプールで並列に描画します。
+    戻り値は (描画した数, 描画しなかった数) です。描画に失敗したジョブがあった場合は、すべて終わった後に例外を送出します。
+    """
+    jobs = [job for job in jobs if job is not None]
+    pending = []
+    for job in jobs:
+        digest = job_hash(job)
+        if is_up_to_date(job, digest, cache_dir):
+            logging.info(f"変更がないため描画しません: {job['output_path']}")
+        else:
+            pending.append((job, digest))
+
+    workers = workers or RENDER_WORKERS or os.cpu_count() or 1
+    errors = []
+    if len(pending) <= 1 or workers <= 1:
+        for job, digest in pending:
+            _run_job(job)
+            _save_record(job, digest, cache_dir)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=_init_worker) as executor:
+            futures = [(executor.submit(_run_job, job), job, digest) for job, digest in pending]
+            for future, job, digest in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"グラフの描画に失敗しました: {job['output_path']}: {e}")
+                    errors.append(e)
+                    continue
+                _save_record(job, digest, cache_dir)
+    if errors:
+        raise errors[0]
+
+    logging.info(f"グラフを {len(pending)} 枚描画しました。(変更がないもの {len(jobs) - len(pending)} 枚)")
+    return len(pending), len(jobs) - len(pending)
@@ -0,0 +1,284 @@
+'''
+各スクリプトの STEP ごとの処理時間・CPU 時間・行数・メモリ使用量を記録し、実行ごとに JSON のレポートを出力するモジュール
+
+スクリプトの実行全体を run() で囲み、各 STEP の始めに step() を呼び出します。
+(次の step() を呼び出すか run() を抜けると、その STEP の記録を終えます)
+    if __name__ == '__main__':
+        with run_report.run('totalling'):
+            main()
+
+    def main():
+        run_report.step('STEP 1: 読み込み')
+        df = ...
+        run_report.set_rows(rows_out=len(df))
+        run_report.step('STEP 2: 集計', rows_in=len(df))
+
+ページごとの取得など、繰り返し行う処理は timed() で囲むと、同じ名前の記録に時間と行数を足し合わせます。
+    with run_report.timed('JSON解析・整形', rows_in=len(items)) as record:
+        ...
+        record.add_rows(rows_out=n)
+
+run() の外で呼び出した場合 (他のスクリプトから関数だけを使う場合など) は何も記録しません。
+レポートは REPORT_DIR/<名前>_<日時>.json に保存されます。(夜間の実行結果の比較用)
+各 STEP の peak_rss_mb は、その STEP の終了時点までのプロセス全体のピーク時のメモリ使用量です。(値が増えた STEP がメモリを多く使った STEP です)
+'''
+
+
+import json
+import os
+import platform
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# ----------------------------------------------------------------------
+# 設定項目
+# ----------------------------------------------------------------------
+# レポートの保存先 (環境変数 RUN_REPORT_DIR で変更できます。既定はこのファイルと同じ階層の run_reports)
+REPORT_DIR = os.environ.get('RUN_REPORT_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'run_reports')
+
+# False の場合はレポートを保存しません
+ENABLED = True
+# ----------------------------------------------------------------------
+
+_current_run = None
+
+
+def _windows_memory():
+    """Windows の (現在のメモリ使用量, ピーク時のメモリ使用量) をバイトで返します。"""
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None, None
+    return counters.WorkingSetSize, counters.PeakWorkingSetSize
+
+
+def memory_mb():
+    """
+    このプロセスの (現在のメモリ使用量 (RSS), ピーク時のメモリ使用量) を MB で返します。取得できない値は None です。
+    (Linux の ru_maxrss は親プロセスの値を引き継ぐため、Linux では /proc の VmRSS / VmHWM を使います)
+    """
+    if sys.platform.startswith('linux'):
+        values = {}
+        try:
+            with open('/proc/self/status', 'r', encoding='ascii') as f:
+                for line in f:
+                    if line.startswith(('VmRSS:', 'VmHWM:')):
+                        values[line.split(':')[0]] = int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        if 'VmHWM' in values:
+            return values.get('VmRSS'), values['VmHWM']
+    if sys.platform == 'win32':
+        try:
+            rss, peak = _windows_memory()
+        except (OSError, AttributeError):
+            rss, peak = None, None
+        if peak is not None:
+            return rss / (1024 * 1024), peak / (1024 * 1024)
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト、それ以外は KB 単位
+    return None, peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def peak_rss_mb():
+    """このプロセスのピーク時のメモリ使用量 (MB) を返します。取得できない環境では None を返します。"""
+    return memory_mb()[1]
+
+
+def _children_cpu():
+    """終了した子プロセス (プロセスプールの作業プロセスなど) の CPU 時間の合計を返します。(Windows では 0)"""
+    t = os.times()
+    return t.children_user + t.children_system
+
+
+def _round(value, digits=3):
+    return round(value, digits) if value is not None else None
+
+
+class StepRecord:
+    """1つの STEP (または timed() で足し合わせる処理) の記録"""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_sec = 0.0
+        self.cpu_sec = 0.0
+        self.child_cpu_sec = 0.0
+        self.rows_in = None
+        self.rows_out = None
+        self.rss_mb = None
+        self.peak_rss_mb = None
+        self._started = None
+
+    def start(self):
+        self._started = (time.perf_counter(), time.process_time(), _children_cpu())
+
+    def stop(self):
+        if self._started is None:
+            return
+        wall, cpu, child_cpu = self._started
+        self.calls += 1
+        self.wall_sec += time.perf_counter() - wall
+        self.cpu_sec += time.process_time() - cpu
+        self.child_cpu_sec += _children_cpu() - child_cpu
+        self.rss_mb, peak = memory_mb()
+        if peak is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb or 0, peak)
+        self._started = None
+
+    def add_rows(self, rows_in=None, rows_out=None):
+        if rows_in is not None:
+            self.rows_in = (self.rows_in or 0) + int(rows_in)
+        if rows_out is not None:
+            self.rows_out = (self.rows_out or 0) + int(rows_out)
+
+    def to_dict(self):
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'wall_sec': _round(self.wall_sec),
+            'cpu_sec': _round(self.cpu_sec),
+            'child_cpu_sec': _round(self.child_cpu_sec),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_per_sec': round(rows / self.wall_sec) if rows is not None and self.wall_sec > 0 else None,
+            'rss_mb': _round(self.rss_mb, 1),
+            'peak_rss_mb': _round(self.peak_rss_mb, 1),
+        }
+
+
+class _Run:
+    def __init__(self, name):
+        self.name = name
+        self.steps = {}
+        self.current = None
+        self.started_at = datetime.now()
+        self.total = StepRecord(name)
+        self.total.start()
+
+    def record(self, name):
+        if name not in self.steps:
+            self.steps[name] = StepRecord(name)
+        return self.steps[name]
+
+    def end_step(self):
+        if self.current is not None:
+            self.current.stop()
+            self.current = None
+
+    def report(self, status, error=None):
+        self.end_step()
+        self.total.stop()
+        total = self.total.to_dict()
+        return {
+            'script': self.name,
+            'argv': sys.argv[1:],
+            'status': status,
+            'error': error,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'wall_sec': total['wall_sec'],
+            'cpu_sec': total['cpu_sec'],
+            'child_cpu_sec': total['child_cpu_sec'],
+            'peak_rss_mb': total['peak_rss_mb'],
+            'steps': [step.to_dict() for step in self.steps.values()],
+        }
+
+
+def save_report(report, report_dir=None):
+    """レポートを JSON で保存し、そのパスを返します。"""
+    report_dir = report_dir or REPORT_DIR
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f"{report['script']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    return path
+
+
+@contextmanager
+def run(name, report_dir=None):
+    """スクリプトの実行全体を記録し、終了時 (例外で終了した場合も) にレポートを保存します。"""
+    global _current_run
+    previous, _current_run = _current_run, _Run(name)
+    status, error = 'ok', None
+    try:
+        yield _current_run
+    except KeyboardInterrupt:
+        status, error = 'interrupted', 'KeyboardInterrupt'
+        raise
+    except BaseException as e:
+        # sys.exit(0) は正常終了として扱う
+        if not (isinstance(e, SystemExit) and not e.code):
+            status, error = 'failed', f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        report = _current_run.report(status, error)
+        _current_run = previous
+        if ENABLED:
+            try:
+                save_report(report, report_dir)
+            except OSError as e:
+                print(f"警告: 実行レポートを保存できませんでした: {e}", file=sys.stderr)
+
+
+def step(name, rows_in=None):
+    """前の STEP の記録を終え、新しい STEP の記録を始めます。"""
+    if _current_run is None:
+        return None
+    _current_run.end_step()
+    record = _current_run.record(name)
+    record.add_rows(rows_in=rows_in)
+    record.start()
+    _current_run.current = record
+    return record
+
+
+def set_rows(rows_in=None, rows_out=None):
+    """現在の STEP の入力・出力の行数を記録します。(複数回呼び出すと足し合わせます)"""
+    if _current_run is not None and _current_run.current is not None:
+        _current_run.current.add_rows(rows_in, rows_out)
+
+
+def end_step():
+    """現在の STEP の記録を終えます。(STEP の後に記録しない処理が続く場合に使います)"""
+    if _current_run is not None:
+        _current_run.end_step()
+
+
+@contextmanager
+def timed(name, rows_in=None, rows_out=None):
+    """
+    囲んだ処理の時間と行数を、name の記録に足し合わせます。(繰り返し行う処理用)
+    STEP の中で使った場合、その時間は STEP の時間にも含まれます。
+    """
+    if _current_run is None:
+        yield StepRecord(name)
+        return
+    record = _current_run.record(name)
+    record.add_rows(rows_in, rows_out)
+    record.start()
+    try:
+        yield record
+    finally:
+        record.stop()
@@ -1,23 +1,35 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import japanize_matplotlib
-import matplotlib.dates as mdates
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dimensions
+import render_farm
 
 # --- 設定 ---
 INPUT_CSV = 'closest_node_per_interval_with_names.csv'
 OUTPUT_IMAGE = 'stay_area/area_occupancy_trend.png'
 
 
-def plot_area_occupancy_trend(file_path):
+def compute_area_occupancy(file_path):
+    """ 時刻・エリアごとの滞在人数 (ユニークなタグ数) の表を作る """
     # 1. データの読み込み
-    df = pd.read_csv(file_path, parse_dates=['datetime'])
+    # (場所・タグは登録簿のコードを持つカテゴリ型で読み込む)
+    df = dimensions.read_enriched_csv(file_path, parse_dates=['datetime'])
 
     # 2. 時間とエリアごとにユニークなタグID（人数）をカウント
     # 5分ごとの集計データであることを前提に、datetimeとplace_nameでグループ化
-    occupancy_df = df.groupby(['datetime', 'place_name'])[
-        'tag_id'].nunique().reset_index()
+    # (カテゴリ型のコードでグループ化し、結果の場所名は文字列の昇順に戻す)
+    occupancy_df = dimensions.with_label_index(df.groupby(
+        ['datetime', 'place_name'], observed=True, sort=False)['tag_id'].nunique()).reset_index()
     occupancy_df.columns = ['datetime', 'place_name', 'user_count']
+    return occupancy_df
+
+
+def plot_area_occupancy_trend(occupancy_df):
+    # グラフのライブラリはここで初めて読み込む (集計だけの実行では読み込まない)
+    plt, sns = render_farm.load_plotting()
+    import matplotlib.dates as mdates
 
     # 3. グラフ描画（ピボットテーブルに変換して、データがない時間を0で埋める）
     plot_data = occupancy_df.pivot(
@@ -52,8 +64,23 @@ def plot_area_occupancy_trend(file_path):
     plt.show()
 
 
-if __name__ == '__main__':
+def main(plot=True):
     try:
-        plot_area_occupancy_trend(INPUT_CSV)
+        occupancy_df = compute_area_occupancy(INPUT_CSV)
     except FileNotFoundError:
         print(f"エラー: {INPUT_CSV} が見つかりません。先に解析スクリプトを実行してください。")
+        return False
+
+    if not plot:
+        print("エリアごとの最大滞在人数:")
+        print(occupancy_df.groupby('place_name')['user_count'].max().sort_values(ascending=False))
+        return
+    plot_area_occupancy_trend(occupancy_df)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='時刻別の在席エリア推移グラフの作成')
+    parser.add_argument('--no-plot', action='store_true',
+                        help='グラフを作成せず、エリアごとの最大滞在人数の表示だけを行う')
+    if main(plot=not parser.parse_args().no_plot) is False:
+        sys.exit(1)
@@ -0,0 +1,204 @@
+'''
+生データ (processed_tag_data) の省メモリな型定義と変換処理
+
+各列を次の型で保持します (1行あたり 21 バイト)。
+    datetime : int64   エポックミリ秒 (DynamoDB のローカル時刻をそのまま UTC とみなした値)
+    node_id  : int16
+    tag_id   : int64   12桁の16進数 (MACアドレス) を整数にしたもの
+    tag_rssi : int8
+    tag_volt : uint16  ミリボルト (0 は欠損)
+
+文字列のまま読み込む場合に比べて数分の1〜10分の1程度のメモリで済むため、
+生データを読み込むスクリプトは read_raw_csv / raw_store.read_raw_data(compact=True) で
+この型のまま読み込み、出力する直前に from_compact で元の表記に戻します。
+node_id が int16 の範囲外の行と、tag_id を整数に変換できない行は、別の値と混ざらないよう警告を出して除外します。
+'''
+
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+COMPACT_DTYPES = {
+    'datetime': 'int64',
+    'node_id': 'int16',
+    'tag_id': 'int64',
+    'tag_rssi': 'int8',
+    'tag_volt': 'uint16',
+}
+
+RAW_COLUMNS = list(COMPACT_DTYPES)
+
+# DynamoDB の datetime の書式
+RAW_DATETIME_FORMAT = '%Y/%m/%d %H:%M:%S.%f'
+
+# tag_id を整数に変換できなかった場合の値
+INVALID_TAG_ID = -1
+
+
+def pack_tag_id(tag_id):
+    """1つの tag_id (12桁の16進数文字列) を整数に変換します。変換できない場合は -1 を返します。"""
+    try:
+        value = int(str(tag_id).strip(), 16)
+    except ValueError:
+        return INVALID_TAG_ID
+    return value if 0 <= value < (1 << 48) else INVALID_TAG_ID
+
+
+def unpack_tag_id(value):
+    """整数にした tag_id を12桁の16進数文字列に戻します。"""
+    return format(int(value), '012x') if value >= 0 else ''
+
+
+def pack_tag_ids(series, warn_invalid=True):
+    """
+    tag_id の列をまとめて整数に変換します。変換できない値は -1 になります。
+    タグの種類は少ないため、ユニークな値だけを変換して全体に展開します。
+    """
+    if pd.api.types.is_integer_dtype(series):
+        return series.to_numpy(dtype='int64')
+    codes, uniques = pd.factorize(series.astype(str), use_na_sentinel=True)
+    packed = np.array([pack_tag_id(u) for u in uniques] + [INVALID_TAG_ID], dtype='int64')
+    invalid = [u for u in uniques if pack_tag_id(u) == INVALID_TAG_ID]
+    if invalid and warn_invalid:
+        logging.warning(f"16進数として解釈できない tag_id があります: {invalid[:5]}")
+    return packed[codes]
+
+
+def unpack_tag_ids(values):
+    """整数にした tag_id の配列を、16進数文字列の配列に戻します。"""
+    values = np.asarray(values, dtype='int64')
+    codes, uniques = pd.factorize(values)
+    labels = np.array([unpack_tag_id(u) for u in uniques], dtype=object)
+    return labels[codes]
+
+
+def datetime_to_epoch_ms(series):
+    """datetime 列 (文字列または datetime64) をエポックミリ秒の int64 配列に変換します。"""
+    if pd.api.types.is_integer_dtype(series):
+        return series.to_numpy(dtype='int64')
+    if not pd.api.types.is_datetime64_any_dtype(series):
+        try:
+            series = pd.to_datetime(series, format=RAW_DATETIME_FORMAT)
+        except (ValueError, TypeError):
+            series = pd.to_datetime(series, format='mixed', errors='coerce')
+    values = series.to_numpy(dtype='datetime64[ms]')
+    result = values.astype('int64')
+    result[np.isnat(values)] = np.iinfo('int64').min
+    return result
+
+
+def epoch_ms_to_datetime(values):
+    """エポックミリ秒の配列を datetime64[ms] に戻します。"""
+    return np.asarray(values, dtype='int64').astype('datetime64[ms]')
+
+
+def _warn_rejected(column, values, reason):
+    """除外した行の件数と値の例を警告します。"""
+    examples = pd.unique(pd.Series(values).astype(str))[:5].tolist()
+    logging.warning(f"{column} が{reason}ため、{len(values)} 行を除外しました: {examples}")
+
+
+def to_compact(df):
+    """
+    生データの DataFrame を省メモリな型 (COMPACT_DTYPES) に変換します。
+    すでに変換済みの列はそのまま使います。datetime / node_id / tag_rssi が欠損している行は除外します。
+    node_id が int16 に収まらない整数の行と、tag_id を整数に変換できない行も、警告を出して除外します。
+    (int16 に切り詰めたり、すべて -1 にまとめたりすると、別のノード・タグと区別できなくなるため)
+    """
+    columns = [c for c in RAW_COLUMNS if c in df.columns]
+    out = {}
+    valid = np.ones(len(df), dtype=bool)
+
+    if 'datetime' in columns:
+        out['datetime'] = datetime_to_epoch_ms(df['datetime'])
+        valid &= out['datetime'] != np.iinfo('int64').min
+    if 'node_id' in columns:
+        node = pd.to_numeric(df['node_id'], errors='coerce')
+        node_limits = np.iinfo('int16')
+        in_range = (node >= node_limits.min) & (node <= node_limits.max) & (node.round() == node)
+        rejected = node.notna() & ~in_range
+        if rejected.any():
+            _warn_rejected('node_id', df['node_id'][rejected.to_numpy()], ' int16 の範囲の整数ではない')
+        valid &= in_range.to_numpy()
+        out['node_id'] = node.where(in_range, 0).to_numpy().astype('int16')
+    if 'tag_id' in columns:
+        out['tag_id'] = pack_tag_ids(df['tag_id'], warn_invalid=False)
+        rejected = out['tag_id'] == INVALID_TAG_ID
+        if rejected.any():
+            _warn_rejected('tag_id', df['tag_id'][rejected], '16進数の ID として解釈できない')
+        valid &= ~rejected
+    if 'tag_rssi' in columns:
+        rssi = pd.to_numeric(df['tag_rssi'], errors='coerce')
+        valid &= rssi.notna().to_numpy()
+        out['tag_rssi'] = rssi.fillna(0).round().clip(-128, 127).to_numpy().astype('int8')
+    if 'tag_volt' in columns:
+        if df['tag_volt'].dtype == np.dtype('uint16'):
+            out['tag_volt'] = df['tag_volt'].to_numpy()
+        else:
+            volt = pd.to_numeric(df['tag_volt'], errors='coerce')
+            out['tag_volt'] = (volt * 1000).round().fillna(0).clip(0, 65535).to_numpy().astype('uint16')
+
+    compact = pd.DataFrame(out, columns=columns)
+    if not valid.all():
+        compact = compact[valid].reset_index(drop=True)
+    return compact
+
+
+def from_compact(df):
+    """
+    省メモリな型の DataFrame を、CSV 出力や名前の結合に使う元の表記に戻します。
+    (datetime は datetime64, tag_id は16進数文字列, tag_volt はボルト)
+    compact 型でない列や、それ以外の列はそのまま残します。
+    """
+    df = df.copy()
+    if 'datetime' in df.columns and pd.api.types.is_integer_dtype(df['datetime']):
+        df['datetime'] = epoch_ms_to_datetime(df['datetime'])
+    if 'tag_id' in df.columns and pd.api.types.is_integer_dtype(df['tag_id']):
+        df['tag_id'] = unpack_tag_ids(df['tag_id'])
+    if 'node_id' in df.columns and pd.api.types.is_integer_dtype(df['node_id']):
+        df['node_id'] = df['node_id'].astype('int64')
+    if 'tag_rssi' in df.columns and df['tag_rssi'].dtype == np.dtype('int8'):
+        df['tag_rssi'] = df['tag_rssi'].astype('int64')
+    if 'tag_volt' in df.columns and df['tag_volt'].dtype == np.dtype('uint16'):
+        volt = df['tag_volt'].astype('float64') / 1000
+        df['tag_volt'] = volt.where(df['tag_volt'] > 0)
+    return df
+
+
+def as_analysis_frame(df):
+    """
+    compact 型の DataFrame の datetime 列だけを datetime64[ms] にします。
+    (pd.Grouper などの時刻処理に使えるようにするため。メモリ使用量は変わりません)
+    """
+    if 'datetime' in df.columns and pd.api.types.is_integer_dtype(df['datetime']):
+        df = df.copy()
+        df['datetime'] = epoch_ms_to_datetime(df['datetime'])
+    return df
+
+
+def iter_raw_csv(path, columns=None, chunk_rows=1000000):
+    """processed_tag_data*.csv を chunk_rows 行ずつ読み込み、compact 型に変換して順に返すジェネレータです。"""
+    usecols = columns or RAW_COLUMNS
+    for chunk in pd.read_csv(path, usecols=usecols, dtype={'tag_id': str, 'datetime': str},
+                             chunksize=chunk_rows):
+        yield to_compact(chunk)
+
+
+def read_raw_csv(path, columns=None, chunk_rows=1000000):
+    """
+    processed_tag_data*.csv を chunk_rows 行ずつ読み込み、compact 型に変換して返します。
+    文字列のまま全体を読み込むことがないため、読み込み中のメモリ使用量も抑えられます。
+    """
+    usecols = columns or RAW_COLUMNS
+    chunks = list(iter_raw_csv(path, usecols, chunk_rows))
+    if not chunks:
+        return empty_compact_frame(usecols)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def empty_compact_frame(columns=None):
+    """列と型だけを持つ空の DataFrame を返します。"""
+    columns = columns or RAW_COLUMNS
+    return pd.DataFrame({c: pd.Series(dtype=COMPACT_DTYPES[c]) for c in columns})
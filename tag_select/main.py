@@ -3,17 +3,32 @@
 '''
 
 
+import os
+import sys
+
 import pandas as pd
 
-# 1. 元のCSVファイルを読み込む
-df = pd.read_csv('processed_tag_data.csv')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import raw_store
+import tag_schema
 
-# 2. tag_id が 0081f986054d の行だけを抽出
+# tag_id が 0081f986054d の行だけを抽出
 # ※ IDが文字列として認識されるよう、条件を指定します
 target_id = '0081f986054d'
 
-
-filtered_df = df[df['tag_id'] == target_id]
+if raw_store.has_data():
+    # 1. raw_store から日付ごとに compact 型のまま読み込み、対象タグの行だけを残す
+    target_code = tag_schema.pack_tag_id(target_id)
+    filtered_df = tag_schema.from_compact(pd.concat(
+        [df_day[df_day['tag_id'] == target_code]
+         for df_day in raw_store.iter_raw_partitions(compact=True)],
+        ignore_index=True))
+else:
+    # 1. 元のCSVファイルを読み込む
+    df = pd.read_csv('processed_tag_data.csv')
+
+    # 2. 対象タグの行だけを抽出
+    filtered_df = df[df['tag_id'] == target_id]
 
 # 3. 結果を新しいCSVファイルとして保存
 filtered_df.to_csv('tag_select/output.csv', index=False)
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import totalling
+
+
+def make_place_table():
+    return pd.DataFrame({
+        'node_id': ['691', '692'],
+        'display_name': ['1-1_ホール', '1-2_アエラス'],
+        'floor': [1.0, 1.0],
+        'west_to_east': [1.0, 2.0],
+    })
+
+
+def test_unmapped_nodes_get_their_own_display_name():
+    # 700 と 701 は node_names.csv にないノード (解析スクリプトが place_name を node_id で埋めている)
+    df = pd.DataFrame({
+        'node_id': pd.Categorical(['691', '700', '701', '692', '700', np.nan],
+                                  categories=['691', '692', '700', '701', '999']),
+        'place_name': ['ホール', '700', '701', 'アエラス', '700', np.nan],
+    })
+
+    result = totalling.attach_display_name(df, make_place_table())
+
+    assert result['display_name'].tolist() == [
+        '1-1_ホール', '?-?_700', '?-?_701', '1-2_アエラス', '?-?_700', totalling.UNKNOWN_DISPLAY_NAME]
+
+
+def test_unmapped_node_without_place_name_uses_node_id():
+    df = pd.DataFrame({'node_id': pd.Categorical(['700', '691'])})
+
+    result = totalling.attach_display_name(df, make_place_table())
+
+    assert result['display_name'].tolist() == ['?-?_700', '1-1_ホール']
@@ -1,31 +1,163 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import japanize_matplotlib
+import argparse
 import os
-import matplotlib.cm as cm
+import sys
 import numpy as np
+import dimensions
+import render_farm
+import run_report
 
 # --- 設定項目 ---
 INPUT_CSV_FILE = 'closest_node_per_interval_with_names.csv'
+NODE_NAME_CSV_FILE = 'node_names.csv'
 OUTPUT_FOLDER = 'output_files'
 TIME_INTERVAL_MINUTES = 5
 
 TAGS_TO_EXCLUDE = ['f0f8f2cad80b', '0081f98607c1']
 
+# 集計キューブ (人・部門・エリア・日ごとの件数) の出力ファイル名 (OUTPUT_FOLDER 内)
+CUBE_CSV_FILE = 'totalling_cube.csv'
+
+# 集計キューブのキー
+CUBE_KEYS = ['tag_name', 'department', 'display_name', 'date']
+
+
+def format_display_name(place_name, floor, west_to_east):
+    """ 表示名 [階-位置_名称] を作る (フロア・位置が不明な場合は ?) """
+    f = f"{int(float(floor))}" if pd.notnull(floor) else "?"
+    w = f"{int(float(west_to_east))}" if pd.notnull(west_to_east) else "?"
+    return f"{f}-{w}_{place_name}"
+
+
+# node_id が欠損している行の表示名
+UNKNOWN_DISPLAY_NAME = format_display_name(np.nan, np.nan, np.nan)
+
+
+def load_place_table(path):
+    """
+    node_names.csv から、ノードごとの表示名・フロア・位置の表を作る。
+    (表示名はノードの数だけ作り、データの各行にはノードのコードで展開する)
+    """
+    nodes = pd.read_csv(path)
+    floors = pd.to_numeric(nodes['floor'], errors='coerce')
+    positions = pd.to_numeric(nodes['west_to_east'], errors='coerce')
+    return pd.DataFrame({
+        'node_id': nodes['node_id'],
+        'display_name': [format_display_name(p, f, w)
+                         for p, f, w in zip(nodes['place_name'], floors, positions)],
+        'floor': floors,
+        'west_to_east': positions,
+    })
+
+
+def unknown_place_names(df, node_codes, unknown):
+    """ unknown (node_id のコード) のノードごとに、最初の行の place_name を {コード: 名称} で返す """
+    if 'place_name' not in df.columns:
+        return {}
+    rows = np.flatnonzero(np.isin(node_codes, unknown))
+    names = pd.Series(np.asarray(df['place_name'], dtype=object)[rows], index=node_codes[rows])
+    names = names.dropna()
+    return names[~names.index.duplicated()].to_dict()
+
+
+def attach_display_name(df, place_table):
+    """
+    df に表示名の列 (display_name、カテゴリ型) を追加する。
+    node_id のカテゴリ (ノードの種類) ごとに place_table の表示名を求め、行にはコードで展開する。
+    place_table にないノードは、そのノードの行の place_name (解析スクリプトが node_id で埋めたもの) から
+    ノードごとに別の表示名 [?-?_名称] を作る。
+    """
+    node_codes = df['node_id'].cat.codes.to_numpy()
+    node_ids = df['node_id'].cat.categories.to_numpy()
+    positions = dimensions.lookup_positions(node_ids, place_table['node_id'].to_numpy())
+    table_names = place_table['display_name'].to_numpy()
+    labels = np.where(positions >= 0, table_names[np.maximum(positions, 0)], None)
+
+    unknown = np.flatnonzero(positions < 0)
+    if len(unknown):
+        place_names = unknown_place_names(df, node_codes, unknown)
+        labels[unknown] = [format_display_name(place_names.get(code, node_ids[code]), np.nan, np.nan)
+                           for code in unknown]
+    # 最後の要素は node_id が欠損している行 (コード -1) 用
+    labels = np.append(labels, UNKNOWN_DISPLAY_NAME)
+    label_codes, display_names = pd.factorize(labels)
+    df['display_name'] = pd.Categorical.from_codes(
+        label_codes[node_codes], categories=display_names)
+    return df
+
+
+def build_floor_color_map(place_table, extra_names=()):
+    """
+    ノードの表から、フロアごとの色相で位置順にグラデーションをつけたカラーマップを作る。
+    戻り値は (フロア・位置順の表示名のリスト, {表示名: 色})。extra_names (表にない表示名) は最後に灰色で追加する。
+    """
+    from matplotlib import colormaps  # グラフを作成する時だけ読み込む
+
+    place_info = place_table[['display_name', 'floor', 'west_to_east']].drop_duplicates()
+    place_info = place_info.sort_values(by=['floor', 'west_to_east'], kind='stable')
 
-def plot_overall_stacked_bar_graph(df, group_by_col, title, output_filename, sorted_names, color_map, mode='percentage'):
-    """ 期間全体での滞在グラフを作成する """
+    sorted_display_names = place_info['display_name'].unique().tolist()
+    sorted_display_names += [n for n in extra_names if n not in sorted_display_names]
+
+    # フロアごとの色相セット
+    cmaps = ['Blues', 'Oranges', 'Greens', 'Reds',
+             'Purples', 'Greys', 'YlOrBr', 'PuRd']
+    unique_floors = sorted(place_info['floor'].dropna().unique())
+    floor_to_cmap = {floor: cmaps[i % len(cmaps)]
+                     for i, floor in enumerate(unique_floors)}
+
+    color_map = {}
+    for floor in unique_floors:
+        floor_data = place_info[place_info['floor'] == floor]
+        n_items = len(floor_data)
+        cmap = colormaps[floor_to_cmap[floor]]
+        # 0.3〜0.9の範囲でグラデーション（薄すぎず濃すぎない範囲）
+        colors = [cmap(val) for val in np.linspace(0.4, 0.9, n_items)]
+        for name, color in zip(floor_data['display_name'], colors):
+            color_map[name] = color
+
+    # フロア不明用
+    for name in sorted_display_names:
+        if name not in color_map:
+            color_map[name] = (0.5, 0.5, 0.5, 1.0)
+    return sorted_display_names, color_map
+
+
+def build_count_cube(df):
+    """
+    人・部門・エリア・日ごとの件数 (5分間隔の数) の表 (集計キューブ) を1回の集計で作る。
+    全体・日別・週別・月別のグラフはすべてこの表から求める。(部門やタグ名が欠損している行も残す)
+    """
+    keys_df = pd.DataFrame({
+        'tag_name': df['tag_name'], 'department': df['department'],
+        'display_name': df['display_name'], 'date': df['datetime'].dt.normalize()})
+    cube = dimensions.group_size(keys_df, CUBE_KEYS, dropna=False).reset_index(name='count')
+    cube['duration'] = cube['count'] * TIME_INTERVAL_MINUTES
+    return cube
+
+
+def cube_counts(cube, keys):
+    """集計キューブを keys ごとに合計した件数の表を返す。(keys のいずれかが欠損している行は除く)"""
+    return cube.groupby(keys)['count'].sum().reset_index()
+
+
+def save_count_cube(cube):
+    """集計キューブを CSV に出力する。"""
+    output = cube[CUBE_KEYS + ['count', 'duration']].rename(columns={'duration': 'duration_minutes'})
+    output['date'] = output['date'].dt.strftime('%Y-%m-%d')
+    output.to_csv(os.path.join(OUTPUT_FOLDER, CUBE_CSV_FILE), index=False, encoding='utf-8-sig')
+
+
+def overall_stacked_bar_job(cube, group_by_col, title, output_filename, sorted_names, color_map, mode='percentage'):
+    """ 期間全体での滞在グラフの表を作り、描画のジョブを返す """
     print(f"--- {title} 作成開始 ---")
-    counts = df.groupby([group_by_col, 'display_name']
-                        ).size().reset_index(name='count')
+    counts = cube_counts(cube, [group_by_col, 'display_name'])
     if counts.empty:
-        return
+        return None
 
     if mode == 'percentage':
-        total_counts = counts.groupby(group_by_col)['count'].sum()
-        counts['percentage'] = counts.apply(
-            lambda row: 100 * row['count'] / total_counts[row[group_by_col]], axis=1)
+        total_counts = counts.groupby(group_by_col)['count'].transform('sum')
+        counts['percentage'] = 100 * counts['count'] / total_counts
         value_col, y_label = 'percentage', '滞在割合 (%)'
     else:
         counts['duration'] = counts['count'] * TIME_INTERVAL_MINUTES
@@ -39,6 +171,14 @@ def plot_overall_stacked_bar_graph(df, group_by_col, title, output_filename, sor
     # ★ カスタムカラーリストを作成
     colors = [color_map[col] for col in pivot_df.columns]
 
+    output_path = os.path.join(OUTPUT_FOLDER, output_filename)
+    return render_farm.render_job(output_path, draw_overall_stacked_bar_graph,
+                                  pivot_df, colors, title, y_label, group_by_col, mode, output_path)
+
+
+def draw_overall_stacked_bar_graph(pivot_df, colors, title, y_label, group_by_col, mode, output_path):
+    """ 期間全体での滞在グラフを描画する """
+    plt, _ = render_farm.load_plotting()
     figsize = (16, 9) if group_by_col == 'tag_name' else (12, 7)
     fig, ax = plt.subplots(figsize=figsize)
     pivot_df.plot(kind='bar', stacked=True, ax=ax, color=colors,
@@ -54,22 +194,19 @@ def plot_overall_stacked_bar_graph(df, group_by_col, title, output_filename, sor
     ax.legend(title='エリア [階-位置_名称]', bbox_to_anchor=(1.02,
               1), loc='upper left', fontsize=9)
     plt.tight_layout(rect=[0, 0, 0.85, 1])
-    plt.savefig(os.path.join(OUTPUT_FOLDER, output_filename), dpi=300)
+    plt.savefig(output_path, dpi=300)
     plt.close(fig)
 
 
-def plot_trends_stacked_bar_graph(df, time_col, title_prefix, output_filename, sorted_names, color_map, mode='percentage'):
-    """ 部門別の時系列推移グラフを作成する """
+def trends_stacked_bar_job(cube, time_col, title_prefix, output_filename, sorted_names, color_map, mode='percentage'):
+    """ 部門別の時系列推移グラフの表を作り、描画のジョブを返す """
     print(f"--- {title_prefix} ({mode}) 作成開始 ---")
-    counts = df.groupby([time_col, 'department', 'display_name']
-                        ).size().reset_index(name='count')
+    counts = cube_counts(cube, [time_col, 'department', 'display_name'])
 
     if mode == 'percentage':
-        total_counts = counts.groupby([time_col, 'department'])[
-            'count'].sum().reset_index(name='total_count')
-        merged_df = pd.merge(counts, total_counts, on=[time_col, 'department'])
-        merged_df['percentage'] = 100 * \
-            merged_df['count'] / merged_df['total_count']
+        merged_df = counts
+        total_counts = counts.groupby([time_col, 'department'])['count'].transform('sum')
+        merged_df['percentage'] = 100 * merged_df['count'] / total_counts
         value_col, y_label = 'percentage', '滞在割合 (%)'
     else:
         merged_df = counts
@@ -82,10 +219,18 @@ def plot_trends_stacked_bar_graph(df, time_col, title_prefix, output_filename, s
     pivot_df = pivot_df[existing_sorted]
     colors = [color_map[col] for col in pivot_df.columns]
 
-    departments = pivot_df.index.get_level_values('department').unique()
-    if len(departments) == 0:
-        return
+    if len(pivot_df.index.get_level_values('department').unique()) == 0:
+        return None
+
+    output_path = os.path.join(OUTPUT_FOLDER, output_filename)
+    return render_farm.render_job(output_path, draw_trends_stacked_bar_graph,
+                                  pivot_df, colors, time_col, title_prefix, y_label, mode, output_path)
 
+
+def draw_trends_stacked_bar_graph(pivot_df, colors, time_col, title_prefix, y_label, mode, output_path):
+    """ 部門別の時系列推移グラフを描画する (部門ごとに1段) """
+    plt, _ = render_farm.load_plotting()
+    departments = pivot_df.index.get_level_values('department').unique()
     fig, axes = plt.subplots(nrows=len(departments), ncols=1, figsize=(
         16, 6 * len(departments)), sharex=True)
     if len(departments) == 1:
@@ -107,83 +252,89 @@ def plot_trends_stacked_bar_graph(df, time_col, title_prefix, output_filename, s
 
     plt.xticks(rotation=45, ha='right')
     plt.tight_layout(rect=[0, 0, 0.9, 1])
-    plt.savefig(os.path.join(OUTPUT_FOLDER, output_filename), dpi=300)
+    plt.savefig(output_path, dpi=300)
     plt.close(fig)
 
 
-def main():
+def main(plot=True):
+    run_report.step('STEP 1: 読み込み')
     try:
-        df = pd.read_csv(INPUT_CSV_FILE, dtype={'tag_id': str})
+        # 場所・タグ・部門は登録簿のコードを持つカテゴリ型で読み込む (グループ化を整数で行うため)
+        df = dimensions.read_enriched_csv(INPUT_CSV_FILE)
         df['datetime'] = pd.to_datetime(df['datetime'])
     except FileNotFoundError:
-        return
+        print(f"エラー: '{INPUT_CSV_FILE}' が見つかりません。先に解析スクリプトを実行してください。")
+        return False
 
-    # 1. 表示名の生成
-    def format_display_name(row):
-        f = f"{int(float(row['floor']))}" if pd.notnull(row['floor']) else "?"
-        w = f"{int(float(row['west_to_east']))}" if pd.notnull(
-            row['west_to_east']) else "?"
-        return f"{f}-{w}_{row['place_name']}"
-    df['display_name'] = df.apply(format_display_name, axis=1)
-
-    # 2. フロア別カラーマップの自動生成
-    place_info = df[['display_name', 'floor',
-                     'west_to_east']].drop_duplicates()
-    place_info['floor'] = pd.to_numeric(place_info['floor'], errors='coerce')
-    place_info['west_to_east'] = pd.to_numeric(
-        place_info['west_to_east'], errors='coerce')
-    place_info = place_info.sort_values(by=['floor', 'west_to_east'])
+    try:
+        place_table = load_place_table(NODE_NAME_CSV_FILE)
+    except FileNotFoundError:
+        print(f"エラー: '{NODE_NAME_CSV_FILE}' が見つかりません。")
+        return False
+    run_report.set_rows(rows_out=len(df))
 
-    sorted_display_names = place_info['display_name'].unique().tolist()
+    # 1. 表示名の生成 (ノードごとに1回だけ作り、コードで全行に展開する)
+    run_report.step('STEP 2: 表示名の生成', rows_in=len(df))
+    df = attach_display_name(df, place_table)
 
-    # フロアごとの色相セット
-    cmaps = ['Blues', 'Oranges', 'Greens', 'Reds',
-             'Purples', 'Greys', 'YlOrBr', 'PuRd']
-    unique_floors = sorted(place_info['floor'].dropna().unique())
-    floor_to_cmap = {floor: cmaps[i % len(cmaps)]
-                     for i, floor in enumerate(unique_floors)}
+    if TAGS_TO_EXCLUDE:
+        df = df[~df['tag_id'].isin(TAGS_TO_EXCLUDE)]
 
-    color_map = {}
-    for floor in unique_floors:
-        floor_data = place_info[place_info['floor'] == floor]
-        n_items = len(floor_data)
-        cmap = plt.get_cmap(floor_to_cmap[floor])
-        # 0.3〜0.9の範囲でグラデーション（薄すぎず濃すぎない範囲）
-        colors = [cmap(val) for val in np.linspace(0.4, 0.9, n_items)]
-        for name, color in zip(floor_data['display_name'], colors):
-            color_map[name] = color
+    run_report.set_rows(rows_out=len(df))
 
-    # フロア不明用
-    for name in sorted_display_names:
-        if name not in color_map:
-            color_map[name] = (0.5, 0.5, 0.5, 1.0)
+    # 2. 集計キューブの作成 (以降のグラフはすべてこの表から求める)
+    run_report.step('STEP 3: 集計キューブの作成・保存', rows_in=len(df))
+    cube = build_count_cube(df)
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    save_count_cube(cube)
+    run_report.set_rows(rows_out=len(cube))
+    print(f"集計キューブを保存しました: {CUBE_CSV_FILE} ({len(cube)} 行)")
 
-    if TAGS_TO_EXCLUDE:
-        df = df[~df['tag_id'].isin(TAGS_TO_EXCLUDE)]
+    if not plot:
+        print(f"完了 (グラフは作成していません): {OUTPUT_FOLDER}")
+        return
 
-    # 3. グラフ作成実行
-    args = (df, sorted_display_names, color_map)
-    # 全体
-    plot_overall_stacked_bar_graph(df.copy(
-    ), 'tag_name', '【全体】人物別割合', 'overall_person_percentage.png', *args[1:], mode='percentage')
-    plot_overall_stacked_bar_graph(df.copy(
-    ), 'tag_name', '【全体】人物別時間', 'overall_person_duration.png', *args[1:], mode='duration')
-    plot_overall_stacked_bar_graph(df.copy(
-    ), 'department', '【全体】部門別割合', 'overall_dept_percentage.png', *args[1:], mode='percentage')
-    plot_overall_stacked_bar_graph(df.copy(
-    ), 'department', '【全体】部門別時間', 'overall_dept_duration.png', *args[1:], mode='duration')
-
-    # 時系列
-    df['date'], df['week'], df['month'] = df['datetime'].dt.to_period(
-        'D'), df['datetime'].dt.to_period('W'), df['datetime'].dt.to_period('M')
+    # 3. フロア別カラーマップの自動生成 (ノードの表から作るため、データの行数によらない)
+    run_report.step('STEP 4: グラフの作成', rows_in=len(cube))
+    extra_names = [n for n in df['display_name'].cat.remove_unused_categories().cat.categories
+                   if n not in set(place_table['display_name'])]
+    sorted_display_names, color_map = build_floor_color_map(place_table, extra_names)
+
+    # 4. グラフ用の表を作成し、描画はまとめて複数のプロセスで行う
+    args = (sorted_display_names, color_map)
+    jobs = [
+        # 全体
+        overall_stacked_bar_job(
+            cube, 'tag_name', '【全体】人物別割合', 'overall_person_percentage.png', *args, mode='percentage'),
+        overall_stacked_bar_job(
+            cube, 'tag_name', '【全体】人物別時間', 'overall_person_duration.png', *args, mode='duration'),
+        overall_stacked_bar_job(
+            cube, 'department', '【全体】部門別割合', 'overall_dept_percentage.png', *args, mode='percentage'),
+        overall_stacked_bar_job(
+            cube, 'department', '【全体】部門別時間', 'overall_dept_duration.png', *args, mode='duration'),
+    ]
+
+    # 時系列 (日をそれぞれの期間にまとめる)
+    dates = cube['date']
+    cube['date'], cube['week'], cube['month'] = dates.dt.to_period(
+        'D'), dates.dt.to_period('W'), dates.dt.to_period('M')
     for period, label in zip(['date', 'week', 'month'], ['日別', '週別', '月別']):
-        plot_trends_stacked_bar_graph(df.copy(
-        ), period, f'部門別推移 ({label})', f'trends_{label}_percentage.png', *args[1:], mode='percentage')
-        plot_trends_stacked_bar_graph(df.copy(
-        ), period, f'部門別推移 ({label})', f'trends_{label}_duration.png', *args[1:], mode='duration')
+        jobs.append(trends_stacked_bar_job(
+            cube, period, f'部門別推移 ({label})', f'trends_{label}_percentage.png', *args, mode='percentage'))
+        jobs.append(trends_stacked_bar_job(
+            cube, period, f'部門別推移 ({label})', f'trends_{label}_duration.png', *args, mode='duration'))
+
+    rendered, skipped = render_farm.render_all(jobs)
+    print(f"グラフ: {rendered} 枚を描画、{skipped} 枚は変更がないため省略しました。")
 
     print(f"完了: {OUTPUT_FOLDER}")
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='在席トレンド (部門別・人物別) の集計とグラフ作成')
+    parser.add_argument('--no-plot', action='store_true',
+                        help='グラフを作成せず、集計キューブ (CSV) だけを出力する')
+    args = parser.parse_args()
+    with run_report.run('totalling'):
+        if main(plot=not args.no_plot) is False:
+            sys.exit(1)